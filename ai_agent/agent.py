@@ -1,13 +1,70 @@
-from typing import Dict
+import asyncio
+import os
+from typing import Dict, List
 
-from .retriever import retrieve_logs
-from .grader import grade_logs
-from .llm import generate_diagnosis_with_llm
-from .verifier import verify_answer
+from .retriever import retrieve_log_stats, retrieve_logs
+from .grader import grade_log_stats, grade_logs
+from .llm import agenerate_diagnosis_with_llm, generate_diagnosis_with_llm
+from .verifier import grounding_index, verify_answer
 
 
 MAX_RETRIES = 3
- 
+
+# >1: send this many generations at once and keep the first grounded
+# one, instead of up to MAX_RETRIES in a row
+AGENT_PARALLEL_CANDIDATES = int(os.getenv("AGENT_PARALLEL_CANDIDATES", "1"))
+AGENT_CANDIDATE_TEMPERATURE = float(os.getenv("AGENT_CANDIDATE_TEMPERATURE", "0.7"))
+
+
+def _confidence(attempt: int) -> float:
+    confidence = 0.7 + 0.1 * (MAX_RETRIES - 1 - attempt)
+    return round(min(max(confidence, 0.0), 1.0), 2)
+
+
+async def _first_grounded(project_id: str, service: str, logs: List[Dict], candidates: int) -> Dict:
+    """
+    Candidate 0 is the usual greedy (cached) generation; the others
+    sample with their own seed. Each is verified as it arrives; the
+    first grounded one wins and the rest are cancelled. Confidence
+    is scored by candidate index, like attempts in the sequential loop.
+    """
+    async def generate(i: int):
+        if i == 0:
+            return i, await agenerate_diagnosis_with_llm(service, logs, project_id)
+        sampling = {"temperature": AGENT_CANDIDATE_TEMPERATURE, "seed": i}
+        return i, await agenerate_diagnosis_with_llm(service, logs, project_id, use_cache=False, sampling=sampling)
+
+    index = grounding_index(logs)
+    tasks = [asyncio.ensure_future(generate(i)) for i in range(candidates)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                i, diagnosis = await next_done
+            except Exception:
+                continue
+            if verify_answer(diagnosis, logs, index):
+                return {
+                    "status": "success",
+                    "project_id": project_id,
+                    "service": service,
+                    "diagnosis": diagnosis,
+                    "attempt": i + 1,
+                    "candidates": candidates,
+                    "confidence": _confidence(i),
+                    "grounding": index.ground(diagnosis),
+                }
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return {
+        "status": "failed",
+        "project_id": project_id,
+        "service": service,
+        "reason": "Could not verify any diagnosis against logs",
+        "confidence": 0.2,
+    }
+
 
 def run_agent(project_id: str, project_secret: str, service: str) -> Dict:
     
@@ -15,12 +72,30 @@ def run_agent(project_id: str, project_secret: str, service: str) -> Dict:
     Main entry point for RADAR-AI diagnosis.
 
     Flow:
+    - Reject early if ingest-time stats already fail grading.
     - Retrieve logs for the project + service.
     - Grade logs for sufficiency and quality.
-    - Call LLM to generate a diagnosis, with limited retries.
+    - Call LLM to generate a diagnosis, with limited retries
+      (or AGENT_PARALLEL_CANDIDATES concurrent candidates).
     - Verify that the diagnosis is grounded in the logs.
     - Fail safely if verification never passes.
+
+    Not wired into the gateway: its routes diagnose per incident
+    (api_gateway/incidents.py). This is the service-level entry point
+    for scripts and other callers. It is synchronous and starts its
+    own event loop for parallel candidates, so call it from a thread,
+    never from a running loop.
     """
+    # Ingest-time stats reject hopeless requests before any log fetch
+    if not grade_log_stats(retrieve_log_stats(project_id, service)):
+        return {
+            "status": "failed",
+            "project_id": project_id,
+            "service": service,
+            "reason": "Not enough useful logs to safely diagnose",
+            "confidence": 0.0,
+        }
+
     logs = retrieve_logs(project_id, project_secret, service)
     print("RADAR DEBUG count:", len(logs))
     print("RADAR DEBUG messages:", [l.get("message") for l in logs])
@@ -33,12 +108,16 @@ def run_agent(project_id: str, project_secret: str, service: str) -> Dict:
             "confidence": 0.0,
         }
 
+    if AGENT_PARALLEL_CANDIDATES > 1:
+        return asyncio.run(_first_grounded(project_id, service, logs, AGENT_PARALLEL_CANDIDATES))
+
+    index = grounding_index(logs)
     for attempt in range(MAX_RETRIES):
-        diagnosis = generate_diagnosis_with_llm(service, logs)
+        # A retry must reach the model, not the cached rejected answer
+        diagnosis = generate_diagnosis_with_llm(service, logs, use_cache=attempt == 0)
 
-        if verify_answer(diagnosis, logs):
-            confidence = 0.7 + 0.1 * (MAX_RETRIES - 1 - attempt)
-            confidence = round(min(max(confidence, 0.0), 1.0), 2)
+        if verify_answer(diagnosis, logs, index):
+            confidence = _confidence(attempt)
 
             return {
                 "status": "success",
@@ -47,6 +126,7 @@ def run_agent(project_id: str, project_secret: str, service: str) -> Dict:
                 "diagnosis": diagnosis,
                 "attempt": attempt + 1,
                 "confidence": confidence,
+                "grounding": index.ground(diagnosis),
             }
 
     return {
@@ -1,5 +1,237 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
 import requests
 
+# Keep in sync with api_gateway.uploads defaults
+CHUNKED_UPLOAD_THRESHOLD = int(os.getenv("CHUNKED_UPLOAD_THRESHOLD", str(128 * 1024)))
+
+REQUEST_TIMEOUT = 10
+
+
+# ============================================================
+# 🌐 GATEWAY HTTP CLIENT (WATCHER SIDE)
+# ============================================================
+
+class GatewayClient:
+    """
+    HTTP transport from the local watcher to the RADAR gateway.
+    Also the fallback when the WebSocket channel is unavailable.
+    """
+
+    def __init__(self, api_url: str, project_id: str, project_secret: str):
+        self.api_url = api_url.rstrip("/")
+        self.project_id = project_id
+        self.project_secret = project_secret
+        self.session = requests.Session()
+
+    def _auth(self) -> Dict:
+        return {"project_id": self.project_id, "project_secret": self.project_secret}
+
+    def _auth_headers(self) -> Dict:
+        return {
+            "X-Project-Id": self.project_id,
+            "X-Project-Secret": self.project_secret,
+        }
+
+    def push_structure(self, payload: Dict) -> Dict:
+        r = self.session.post(
+            f"{self.api_url}/agent/structure",
+            json={**self._auth(), **payload},
+            timeout=REQUEST_TIMEOUT,
+        )
+        r.raise_for_status()
+        return r.json()
+
+    def poll(self) -> Optional[Dict]:
+        r = self.session.get(
+            f"{self.api_url}/agent/poll",
+            params=self._auth(),
+            timeout=REQUEST_TIMEOUT,
+        )
+        r.raise_for_status()
+        data = r.json()
+        if not data.get("file"):
+            return None
+        return {"path": data["file"], "request_id": data.get("request_id")}
+
+    def send_file(self, path: str, content: str, request_id: Optional[str] = None) -> Dict:
+        raw = content.encode("utf-8")
+        if len(raw) > CHUNKED_UPLOAD_THRESHOLD:
+            return self._send_file_chunked(path, raw)
+
+        body = gzip.compress(json.dumps({
+            **self._auth(),
+            "path": path,
+            "content": content,
+            "request_id": request_id,
+        }).encode("utf-8"))
+
+        r = self.session.post(
+            f"{self.api_url}/agent/file-content",
+            data=body,
+            headers={
+                **self._auth_headers(),
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip",
+            },
+            timeout=REQUEST_TIMEOUT,
+        )
+        r.raise_for_status()
+        return r.json()
+
+    def _send_file_chunked(self, path: str, raw: bytes) -> Dict:
+        r = self.session.post(
+            f"{self.api_url}/agent/file-content/chunks",
+            json={
+                **self._auth(),
+                "path": path,
+                "size": len(raw),
+                "sha256": hashlib.sha256(raw).hexdigest(),
+            },
+            timeout=REQUEST_TIMEOUT,
+        )
+        r.raise_for_status()
+        upload = r.json()
+        upload_id = upload["upload_id"]
+        chunk_size = upload["chunk_size"]
+        offset = upload["received"]
+
+        result: Dict = {}
+        while offset < len(raw):
+            chunk = raw[offset:offset + chunk_size]
+            try:
+                r = self.session.put(
+                    f"{self.api_url}/agent/file-content/chunks/{upload_id}",
+                    params={"offset": offset},
+                    data=gzip.compress(chunk),
+                    headers={**self._auth_headers(), "Content-Encoding": "gzip"},
+                    timeout=REQUEST_TIMEOUT,
+                )
+            except requests.RequestException:
+                offset = self._upload_offset(upload_id)  # resume
+                continue
+
+            if r.status_code == 409:
+                offset = self._upload_offset(upload_id)
+                continue
+
+            r.raise_for_status()
+            result = r.json()
+            offset = result["received"]
+
+        return result
+
+    def _upload_offset(self, upload_id: str) -> int:
+        r = self.session.get(
+            f"{self.api_url}/agent/file-content/chunks/{upload_id}",
+            params=self._auth(),
+            timeout=REQUEST_TIMEOUT,
+        )
+        r.raise_for_status()
+        return r.json()["received"]
+
+    def ingest_logs(self, logs: List[Dict]) -> Dict:
+        r = self.session.post(
+            f"{self.api_url}/logs/ingest/batch",
+            json={**self._auth(), "logs": logs},
+            timeout=REQUEST_TIMEOUT,
+        )
+        r.raise_for_status()
+        return r.json()
+
+
+# ============================================================
+# 🔌 GATEWAY WEBSOCKET CLIENT (PREFERRED)
+# ============================================================
+
+class GatewaySocket:
+    """
+    Watcher end of /agent/ws. Replies are matched to requests by id;
+    gateway-initiated file requests go to `on_file_request`.
+    Requires the `websockets` package.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        project_id: str,
+        project_secret: str,
+        on_file_request: Callable[[str, Optional[str]], None],
+    ):
+        ws_url = api_url.rstrip("/").replace("https://", "wss://").replace("http://", "ws://")
+        self.url = f"{ws_url}/agent/ws"
+        # in headers, not the URL: URLs end up in access logs
+        self.headers = {"X-Project-Id": project_id, "X-Project-Secret": project_secret}
+        self.on_file_request = on_file_request
+        self._conn = None
+        self._counter = 0
+        self._waiters: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.closed = threading.Event()
+
+    def connect(self) -> None:
+        from websockets.sync.client import connect
+
+        self._conn = connect(self.url, additional_headers=self.headers, max_size=None)
+        self.closed.clear()
+        threading.Thread(target=self._receive_loop, daemon=True).start()
+
+    def _next_id(self) -> str:
+        with self._lock:
+            self._counter += 1
+            return f"w{self._counter}"
+
+    def send(self, message: Dict) -> None:
+        self._conn.send(json.dumps(message))
+
+    def request(self, message: Dict, timeout: float = REQUEST_TIMEOUT) -> Dict:
+        message_id = self._next_id()
+        waiter = [threading.Event(), None]
+        self._waiters[message_id] = waiter
+
+        try:
+            self.send({**message, "id": message_id})
+            if not waiter[0].wait(timeout):
+                raise TimeoutError(f"No reply to {message.get('type')}")
+            return waiter[1]
+        finally:
+            self._waiters.pop(message_id, None)
+
+    def _receive_loop(self) -> None:
+        try:
+            for raw in self._conn:
+                message = json.loads(raw)
+                if message.get("type") == "file_request":
+                    threading.Thread(
+                        target=self.on_file_request,
+                        args=(message.get("path"), message.get("id")),
+                        daemon=True,
+                    ).start()
+                    continue
+
+                waiter = self._waiters.get(message.get("id"))
+                if waiter is not None:
+                    waiter[1] = message
+                    waiter[0].set()
+        except Exception:
+            pass
+        finally:
+            self.closed.set()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+
+
+# ============================================================
+# 🔹 ORIGINAL — DIRECT AGENT HTTP HELPERS
+# ============================================================
+
 def list_files(agent_url: str):
     r = requests.get(f"{agent_url}/files", timeout=5)
     r.raise_for_status()
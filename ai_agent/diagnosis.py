@@ -1,6 +1,15 @@
-from typing import Dict, List
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
+from .prompt_builder import group_logs
+from .traceback_parser import extract_frames, extract_log_frames
 
+
+# ============================================================
+# 🟢 ORIGINAL FUNCTION — DO NOT REMOVE
+# ============================================================
 def diagnose_incident(incident: Dict, logs: List[Dict]) -> str:
     """
     Deterministic incident diagnosis.
@@ -42,3 +51,162 @@ def diagnose_incident(incident: Dict, logs: List[Dict]) -> str:
         f"Recent occurrences include: "
         + " | ".join(messages)
     )
+
+
+# ============================================================
+# ⚡ DETERMINISTIC TIER (TIERED DIAGNOSIS)
+# ============================================================
+#
+# summarize_incident() is the fast tier in front of the LLM: recurring
+# templates, the innermost application frame, the exception and the
+# rate trend, in a few milliseconds. It names a root cause only when
+# the logs make it explicit: an exception whose own traceback gives
+# an application frame (the raise site; frames cached at ingest from
+# a log's file/line do not count), in a window one template dominates.
+# Otherwise `confident` is False and the caller asks the LLM.
+#
+# DIAGNOSIS_CONFIDENT_SCORE is tuned on recorded incidents with
+# `python -m ai_agent.diagnosis_eval --mongo N --resolved`.
+
+CONFIDENT_SCORE = float(os.getenv("DIAGNOSIS_CONFIDENT_SCORE", "0.8"))
+DOMINANT_SHARE = 0.6
+
+# evidence -> weight (sums to 1.0)
+_EVIDENCE_WEIGHTS = {
+    "exception": 0.3,
+    "traceback": 0.3,
+    "dominant_template": 0.2,
+    "exception_dominates": 0.2,
+}
+
+# KeyError: 'amount'  |  TypeError: x is undefined  |  java.lang.NullPointerException: ...
+_EXCEPTION_LINE = re.compile(
+    r"^\s*(?:Uncaught\s+)?(?P<type>[A-Za-z_$][\w.$]*(?:Error|Exception|Exit|Interrupt|Fault))\b:?\s*(?P<detail>.*)$",
+    re.M,
+)
+
+
+def _timestamp(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _exception(logs: List[Dict]) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """
+    Newest exception, and the innermost application frame of the
+    traceback in the same message (None if it has none).
+    """
+    # newest first; the last exception line of a trace is the raised one
+    for log in logs:
+        message = str(log.get("message", ""))
+        matches = list(_EXCEPTION_LINE.finditer(message))
+        if matches:
+            m = matches[-1]
+            frames = extract_frames(message)
+            exception = {"type": m.group("type"), "detail": m.group("detail").strip()[:200]}
+            return exception, frames[0] if frames else None
+    return None, None
+
+
+def is_confident(summary: Dict, threshold: Optional[float] = None) -> bool:
+    """
+    Whether a summary may answer without the LLM: its root cause is
+    nameable (exception + raise site) and it scores at least
+    `threshold` (default DIAGNOSIS_CONFIDENT_SCORE).
+    """
+    if threshold is None:
+        threshold = CONFIDENT_SCORE
+    evidence = summary["evidence"]
+    return "exception" in evidence and "traceback" in evidence and summary["confidence"] >= threshold
+
+
+def rate_trend(logs: List[Dict]) -> Optional[Dict]:
+    """
+    Events per minute over the window, and whether the newer half of
+    the window is busier than the older half.
+    """
+    times = sorted(t for t in (_timestamp(l.get("timestamp")) for l in logs) if t)
+    if len(times) < 4:
+        return None
+
+    span = (times[-1] - times[0]).total_seconds()
+    if span <= 0:
+        return {"per_minute": None, "trend": "burst"}
+
+    middle = times[0].timestamp() + span / 2
+    newer = sum(1 for t in times if t.timestamp() >= middle)
+    older = len(times) - newer
+    if newer >= 1.5 * max(older, 1):
+        trend = "rising"
+    elif older >= 1.5 * max(newer, 1):
+        trend = "falling"
+    else:
+        trend = "steady"
+    return {"per_minute": round(len(times) / (span / 60), 2), "trend": trend}
+
+
+def summarize_incident(incident: Dict, logs: List[Dict]) -> Dict:
+    """
+    {root_cause, confidence, confident, evidence, exception, frame,
+    templates, trend, text}. No LLM, no I/O.
+    """
+    groups = group_logs(logs)
+    exception, raise_site = _exception(logs)
+    frame = raise_site
+    if frame is None:
+        frames = incident.get("frames") or extract_log_frames(logs)
+        frame = frames[0] if frames else None
+
+    evidence = []
+    if exception:
+        evidence.append("exception")
+    if raise_site:
+        evidence.append("traceback")
+    if groups and groups[0]["count"] / len(logs) >= DOMINANT_SHARE:
+        evidence.append("dominant_template")
+        if exception and exception["type"] in groups[0]["message"]:
+            evidence.append("exception_dominates")
+
+    confidence = round(sum(_EVIDENCE_WEIGHTS[e] for e in evidence), 2)
+    confident = is_confident({"confidence": confidence, "evidence": evidence})
+
+    root_cause = None
+    if confident:
+        root_cause = f"{exception['type']}: {exception['detail']}".rstrip(": ")
+        where = f"{frame['path']}:{frame['line']}" if frame.get("line") else frame["path"]
+        func = f" in {frame['function']}" if frame.get("function") else ""
+        root_cause += f"{func} ({where})"
+
+    templates = [
+        {"template": g["template"], "level": g["level"], "count": g["count"], "first": g["first"], "last": g["last"]}
+        for g in groups[:3]
+    ]
+    trend = rate_trend(logs)
+
+    lines = []
+    if root_cause:
+        lines.append(f"Root cause: {root_cause}.")
+    elif not logs:
+        lines.append(f"Incident '{incident.get('message')}' has no logs available for diagnosis.")
+    else:
+        lines.append(f"Incident '{incident.get('message')}': no explicit root cause in the logs.")
+    for t in templates:
+        lines.append(f"- [{t['level']}] x{t['count']}: {t['template'][:200]}")
+    if trend and trend["per_minute"] is not None:
+        lines.append(f"Rate: {trend['per_minute']}/min, {trend['trend']}.")
+
+    return {
+        "root_cause": root_cause,
+        "confidence": confidence,
+        "confident": confident,
+        "evidence": evidence,
+        "exception": exception,
+        "frame": {k: frame.get(k) for k in ("path", "line", "function")} if frame else None,
+        "templates": templates,
+        "trend": trend,
+        "text": "\n".join(lines),
+    }
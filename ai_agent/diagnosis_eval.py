@@ -0,0 +1,137 @@
+# ============================================================
+# 🎯 TIERED DIAGNOSIS EVALUATION
+# ============================================================
+#
+# How many diagnoses the deterministic tier answers on its own
+# (LLM calls avoided), how often those answers are right, and how
+# fast it is — per confidence threshold, to tune
+# DIAGNOSIS_CONFIDENT_SCORE.
+#
+#     python -m ai_agent.diagnosis_eval --mongo 500 --resolved   # recorded incidents
+#     python -m ai_agent.diagnosis_eval --corpus incidents.jsonl
+#     python -m ai_agent.diagnosis_eval                          # synthetic corpus
+#
+# Corpus: see eval_corpus.py. A confident answer is right when its
+# frame is the file the user confirmed fixed the incident
+# (`resolved_by`); incidents without one are not labelled. --llm
+# also runs the LLM on the confident incidents and reports how often
+# its answer names the same exception type. The synthetic corpus
+# only exercises the incident shapes; tune on recorded incidents.
+
+import argparse
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from .diagnosis import CONFIDENT_SCORE, is_confident, summarize_incident
+from .eval_corpus import add_corpus_args, load_corpus
+
+
+def _measure(record: Dict) -> Dict:
+    start = time.perf_counter()
+    summary = summarize_incident(record["incident"], record["logs"])
+    return {"summary": summary, "ms": (time.perf_counter() - start) * 1000}
+
+
+def _same_file(a: str, b: str) -> bool:
+    a, b = a.replace("\\", "/").strip("/"), b.replace("\\", "/").strip("/")
+    return a == b or a.endswith("/" + b) or b.endswith("/" + a)
+
+
+def is_correct(record: Dict, summary: Dict) -> Optional[bool]:
+    """
+    Whether the summary's frame is the confirmed fix file (None if
+    the incident has no confirmed resolution).
+    """
+    resolved_by = record["incident"].get("resolved_by")
+    if not resolved_by:
+        return None
+    frame = summary.get("frame")
+    return bool(frame) and _same_file(frame["path"], resolved_by)
+
+
+def sweep(corpus: List[Dict], summaries: List[Dict]) -> List[Dict]:
+    """
+    {threshold, answered, labelled, precision} for every confidence
+    value the corpus produced.
+    """
+    rows = []
+    for threshold in sorted({s["confidence"] for s in summaries if is_confident(s, 0)}):
+        answered = [
+            (record, summary)
+            for record, summary in zip(corpus, summaries)
+            if is_confident(summary, threshold)
+        ]
+        labels = [is_correct(record, summary) for record, summary in answered]
+        labels = [label for label in labels if label is not None]
+        rows.append({
+            "threshold": threshold,
+            "answered": len(answered),
+            "labelled": len(labels),
+            "precision": sum(labels) / len(labels) if labels else None,
+        })
+    return rows
+
+
+def recommend(rows: List[Dict], target: float, min_labelled: int) -> Optional[float]:
+    """
+    Lowest threshold whose labelled answers (at least `min_labelled`)
+    reach `target` precision.
+    """
+    for row in rows:
+        if row["labelled"] >= min_labelled and row["precision"] >= target:
+            return row["threshold"]
+    return None
+
+
+def _llm_agrees(record: Dict, summary: Dict) -> bool:
+    from .llm import generate_incident_diagnosis
+
+    answer = generate_incident_diagnosis(record["incident"], record["logs"], use_cache=False)
+    return summary["exception"]["type"].lower() in answer.lower()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    add_corpus_args(parser)
+    parser.add_argument("--llm", action="store_true")
+    parser.add_argument("--precision", type=float, default=0.95)
+    parser.add_argument("--min-labelled", type=int, default=30)
+    args = parser.parse_args()
+    corpus = load_corpus(args)
+    if not corpus:
+        print("incidents: 0")
+        return
+
+    results = [_measure(r) for r in corpus]
+    summaries = [r["summary"] for r in results]
+    ms = sorted(r["ms"] for r in results)
+
+    print(f"incidents: {len(results)} ({'synthetic' if not (args.corpus or args.mongo) else 'recorded'})")
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+    print(f"deterministic latency: median {statistics.median(ms):.2f} ms, p99 {p99:.2f} ms")
+
+    rows = sweep(corpus, summaries)
+    print("threshold  llm calls avoided  labelled  precision")
+    for row in rows:
+        precision = f"{row['precision']:.1%}" if row["precision"] is not None else "n/a"
+        marker = "  <- current" if row["threshold"] == CONFIDENT_SCORE else ""
+        print(
+            f"{row['threshold']:>9.2f}  {row['answered'] / len(results):>17.1%}  "
+            f"{row['labelled']:>8}  {precision:>9}{marker}"
+        )
+    best = recommend(rows, args.precision, args.min_labelled)
+    print(
+        f"DIAGNOSIS_CONFIDENT_SCORE for {args.precision:.0%} precision: {best}"
+        if best is not None else
+        f"no threshold reaches {args.precision:.0%} precision on {args.min_labelled}+ labelled incidents"
+    )
+
+    confident = [(record, s) for record, s in zip(corpus, summaries) if s["confident"]]
+    if args.llm and confident:
+        agree = sum(_llm_agrees(record, summary) for record, summary in confident)
+        print(f"llm agrees on exception type: {agree}/{len(confident)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# ============================================================
+# 🧪 EVALUATION CORPUS (SHARED BY THE BENCHMARKS)
+# ============================================================
+#
+# Incident records for prompt_bench and diagnosis_eval:
+#
+#     {"incident": {...}, "logs": [...], "path": str, "content": str}
+#
+# (path/content optional). Sources: a synthetic mix (default), a
+# jsonl file (--corpus), or the newest incidents in Mongo (--mongo N,
+# --resolved for user-confirmed resolutions only, --save to snapshot
+# them). A resolved incident's `resolved_by` is the file the user
+# confirmed fixed it, the label diagnosis_eval checks against.
+
+import argparse
+import json
+import os
+import random
+from typing import Dict, List
+
+
+def _traceback(path: str, line: int) -> str:
+    return (
+        "Traceback (most recent call last):\n"
+        f'  File "{path}", line {line}, in charge_order\n'
+        "    total = order['amount'] * rate\n"
+        "KeyError: 'amount'"
+    )
+
+
+def synthetic_corpus(n: int = 20) -> List[Dict]:
+    """
+    A mix of incident shapes, cycling every four:
+    0/1 an exception traceback plus a flood of one symptom message,
+    2   timeouts only (no exception, no frame),
+    3   many unrelated errors around a rare traceback.
+    Each carries a 1200-helper file with the failing function.
+    """
+    rng = random.Random(7)
+    corpus = []
+    for i in range(n):
+        body = [f"# helper {k}\ndef helper_{k}(x):\n    return x + {k}\n" for k in range(1200)]
+        body.insert(130, "def charge_order(order, rate):\n    total = order['amount'] * rate\n    return total\n")
+        content = "\n".join(body)
+        line = content.splitlines().index("    total = order['amount'] * rate") + 1
+        trace = _traceback(f"/app/services/orders_{i}.py", line)
+        kind = i % 4
+
+        logs = []
+        for j in range(50):
+            ts = f"2024-05-01T10:{j // 60:02d}:{j % 60:02d}"
+            if kind in (0, 1):
+                message = trace if j % 10 == 0 else (
+                    f"payment failed for order {rng.randint(1000, 99999)} "
+                    f"(request {rng.getrandbits(64):016x}) after {rng.randint(1, 900)}ms"
+                )
+            elif kind == 2:
+                message = f"upstream billing timed out after {rng.randint(1000, 5000)}ms (attempt {j % 3 + 1})"
+            else:
+                message = trace if j == 25 else rng.choice([
+                    f"cache miss storm on shard {rng.randint(1, 9)}",
+                    f"connection reset by peer {rng.getrandbits(32):08x}",
+                    f"queue lag {rng.randint(10, 900)}s on consumer group orders",
+                    "user session expired",
+                ])
+            logs.append({"level": "ERROR", "timestamp": ts, "message": message})
+
+        corpus.append({
+            "incident": {
+                "_id": f"inc{i}",
+                "message": "payment failed for order",
+                "service": "orders",
+                "resolved_by": f"services/orders_{i}.py",
+            },
+            "logs": logs,
+            "path": f"services/orders_{i}.py",
+            "content": content,
+        })
+    return corpus
+
+
+def mongo_corpus(limit: int, resolved: bool = False) -> List[Dict]:
+    from pymongo import DESCENDING, MongoClient
+
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"))[os.getenv("MONGO_DB", "radar_ai")]
+    query = {"status": "RESOLVED", "resolution_type": "user_confirmed"} if resolved else {}
+    corpus = []
+    for incident in db.incidents.find(query).sort("last_seen", DESCENDING).limit(limit):
+        logs = list(
+            db.logs.find({"incident_id": incident["_id"]}, {"_id": 0})
+            .sort("timestamp", DESCENDING)
+            .limit(50)
+        )
+        corpus.append({"incident": incident, "logs": logs})
+    return corpus
+
+
+def add_corpus_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--corpus")
+    parser.add_argument("--mongo", type=int, default=0)
+    parser.add_argument("--resolved", action="store_true")
+    parser.add_argument("--save")
+
+
+def load_corpus(args: argparse.Namespace) -> List[Dict]:
+    if args.corpus:
+        with open(args.corpus) as f:
+            corpus = [json.loads(line) for line in f if line.strip()]
+    elif args.mongo:
+        corpus = mongo_corpus(args.mongo, args.resolved)
+    else:
+        corpus = synthetic_corpus()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            for record in corpus:
+                f.write(json.dumps(record, default=str) + "\n")
+    return corpus
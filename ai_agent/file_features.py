@@ -0,0 +1,242 @@
+import heapq
+import os
+import threading
+from array import array
+from typing import Dict, List, Optional
+
+from .file_priority import IMPORTANT_DIR_KEYWORDS, IMPORTANT_EXTENSIONS
+from .path_index import PathIndex
+from .token_index import PathTokenIndex, log_tokens
+
+SMALL_FILE_BYTES = 20_000
+
+FILENAME_MATCH_SCORE = 50
+DIR_KEYWORD_SCORE = 10
+SERVICE_MATCH_SCORE = 15
+CODE_EXTENSION_SCORE = 10
+SMALL_FILE_SCORE = 5
+
+# Rebuild from scratch once this share of ids are removed files
+MAX_TOMBSTONE_RATIO = 0.25
+
+
+# ============================================================
+# 📊 COLUMNAR FILE FEATURES (ONE PER STRUCTURE VERSION)
+# ============================================================
+
+class FileFeatureIndex:
+    """
+    Query-independent ranking features, precomputed once per
+    structure and stored column-wise (file id = position):
+
+    - keyword_hits: IMPORTANT_DIR_KEYWORDS found in the path
+    - code_ext:     1 if the extension is an IMPORTANT_EXTENSION
+    - small:        1 if 0 < size < SMALL_FILE_BYTES
+    - base_score:   the static part of score_file*, summed
+    - alive:        0 for files removed by a structure delta
+    - tokens:       inverted index of path tokens -> file ids
+
+    Ranking then only adds the query-dependent parts (path tokens
+    mentioned in logs, service hint) and takes a heap top-K.
+    Structure deltas are applied in place (ids are append-only).
+
+    apply_delta() runs from PathIndex.advance() while requests rank,
+    so both take `_lock` (ranking stays ~1 ms, so holding it is cheap).
+    """
+
+    def __init__(self, files: List[Dict]):
+        self.files: List[Dict] = []
+        self.paths: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+        self.keyword_hits = array("B")
+        self.code_ext = array("B")
+        self.small = array("B")
+        self.base_score = array("H")
+        self.alive = array("B")
+        self.tokens = PathTokenIndex()
+
+        self._service_ids: Dict[str, List[int]] = {}
+        self._static_order: Optional[List[int]] = None
+        self._removed = 0
+        self._lock = threading.RLock()
+
+        for f in files:
+            self._append(f)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ---------- building ----------
+
+    @staticmethod
+    def _small(file: Dict) -> int:
+        size = file.get("size", 0)
+        return 1 if size and size < SMALL_FILE_BYTES else 0
+
+    def _append(self, file: Dict) -> None:
+        i = len(self.files)
+        path = file["path"].lower()
+
+        hits = 0
+        for key in IMPORTANT_DIR_KEYWORDS:
+            if key in path:
+                hits += 1
+
+        _, ext = os.path.splitext(path)
+        code = 1 if ext in IMPORTANT_EXTENSIONS else 0
+        small = self._small(file)
+
+        self.files.append(file)
+        self.paths.append(path)
+        self.ids[file["path"]] = i
+        self.keyword_hits.append(hits)
+        self.code_ext.append(code)
+        self.small.append(small)
+        self.base_score.append(
+            hits * DIR_KEYWORD_SCORE
+            + code * CODE_EXTENSION_SCORE
+            + small * SMALL_FILE_SCORE
+        )
+        self.alive.append(1)
+        self.tokens.add(i, path)
+
+    def apply_delta(self, added: List[Dict], modified: List[Dict], removed: List[str]) -> bool:
+        """
+        Patch the columns for a structure delta. Returns False when
+        enough files were removed that a rebuild is cheaper to query.
+        """
+        with self._lock:
+            return self._apply_delta(added, modified, removed)
+
+    def _apply_delta(self, added: List[Dict], modified: List[Dict], removed: List[str]) -> bool:
+        for path in removed:
+            i = self.ids.pop(path, None)
+            if i is None:
+                continue
+            self.alive[i] = 0
+            self.base_score[i] = 0
+            self.tokens.discard()
+            self._removed += 1
+
+        for f in added:
+            if f.get("path") in self.ids:
+                modified = [*modified, f]
+            elif f.get("path"):
+                self._append(f)
+
+        for f in modified:
+            i = self.ids.get(f.get("path"))
+            if i is None:
+                continue
+            merged = {**self.files[i], **f}
+            small = self._small(merged)
+            self.base_score[i] += (small - self.small[i]) * SMALL_FILE_SCORE
+            self.small[i] = small
+            self.files[i] = merged
+
+        self._service_ids.clear()
+        self._static_order = None
+        return self._removed <= len(self.files) * MAX_TOMBSTONE_RATIO
+
+    # ---------- query-dependent parts ----------
+
+    def service_ids(self, service: str) -> List[int]:
+        """
+        Files whose path contains the service name (memoized; services
+        per project are few).
+        """
+        service = service.lower()
+        with self._lock:
+            ids = self._service_ids.get(service)
+            if ids is None:
+                alive = self.alive
+                ids = [i for i, path in enumerate(self.paths) if alive[i] and service in path]
+                self._service_ids[service] = ids
+            return ids
+
+    def boosts(self, logs: List[Dict], service: Optional[str]) -> Dict[int, int]:
+        """
+        file id -> query-dependent score. Log messages are tokenized
+        once and looked up in the token index; a path token unique to
+        one file is worth the full filename score, common ones (index,
+        utils) much less.
+        """
+        boosts: Dict[int, int] = {}
+
+        tokens = log_tokens(log.get("message", "") for log in logs)
+        with self._lock:
+            for i, relevance in self.tokens.match(tokens, self.alive).items():
+                boosts[i] = round(FILENAME_MATCH_SCORE * relevance)
+
+            if service is not None:
+                for i in self.service_ids(service):
+                    boosts[i] = boosts.get(i, 0) + SERVICE_MATCH_SCORE
+
+        return boosts
+
+    # ---------- ranking ----------
+
+    def static_order(self) -> List[int]:
+        """
+        Live ids by base score desc (ties in structure order).
+        """
+        with self._lock:
+            if self._static_order is None:
+                base = self.base_score
+                self._static_order = sorted(
+                    (i for i in range(len(self.files)) if self.alive[i] and base[i] > 0),
+                    key=lambda i: -base[i],
+                )
+            return self._static_order
+
+    def rank(
+        self,
+        logs: List[Dict],
+        service: Optional[str],
+        max_files: int,
+        extra: Optional[Dict[str, int]] = None,
+    ) -> List[Dict]:
+        """
+        Top files by base + boost (+ caller `extra`, path -> score, e.g.
+        stack-frame matches). Only boosted ids and the first `max_files`
+        unboosted ids in static order can make the cut, so cost follows
+        the matches, not the repository size.
+        """
+        with self._lock:
+            return self._rank(logs, service, max_files, extra or {})
+
+    def _rank(self, logs: List[Dict], service: Optional[str], max_files: int, extra: Dict[str, int]) -> List[Dict]:
+        base = self.base_score
+        candidates = {
+            i: base[i] + b for i, b in self.boosts(logs, service).items()
+        }
+        for path, b in extra.items():
+            i = self.ids.get(path)
+            if i is not None:
+                candidates[i] = candidates.get(i, base[i]) + b
+
+        taken = 0
+        for i in self.static_order():
+            if taken >= max_files:
+                break
+            if i not in candidates:
+                candidates[i] = base[i]
+                taken += 1
+
+        best = heapq.nlargest(
+            max_files,
+            (i for i, s in candidates.items() if s > 0),
+            key=lambda i: (candidates[i], -i),
+        )
+        return [
+            {**{k: v for k, v in self.files[i].items() if k != "symbols"}, "score": candidates[i]}
+            for i in best
+        ]
+
+
+def get_feature_index(path_index: PathIndex) -> FileFeatureIndex:
+    return path_index.derived(
+        "file_features",
+        lambda index: FileFeatureIndex(index.files()),
+    )
@@ -1,6 +1,10 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, TYPE_CHECKING
 import os
 
+if TYPE_CHECKING:
+    from .file_features import FileFeatureIndex
+    from .symbols import SymbolIndex
+
 IMPORTANT_DIR_KEYWORDS = [
     "service",
     "services",
@@ -15,6 +19,14 @@ IMPORTANT_DIR_KEYWORDS = [
 
 IMPORTANT_EXTENSIONS = {".py", ".js", ".ts", ".tsx"}
 
+# Files named by a stack frame outrank every heuristic signal;
+# deeper (outer) frames and ambiguous suffix matches count for less.
+FRAME_MATCH_SCORE = 200
+FRAME_DEPTH_PENALTY = 10
+
+# A function/class named in the logs and defined in exactly one file
+SYMBOL_MATCH_SCORE = 40
+
 
 # ============================================================
 # 🔹 ORIGINAL — SERVICE-BASED SCORING (UNCHANGED)
@@ -59,10 +71,16 @@ def rank_files(
     logs: List[Dict],
     service: str,
     max_files: int = 5,
+    features: Optional["FileFeatureIndex"] = None,
 ) -> List[Dict]:
     """
     Legacy ranking — service scoped.
+    With a precomputed FileFeatureIndex, scores come from its columns
+    and token index instead of per-file string work.
     """
+    if features is not None:
+        return features.rank(logs, service, max_files)
+
     error_text = " ".join(log.get("message", "") for log in logs)
 
     scored = []
@@ -123,19 +141,82 @@ def rank_files_for_incident(
     logs: List[Dict],
     incident: Dict,
     max_files: int = 5,
+    features: Optional["FileFeatureIndex"] = None,
+    frames: Optional[List[Dict]] = None,
+    symbols: Optional["SymbolIndex"] = None,
+    feedback: Optional[Dict[str, int]] = None,
 ) -> List[Dict]:
     """
     Incident-scoped file ranking.
     This should be used by:
     - /incidents/files/priority
+
+    `frames` are stack frames already resolved to structure paths
+    (traceback_parser.resolve_frames); their files rank first and
+    carry the frame line/function. `symbols` adds files defining
+    functions/classes the logs mention. `feedback` is a path -> score
+    adjustment from past resolutions (may be negative).
     """
-    error_text = " ".join(log.get("message", "") for log in logs)
+    boosts = frame_scores(frames or [])
+    if symbols is not None:
+        for path, s in symbol_scores(symbols, logs, frames or []).items():
+            boosts[path] = boosts.get(path, 0) + s
+    for path, s in (feedback or {}).items():
+        boosts[path] = boosts.get(path, 0) + s
+
+    if features is not None:
+        service = incident.get("service") or None
+        ranked = features.rank(logs, service, max_files, extra=boosts)
+    else:
+        error_text = " ".join(log.get("message", "") for log in logs)
+
+        scored = []
+        for f in files:
+            s = score_file_for_incident(f, error_text, incident) + boosts.get(f["path"], 0)
+            if s > 0:
+                scored.append({**f, "score": s})
+
+        scored.sort(key=lambda x: x["score"], reverse=True)
+        ranked = scored[:max_files]
+
+    if frames:
+        innermost: Dict[str, Dict] = {}
+        for frame in frames:
+            innermost.setdefault(frame["path"], frame)
+        for f in ranked:
+            frame = innermost.get(f["path"])
+            if frame is not None:
+                f["frame"] = {"line": frame.get("line"), "function": frame.get("function")}
+
+    return ranked
+
+
+def frame_scores(frames: List[Dict]) -> Dict[str, int]:
+    """
+    path -> frame boost. The innermost frame gets the full score.
+    """
+    scores: Dict[str, int] = {}
+    for frame in frames:
+        s = max(
+            FRAME_MATCH_SCORE - FRAME_DEPTH_PENALTY * frame.get("depth", 0),
+            FRAME_MATCH_SCORE // 2,
+        ) // max(frame.get("candidates", 1), 1)
+        if s > scores.get(frame["path"], 0):
+            scores[frame["path"]] = s
+    return scores
+
+
+def symbol_scores(symbols: "SymbolIndex", logs: List[Dict], frames: List[Dict]) -> Dict[str, int]:
+    """
+    path -> symbol boost, from identifiers in log messages and the
+    function names of stack frames.
+    """
+    from .symbols import message_identifiers
 
-    scored = []
-    for f in files:
-        s = score_file_for_incident(f, error_text, incident)
-        if s > 0:
-            scored.append({**f, "score": s})
+    names = message_identifiers(log.get("message", "") for log in logs)
+    names.update(f["function"] for f in frames if f.get("function"))
 
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    return scored[:max_files]
+    return {
+        path: round(SYMBOL_MATCH_SCORE * relevance)
+        for path, relevance in symbols.match(names).items()
+    }
@@ -0,0 +1,66 @@
+import os
+
+# ============================================================
+# 🔒 WHICH FILES RADAR MAY SEE
+# ============================================================
+#
+# Shared by the gateway (local mode) and the watcher on the user's
+# machine, so this module imports nothing beyond the stdlib.
+
+DENY_DIR_NAMES = {
+    ".git",
+    ".idea",
+    ".vscode",
+    "node_modules",
+    "__pycache__",
+    "venv",
+    ".venv",
+}
+
+DENY_FILE_NAMES = {
+    ".env",
+    ".env.local",
+    "secrets.json",
+    "secrets.yaml",
+    "id_rsa",
+    "id_rsa.pub",
+}
+
+DENY_FILE_EXTENSIONS = {
+    ".pem",
+    ".key",
+    ".crt",
+    ".p12",
+    ".pfx",
+}
+
+ALLOW_FILE_EXTENSIONS = {
+    ".py",
+    ".js",
+    ".ts",
+    ".tsx",
+    ".jsx",
+    ".json",
+    ".yml",
+    ".yaml",
+    ".toml",
+    ".ini",
+    ".md",
+}
+
+
+def _is_sensitive_file(abs_path: str) -> bool:
+    name = os.path.basename(abs_path)
+    _, ext = os.path.splitext(name)
+
+    return (
+        name in DENY_FILE_NAMES
+        or ext.lower() in DENY_FILE_EXTENSIONS
+    )
+
+
+def _is_allowed_file(abs_path: str) -> bool:
+    if _is_sensitive_file(abs_path):
+        return False
+    _, ext = os.path.splitext(abs_path)
+    return ext.lower() in ALLOW_FILE_EXTENSIONS
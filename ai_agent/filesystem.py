@@ -1,13 +1,27 @@
 import os
+import time
 import requests
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
 
+from .file_features import FileFeatureIndex, get_feature_index
+from .file_rules import (  # re-exported: older imports went through this module
+    ALLOW_FILE_EXTENSIONS,
+    DENY_DIR_NAMES,
+    DENY_FILE_EXTENSIONS,
+    DENY_FILE_NAMES,
+    _is_allowed_file,
+    _is_sensitive_file,
+)
+from .path_index import PathIndex, cached_path_index, get_path_index
 from api_gateway.agent_state import (
-    FILE_STRUCTURE_CACHE,
-    FILE_REQUEST_CACHE,
-    FILE_CONTENT_CACHE,
+    STRUCTURE,
+    FILE_CONTENT,
+    get_state_store,
+    record_file_request,
 )
+from api_gateway.agent_channel import request_file_via_channel
+from api_gateway.structure_sync import get_structure_version
 
 load_dotenv()
 
@@ -17,46 +31,6 @@ load_dotenv()
 
 PROJECT_ROOT = os.path.realpath(os.getenv("PROJECT_ROOT", "").strip() or ".")
 
-DENY_DIR_NAMES = {
-    ".git",
-    ".idea",
-    ".vscode",
-    "node_modules",
-    "__pycache__",
-    "venv",
-    ".venv",
-}
-
-DENY_FILE_NAMES = {
-    ".env",
-    ".env.local",
-    "secrets.json",
-    "secrets.yaml",
-    "id_rsa",
-    "id_rsa.pub",
-}
-
-DENY_FILE_EXTENSIONS = {
-    ".pem",
-    ".key",
-    ".crt",
-    ".p12",
-    ".pfx",
-}
-
-ALLOW_FILE_EXTENSIONS = {
-    ".py",
-    ".js",
-    ".ts",
-    ".tsx",
-    ".jsx",
-    ".json",
-    ".yml",
-    ".yaml",
-    ".toml",
-    ".ini",
-    ".md",
-}
 
 # ============================================================
 # 🔒 INTERNAL HELPERS (LOCAL MODE)
@@ -68,23 +42,6 @@ def _is_path_under_root(abs_path: str) -> bool:
     return os.path.commonpath([root, abs_path]) == root
 
 
-def _is_sensitive_file(abs_path: str) -> bool:
-    name = os.path.basename(abs_path)
-    _, ext = os.path.splitext(name)
-
-    return (
-        name in DENY_FILE_NAMES
-        or ext.lower() in DENY_FILE_EXTENSIONS
-    )
-
-
-def _is_allowed_file(abs_path: str) -> bool:
-    if _is_sensitive_file(abs_path):
-        return False
-    _, ext = os.path.splitext(abs_path)
-    return ext.lower() in ALLOW_FILE_EXTENSIONS
-
-
 # ============================================================
 # 🌐 FILE AGENT HELPERS (PRODUCTION MODE)
 # ============================================================
@@ -105,20 +62,52 @@ def _agent_headers(project: dict) -> Dict:
 # ============================================================
 
 def list_project_files(
-    max_files: int = 200,
+    max_files: Optional[int] = 200,
     project: Optional[dict] = None,
 ) -> List[Dict]:
+    """
+    Files from the watcher's structure push.
+    max_files=None returns the whole repository.
+    """
     if not project:
         return []
 
     project_id = str(project["_id"])
 
-    entry = FILE_STRUCTURE_CACHE.get(project_id)
+    entry = get_state_store().get(STRUCTURE, project_id)
     if not entry:
         return []
 
-    files = entry.get("files", [])
+    # path -> entry (see api_gateway.structure_sync)
+    files = list(entry.get("files", {}).values())
     return files[:max_files]
+
+
+def get_project_path_index(project: Optional[dict]) -> Optional[PathIndex]:
+    """
+    Path index for the project's current structure version.
+    Built once per version and shared by all lookups; the structure
+    itself is only fetched when this worker's copy is behind.
+    """
+    if not project:
+        return None
+
+    project_id = str(project["_id"])
+    index = cached_path_index(project_id, get_structure_version(project_id))
+    if index is not None:
+        return index
+    return get_path_index(project_id, get_state_store().get(STRUCTURE, project_id))
+
+
+def get_project_feature_index(project: Optional[dict]) -> Optional[FileFeatureIndex]:
+    """
+    Columnar ranking features for the current structure version.
+    """
+    path_index = get_project_path_index(project)
+    if path_index is None:
+        return None
+    return get_feature_index(path_index)
+
 # ============================================================
 # 📄 READ PROJECT FILE CONTENT
 # ============================================================
@@ -132,16 +121,21 @@ def read_project_file(
 
     project_id = str(project["_id"])
 
-    # 1️⃣ REQUEST FILE FROM WATCHER
-    FILE_REQUEST_CACHE[project_id] = {
-        "path": relative_path,
-        "status": "WAITING",
-    }
+    # 1️⃣ WATCHER WEBSOCKET IN THIS WORKER (ONE HOP)
+    handled, content = request_file_via_channel(project_id, relative_path)
+    if handled and content is not None:
+        return content
+
+    # 2️⃣ REQUEST FILE FROM WATCHER (HTTP POLL FALLBACK)
+    store = get_state_store()
+    req = record_file_request(project_id, relative_path)
 
-    # 2️⃣ WAIT FOR WATCHER RESPONSE (POLL MEMORY)
+    # 3️⃣ WAIT FOR WATCHER RESPONSE (POLL STATE STORE)
     for _ in range(30):  # ~3 seconds
-        entry = FILE_CONTENT_CACHE.get(project_id)
+        entry = store.get(FILE_CONTENT, project_id)
         if entry and entry.get("path") == relative_path:
-            return entry.get("content")
+            if entry.get("request_id") in (None, req["request_id"]):
+                return entry.get("content")
+        time.sleep(0.1)
 
-    return None
\ No newline at end of file
+    return None
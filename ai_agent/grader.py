@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 MIN_LOGS = 5
 
@@ -30,3 +30,25 @@ def grade_logs(logs: List[Dict]) -> bool:
             return False
 
     return True
+
+
+def grade_log_stats(stats: Optional[Dict]) -> bool:
+    """
+    O(1) pre-check from ingest-time stats (log_stats.stats_summary),
+    before any logs are fetched. All-time stats can only be richer
+    than a recent window, so False means grade_logs would fail too;
+    True still needs grade_logs on the fetched window. Missing stats
+    (older data) pass, and so do identical-message checks the stats
+    can't answer exactly.
+    """
+    if stats is None:
+        return True
+
+    if stats["total"] < MIN_LOGS or stats["errors"] == 0:
+        return False
+
+    distinct = stats["distinct_messages"]
+    if stats["total"] >= 20 and distinct is not None and distinct <= 1:
+        return False
+
+    return True
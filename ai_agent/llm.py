@@ -1,39 +1,386 @@
+import asyncio
+import concurrent.futures
 import os
-from typing import List, Dict, Tuple
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
+
+from . import metrics, single_flight
+from .llm_cache import cache_key, get_llm_cache
+from .llm_providers import LLM_PARAMS, get_llm, provider_identity
+from .patching import PatchError, apply_patch, parse_patch
+from .prompt_builder import apply_window_edits, focus_lines, format_logs_compact, window_file
+from .single_flight import LLM_SINGLE_FLIGHT_SHARED, Flight, FlightAbandoned
+from .llm_limits import (
+    LLM_CALL_DEADLINE_SECONDS,
+    LLM_MAX_RETRIES,
+    LLMDeadlineExceeded,
+    backoff_delay,
+    estimate_tokens,
+    get_project_bucket,
+    get_semaphore,
+    is_rate_limited,
+)
 
 load_dotenv()
 
-_llm = ChatGroq(
-    model="llama-3.1-8b-instant",
-    temperature=0,
-    api_key=os.getenv("GROQ_API_KEY"),
-)
+# "patch": the model returns search/replace hunks (whole-file answer
+# as fallback when they do not apply); "file": the whole updated file
+LLM_FIX_MODE = os.getenv("LLM_FIX_MODE", "patch")
 
+# Patch answers that do not apply are sent back with the failing hunk
+# this many times before falling back to the UPDATED_FILE prompt
+# (windowed for large files)
+LLM_PATCH_REPAIRS = int(os.getenv("LLM_PATCH_REPAIRS", "1"))
 
 # ============================================================
-# 🔹 SHARED UTILITY (ORIGINAL)
+# 🔹 CACHE LOOKUP
 # ============================================================
-def _format_logs_for_prompt(logs: List[Dict]) -> str:
-    lines = []
-    for l in logs:
-        level = l.get("level", "UNKNOWN")
-        ts = l.get("timestamp", "")
-        msg = l.get("message", "")
-        lines.append(f"[{level}] {ts} - {msg}")
-    return "\n".join(lines)
+def _cache_target(prompt: str, use_cache: bool, sampling: Optional[Dict]):
+    """
+    (cache, key, read). Cache is None when disabled; the key (also
+    the single-flight key) is always set.
+    """
+    key = cache_key(provider_identity(), {**LLM_PARAMS, **(sampling or {})}, prompt)
+    cache = get_llm_cache()
+    if cache is not None and not use_cache:
+        metrics.incr("llm_cache.bypass")
+    return cache, key, cache is not None and use_cache
+
+
+def _cache_lookup(prompt: str, use_cache: bool, sampling: Optional[Dict] = None):
+    """
+    (cache, key, cached text).
+    """
+    cache, key, read = _cache_target(prompt, use_cache, sampling)
+    return cache, key, cache.get(key) if read else None
+
+
+async def _acache_lookup(prompt: str, use_cache: bool, sampling: Optional[Dict] = None):
+    """
+    _cache_lookup for async paths: the disk tier runs in a thread.
+    """
+    cache, key, read = _cache_target(prompt, use_cache, sampling)
+    return cache, key, await cache.aget(key) if read else None
 
 
 # ============================================================
-# 🔹 ORIGINAL — SERVICE-BASED DIAGNOSIS (UNCHANGED)
+# ✈️ SINGLE-FLIGHT (see single_flight.py)
 # ============================================================
-def generate_diagnosis_with_llm(service: str, logs: List[Dict]) -> str:
+#
+# Identical calls in flight at the same time make one provider call:
+# the leader's answer goes to every follower (llm.coalesced). With
+# LLM_SINGLE_FLIGHT_SHARED, leaders in different workers also claim
+# the key in the agent state store and wait for the holder's
+# published answer (llm.coalesced_shared). A bypass (use_cache=False)
+# caller still joins a local flight, which is a fresh call too, but
+# not a claim, whose answer it could only tell from a stale one by age.
+# Every wait ends at the call's deadline.
+
+# A claim outlives any call that respects the deadline
+_CLAIM_TTL_SECONDS = LLM_CALL_DEADLINE_SECONDS
+
+
+def _shared(cache, use_cache: bool) -> bool:
+    return LLM_SINGLE_FLIGHT_SHARED and cache is not None and use_cache
+
+
+def _follow(key: str, ends_at: float) -> Tuple[Optional[Flight], Optional[str]]:
     """
-    LLM generates diagnosis ONLY from provided logs.
+    (flight, None) when this caller leads, (None, answer) when it
+    waited for the call already in flight.
+    """
+    while True:
+        flight, leader = single_flight.join(key)
+        if leader:
+            return flight, None
+        try:
+            return None, flight.wait(ends_at - time.monotonic())
+        except FlightAbandoned:
+            continue
+
+
+async def _afollow(key: str, ends_at: float) -> Tuple[Optional[Flight], Optional[str]]:
+    while True:
+        flight, leader = single_flight.join(key)
+        if leader:
+            return flight, None
+        try:
+            return None, await flight.await_result(ends_at - time.monotonic())
+        except FlightAbandoned:
+            continue
+
+
+def _land_error(key: str, flight: Flight, exc: BaseException) -> None:
+    # the leader's own cancellation/deadline is not the followers' answer
+    abandoned = isinstance(exc, (asyncio.CancelledError, asyncio.TimeoutError, GeneratorExit))
+    single_flight.land(key, flight, error=exc, abandoned=abandoned)
+
+
+# ============================================================
+# 🔹 LLM CALL (CACHED)
+# ============================================================
+def _call(prompt: str) -> str:
+    attempt = 0
+    while True:
+        metrics.incr("llm.calls")
+        try:
+            return get_llm().invoke(prompt).content
+        except Exception as exc:
+            if not is_rate_limited(exc) or attempt >= LLM_MAX_RETRIES:
+                raise
+            metrics.incr("llm.rate_limited")
+            time.sleep(backoff_delay(attempt, exc))
+            attempt += 1
+
+
+def _invoke(prompt: str, use_cache: bool = True) -> str:
+    """
+    Every completion goes through here. Identical prompts (same
+    model + params) are answered from the response cache;
+    use_cache=False forces a fresh call and refreshes the entry.
+    Identical calls already in flight are joined, not repeated, for
+    at most LLM_CALL_DEADLINE seconds. Provider 429s are retried
+    with jittered backoff.
     """
-    log_text = _format_logs_for_prompt(logs)
+    cache, key, cached = _cache_lookup(prompt, use_cache)
+    if cached is not None:
+        return cached
+
+    ends_at = time.monotonic() + LLM_CALL_DEADLINE_SECONDS
+    shared = _shared(cache, use_cache)
+
+    try:
+        flight, text = _follow(key, ends_at)
+        if flight is None:
+            return text
+
+        try:
+            text = single_flight.claim_or_wait(key, _CLAIM_TTL_SECONDS, ends_at) if shared else None
+            if text is not None:
+                cache.set(key, text)
+            else:
+                answer = None
+                try:
+                    text = answer = _call(prompt)
+                    if cache is not None:
+                        cache.set(key, text)
+                finally:
+                    if shared:
+                        single_flight.release(key, answer)
+        except BaseException as exc:
+            _land_error(key, flight, exc)
+            raise
+    except concurrent.futures.TimeoutError:
+        metrics.incr("llm.deadline_exceeded")
+        raise LLMDeadlineExceeded(f"LLM call exceeded {LLM_CALL_DEADLINE_SECONDS:.0f}s")
+
+    single_flight.land(key, flight, text)
+    return text
+
+
+async def _wait_for_budget(project_id: Optional[str], prompt: str, ends_at: float) -> None:
+    """
+    Take the prompt's tokens from the project bucket, sleeping if it
+    is overdrawn. Raises asyncio.TimeoutError when the wait would
+    run past the deadline.
+    """
+    bucket = get_project_bucket(project_id)
+    if bucket is None:
+        return
+
+    cost = estimate_tokens(prompt)
+    wait = bucket.reserve(cost)
+    if wait > 0:
+        metrics.incr("llm.throttled")
+        if wait >= ends_at - time.monotonic():
+            bucket.refund(cost)
+            raise asyncio.TimeoutError()
+        await asyncio.sleep(wait)
+
+
+async def _acall(prompt: str, project_id: Optional[str], ends_at: float, sampling: Optional[Dict]) -> str:
+    def remaining() -> float:
+        left = ends_at - time.monotonic()
+        if left <= 0:
+            raise asyncio.TimeoutError()
+        return left
+
+    semaphore = get_semaphore()
+    attempt = 0
+
+    await _wait_for_budget(project_id, prompt, ends_at)
+
+    while True:
+        await asyncio.wait_for(semaphore.acquire(), timeout=remaining())
+        try:
+            metrics.incr("llm.calls")
+            response = await asyncio.wait_for(get_llm().ainvoke(prompt, **(sampling or {})), timeout=remaining())
+            return response.content
+        except asyncio.TimeoutError:
+            raise
+        except Exception as exc:
+            if not is_rate_limited(exc) or attempt >= LLM_MAX_RETRIES:
+                raise
+            metrics.incr("llm.rate_limited")
+            delay = backoff_delay(attempt, exc)
+            if delay >= ends_at - time.monotonic():
+                raise
+        finally:
+            semaphore.release()
+
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def _ainvoke(
+    prompt: str,
+    project_id: Optional[str] = None,
+    use_cache: bool = True,
+    deadline: float = LLM_CALL_DEADLINE_SECONDS,
+    sampling: Optional[Dict] = None,
+) -> str:
+    """
+    Non-blocking _invoke for async endpoints. Calls share a global
+    concurrency limit and a per-project token budget, 429s are
+    retried with jittered backoff, and the whole call (queueing and
+    waiting on an identical call in flight included) must finish
+    within `deadline` seconds. `sampling` overrides model params
+    (temperature, seed) for this call.
+    """
+    cache, key, cached = await _acache_lookup(prompt, use_cache, sampling)
+    if cached is not None:
+        return cached
+
+    ends_at = time.monotonic() + deadline
+    shared = _shared(cache, use_cache)
+
+    try:
+        flight, text = await _afollow(key, ends_at)
+        if flight is None:
+            return text
+
+        try:
+            text = await single_flight.aclaim_or_wait(key, _CLAIM_TTL_SECONDS, ends_at) if shared else None
+            if text is not None:
+                await cache.aset(key, text)
+            else:
+                answer = None
+                try:
+                    text = answer = await _acall(prompt, project_id, ends_at, sampling)
+                    if cache is not None:
+                        await cache.aset(key, text)
+                finally:
+                    if shared:
+                        await asyncio.to_thread(single_flight.release, key, answer)
+        except BaseException as exc:
+            _land_error(key, flight, exc)
+            raise
+    except asyncio.TimeoutError:
+        metrics.incr("llm.deadline_exceeded")
+        raise LLMDeadlineExceeded(f"LLM call exceeded {deadline:.0f}s")
+
+    single_flight.land(key, flight, text)
+    return text
+
+
+async def _astream(
+    prompt: str,
+    project_id: Optional[str] = None,
+    use_cache: bool = True,
+    deadline: float = LLM_CALL_DEADLINE_SECONDS,
+) -> AsyncIterator[str]:
+    """
+    _ainvoke, but yields text deltas as the provider generates them.
+    Same limits; 429s are only retried before the first token. A
+    cached answer, or one from an identical call in flight, is
+    yielded in one piece.
+    """
+    cache, key, cached = await _acache_lookup(prompt, use_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    ends_at = time.monotonic() + deadline
+
+    def remaining() -> float:
+        left = ends_at - time.monotonic()
+        if left <= 0:
+            raise asyncio.TimeoutError()
+        return left
+
+    semaphore = get_semaphore()
+    shared = _shared(cache, use_cache)
+    parts: List[str] = []
+    attempt = 0
+
+    try:
+        flight, text = await _afollow(key, ends_at)
+        if flight is None:
+            yield text
+            return
+
+        try:
+            text = await single_flight.aclaim_or_wait(key, _CLAIM_TTL_SECONDS, ends_at) if shared else None
+            answer = None
+            if text is not None:
+                await cache.aset(key, text)
+                yield text
+            else:
+                try:
+                    await _wait_for_budget(project_id, prompt, ends_at)
+
+                    while True:
+                        await asyncio.wait_for(semaphore.acquire(), timeout=remaining())
+                        try:
+                            metrics.incr("llm.calls")
+                            chunks = get_llm().astream(prompt).__aiter__()
+                            while True:
+                                try:
+                                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=remaining())
+                                except StopAsyncIteration:
+                                    break
+                                if chunk.content:
+                                    parts.append(chunk.content)
+                                    yield chunk.content
+                            break
+                        except asyncio.TimeoutError:
+                            raise
+                        except Exception as exc:
+                            if parts or not is_rate_limited(exc) or attempt >= LLM_MAX_RETRIES:
+                                raise
+                            metrics.incr("llm.rate_limited")
+                            delay = backoff_delay(attempt, exc)
+                            if delay >= ends_at - time.monotonic():
+                                raise
+                        finally:
+                            semaphore.release()
+
+                        await asyncio.sleep(delay)
+                        attempt += 1
+
+                    text = answer = "".join(parts)
+                    if cache is not None:
+                        await cache.aset(key, text)
+                finally:
+                    if shared:
+                        await asyncio.to_thread(single_flight.release, key, answer)
+        except BaseException as exc:
+            _land_error(key, flight, exc)
+            raise
+    except asyncio.TimeoutError:
+        metrics.incr("llm.deadline_exceeded")
+        raise LLMDeadlineExceeded(f"LLM call exceeded {deadline:.0f}s")
+
+    single_flight.land(key, flight, text)
+
+
+# ============================================================
+# 🔹 SERVICE-BASED DIAGNOSIS
+# ============================================================
+def _service_diagnosis_prompt(service: str, logs: List[Dict]) -> str:
+    log_text = format_logs_compact(logs)
 
     prompt = f"""
 You are a senior backend engineer helping diagnose production incidents.
@@ -57,18 +404,35 @@ Task:
 
 Answer in 1–3 short sentences.
 """
+    return prompt
 
-    response = _llm.invoke(prompt)
-    return response.content.strip()
+
+def generate_diagnosis_with_llm(service: str, logs: List[Dict], use_cache: bool = True) -> str:
+    """
+    LLM generates diagnosis ONLY from provided logs.
+    """
+    return _invoke(_service_diagnosis_prompt(service, logs), use_cache).strip()
+
+
+async def agenerate_diagnosis_with_llm(
+    service: str,
+    logs: List[Dict],
+    project_id: Optional[str] = None,
+    use_cache: bool = True,
+    sampling: Optional[Dict] = None,
+) -> str:
+    prompt = _service_diagnosis_prompt(service, logs)
+    return (await _ainvoke(prompt, project_id, use_cache, sampling=sampling)).strip()
 
 
 # ============================================================
-# 🔹 ORIGINAL — FILE SUGGESTION (UNCHANGED)
+# 🔹 FILE SUGGESTION
 # ============================================================
 def suggest_related_files(
     service: str,
     logs: List[Dict],
-    files: List[Dict]
+    files: List[Dict],
+    use_cache: bool = True,
 ) -> List[Dict]:
     """
     Use the LLM to suggest a small list of likely-related files
@@ -77,7 +441,7 @@ def suggest_related_files(
     if not logs or not files:
         return []
 
-    log_text = _format_logs_for_prompt(logs)
+    log_text = format_logs_compact(logs)
     file_list_text = "\n".join(f"- {f['path']}" for f in files)
 
     prompt = f"""
@@ -100,8 +464,7 @@ Rules:
 Return ONLY valid JSON.
 """
 
-    response = _llm.invoke(prompt)
-    text = response.content.strip()
+    text = _invoke(prompt, use_cache).strip()
 
     try:
         import json
@@ -124,19 +487,20 @@ Return ONLY valid JSON.
 
 
 # ============================================================
-# 🔹 ORIGINAL — FILE FIX (UNCHANGED)
+# 🔹 FILE FIX
 # ============================================================
 def suggest_fix_for_file(
     service: str,
     logs: List[Dict],
     path: str,
     content: str,
+    use_cache: bool = True,
 ) -> Tuple[str, str]:
     """
     Use the LLM to propose a fixed version of the file,
     using ONLY the given logs + file content.
     """
-    log_text = _format_logs_for_prompt(logs)
+    log_text = format_logs_compact(logs)
 
     prompt = f"""
 You are a senior backend engineer.
@@ -163,8 +527,7 @@ UPDATED_FILE:
 ...
 """
 
-    response = _llm.invoke(prompt)
-    text = response.content.strip()
+    text = _invoke(prompt, use_cache).strip()
 
     explanation = ""
     fixed_code = content
@@ -185,17 +548,10 @@ UPDATED_FILE:
 
 
 # ============================================================
-# 🆕 NEW — INCIDENT-BASED DIAGNOSIS (ADDITIVE)
+# 🔹 INCIDENT-BASED DIAGNOSIS
 # ============================================================
-def generate_incident_diagnosis(
-    incident: Dict,
-    logs: List[Dict],
-) -> str:
-    """
-    Incident-scoped diagnosis.
-    Uses incident metadata instead of service.
-    """
-    log_text = _format_logs_for_prompt(logs)
+def _incident_diagnosis_prompt(incident: Dict, logs: List[Dict]) -> str:
+    log_text = format_logs_compact(logs)
 
     prompt = f"""
 You are diagnosing a SINGLE INCIDENT.
@@ -213,26 +569,50 @@ Logs:
 Task:
 State the most likely root cause OR say logs are insufficient.
 """
+    return prompt
+
+
+def generate_incident_diagnosis(
+    incident: Dict,
+    logs: List[Dict],
+    use_cache: bool = True,
+) -> str:
+    """
+    Incident-scoped diagnosis.
+    Uses incident metadata instead of service.
+    """
+    return _invoke(_incident_diagnosis_prompt(incident, logs), use_cache).strip()
+
 
-    response = _llm.invoke(prompt)
-    return response.content.strip()
+async def agenerate_incident_diagnosis(
+    incident: Dict,
+    logs: List[Dict],
+    use_cache: bool = True,
+) -> str:
+    prompt = _incident_diagnosis_prompt(incident, logs)
+    project_id = str(incident["project_id"]) if incident.get("project_id") else None
+    return (await _ainvoke(prompt, project_id, use_cache)).strip()
 
 
 # ============================================================
-# 🆕 NEW — INCIDENT-BASED FILE FIX (ADDITIVE)
+# 🔹 INCIDENT-BASED FILE FIX
 # ============================================================
-def suggest_fix_for_incident_file(
+def _incident_fix_prompt(
     incident: Dict,
     logs: List[Dict],
     path: str,
     content: str,
-) -> Tuple[str, str]:
+) -> Tuple[str, Optional[List[Tuple[int, int]]]]:
     """
-    Incident-scoped fix suggestion.
+    (prompt, windows). Large files are cut to windows around the
+    incident's traceback lines and symbols; the model then answers
+    per window and _finish_fix splices the edits back.
     """
-    log_text = _format_logs_for_prompt(logs)
+    log_text = format_logs_compact(logs)
+    shown, windows = window_file(content, focus_lines(incident, logs, path, content))
 
-    prompt = f"""
+    if windows is None:
+        prompt = f"""
 You are fixing code for a SINGLE INCIDENT.
 
 Incident ID: {incident.get("_id")}
@@ -256,23 +636,351 @@ EXPLANATION:
 UPDATED_FILE:
 ...
 """
+        return prompt, None
 
-    response = _llm.invoke(prompt)
-    text = response.content.strip()
+    prompt = f"""
+You are fixing code for a SINGLE INCIDENT.
 
-    explanation = ""
-    fixed_code = content
+Incident ID: {incident.get("_id")}
+Incident message: {incident.get("message")}
+File path: {path}
 
-    if "UPDATED_FILE:" in text:
-        parts = text.split("UPDATED_FILE:", 1)
-        explanation_part = parts[0]
-        file_part = parts[1]
+Logs:
+{log_text}
 
-        if "EXPLANATION:" in explanation_part:
-            explanation = explanation_part.split("EXPLANATION:", 1)[1].strip()
-        else:
-            explanation = explanation_part.strip()
+File excerpts (the file is larger; each excerpt starts with its line range):
+{shown}
 
-        fixed_code = file_part.strip()
+Rules:
+- Use ONLY the logs + these excerpts.
+- Do NOT reference other files.
+- Under UPDATED_FILE, repeat the "@@ lines A-B @@" header of each excerpt
+  you change, followed by the complete updated text of that excerpt.
+
+Format:
+EXPLANATION:
+...
+
+UPDATED_FILE:
+...
+"""
+    return prompt, windows
+
+
+def _split_response(text: str, marker: str, section: str) -> Tuple[Optional[str], str]:
+    """
+    (body after `marker` or None when it is missing, explanation),
+    split exactly as FixResponseStream streams it, so the streamed
+    preview and the final result always agree.
+    """
+    parser = FixResponseStream(marker, section)
+    parts: Dict[str, List[str]] = {"explanation": [], section: []}
+    for name, piece in parser.feed(text) + parser.close():
+        parts[name].append(piece)
+    body = "".join(parts[section]) if parser.section == section else None
+    return body, "".join(parts["explanation"]).strip()
+
+
+def _parse_fix_response(text: str, content: str) -> Tuple[str, str]:
+    """
+    (fixed_code, explanation). Without UPDATED_FILE: the file is
+    unchanged and the whole answer is the explanation.
+    """
+    body, explanation = _split_response(text, "UPDATED_FILE:", "updated_file")
+    if body is None:
+        return content, explanation
+    return body.strip(), explanation
+
+
+def _finish_fix(text: str, content: str, windows: Optional[List[Tuple[int, int]]]) -> Tuple[str, str]:
+    fixed_code, explanation = _parse_fix_response(text, content)
+    if not fixed_code:
+        # empty UPDATED_FILE would read as "delete everything"
+        fixed_code = content
+    if windows is not None and fixed_code is not content:
+        fixed_code = apply_window_edits(content, fixed_code, windows) or content
+    return fixed_code, explanation
+
+
+def _incident_patch_prompt(incident: Dict, logs: List[Dict], path: str, content: str) -> str:
+    """
+    Fix prompt asking for search/replace hunks instead of the whole
+    file. Large files are shown as windows; the hunks are matched
+    against the full file, so no splicing is needed.
+    """
+    log_text = format_logs_compact(logs)
+    shown, windows = window_file(content, focus_lines(incident, logs, path, content))
+    label = "File content:" if windows is None else (
+        "File excerpts (the file is larger; each excerpt starts with its line range):"
+    )
+
+    return f"""
+You are fixing code for a SINGLE INCIDENT.
+
+Incident ID: {incident.get("_id")}
+Incident message: {incident.get("message")}
+File path: {path}
+
+Logs:
+{log_text}
+
+{label}
+{shown}
+
+Rules:
+- Use ONLY the logs + this file.
+- Do NOT reference other files.
+- Under PATCH, give one or more search/replace blocks:
+<<<<<<< SEARCH
+exact lines copied from the file (no "@@" headers)
+=======
+the lines that replace them
+>>>>>>> REPLACE
+- SEARCH text must match the file exactly and only once;
+  include enough surrounding lines to make it unique.
+- Do NOT repeat unchanged parts of the file.
+
+Format:
+EXPLANATION:
+...
+
+PATCH:
+...
+"""
+
+
+def _parse_patch_response(text: str) -> Tuple[str, str]:
+    """
+    (patch text, explanation). Without a PATCH: marker the hunks are
+    looked for in the whole answer.
+    """
+    body, explanation = _split_response(text, "PATCH:", "patch")
+    if body is None:
+        return text, explanation
+    return body, explanation
+
+
+def _patch_repair_prompt(prompt: str, answer: str, error: str) -> str:
+    """
+    The patch prompt again, with the answer that failed and why, so
+    the model only corrects its hunks instead of writing the file.
+    """
+    return f"""{prompt}
+Your previous answer:
+{answer}
+
+It could not be applied: {error}.
+Answer again in the same format with ALL the hunks. Copy SEARCH
+text exactly from the file above, including indentation, and make
+each SEARCH block unique.
+"""
 
+
+def _finish_patch(text: str, content: str) -> Tuple[str, str]:
+    """
+    (fixed_code, explanation). Raises PatchError when the hunks are
+    missing or do not apply cleanly.
+    """
+    patch_text, explanation = _parse_patch_response(text)
+    try:
+        fixed_code = apply_patch(content, parse_patch(patch_text))
+    except PatchError:
+        metrics.incr("fix_patch.rejected")
+        raise
+    metrics.incr("fix_patch.applied")
     return fixed_code, explanation
+
+
+def suggest_fix_for_incident_file(
+    incident: Dict,
+    logs: List[Dict],
+    path: str,
+    content: str,
+    use_cache: bool = True,
+) -> Tuple[str, str]:
+    """
+    Incident-scoped fix suggestion.
+    """
+    if LLM_FIX_MODE == "patch":
+        base = prompt = _incident_patch_prompt(incident, logs, path, content)
+        for _ in range(LLM_PATCH_REPAIRS + 1):
+            text = _invoke(prompt, use_cache).strip()
+            try:
+                return _finish_patch(text, content)
+            except PatchError as e:
+                prompt = _patch_repair_prompt(base, text, str(e))
+
+    prompt, windows = _incident_fix_prompt(incident, logs, path, content)
+    text = _invoke(prompt, use_cache).strip()
+    return _finish_fix(text, content, windows)
+
+
+async def asuggest_fix_for_incident_file(
+    incident: Dict,
+    logs: List[Dict],
+    path: str,
+    content: str,
+    use_cache: bool = True,
+) -> Tuple[str, str]:
+    project_id = str(incident["project_id"]) if incident.get("project_id") else None
+    if LLM_FIX_MODE == "patch":
+        base = prompt = _incident_patch_prompt(incident, logs, path, content)
+        for _ in range(LLM_PATCH_REPAIRS + 1):
+            text = (await _ainvoke(prompt, project_id, use_cache)).strip()
+            try:
+                return _finish_patch(text, content)
+            except PatchError as e:
+                prompt = _patch_repair_prompt(base, text, str(e))
+
+    prompt, windows = _incident_fix_prompt(incident, logs, path, content)
+    text = (await _ainvoke(prompt, project_id, use_cache)).strip()
+    return _finish_fix(text, content, windows)
+
+
+# ============================================================
+# 📡 STREAMING (INCIDENT DIAGNOSIS + FIX)
+# ============================================================
+
+class FixResponseStream:
+    """
+    Incremental EXPLANATION: / UPDATED_FILE: (or PATCH:) splitter.
+    feed() takes raw deltas and returns (section, text) pieces as
+    soon as they cannot be part of a marker, so the explanation
+    reaches the client before the file starts.
+
+    The split does not depend on how the text is chunked, and the
+    non-streaming parsers run it over the full answer (see
+    _split_response): the streamed explanation is the final one, up
+    to surrounding whitespace.
+    - Text before the body marker is explanation.
+    - A leading EXPLANATION: marker (starting within the first
+      _PREAMBLE_HOLD characters) is dropped with anything before
+      it; later ones are plain text.
+    - With no markers at all, everything is explanation.
+    """
+
+    EXPLANATION = "EXPLANATION:"
+
+    # Text before any marker is held back this long in case an
+    # EXPLANATION: marker follows
+    _PREAMBLE_HOLD = 200
+
+    def __init__(self, marker: str = "UPDATED_FILE:", section: str = "updated_file"):
+        self.marker = marker
+        self.body_section = section
+        self.section = "start"
+        self._buffer = ""
+        # a leading EXPLANATION: lies entirely before this offset
+        self._lead_end = self._PREAMBLE_HOLD - 1 + len(self.EXPLANATION)
+
+    def _emit(self, text: str) -> List[Tuple[str, str]]:
+        if not text:
+            return []
+        section = "explanation" if self.section == "start" else self.section
+        return [(section, text)]
+
+    def feed(self, delta: str) -> List[Tuple[str, str]]:
+        self._buffer += delta
+        out: List[Tuple[str, str]] = []
+
+        while True:
+            if self.section == self.body_section:
+                out += self._emit(self._buffer)
+                self._buffer = ""
+                return out
+
+            at = self._buffer.find(self.marker)
+
+            if self.section == "start":
+                # nothing emitted yet: the buffer starts the answer
+                lead = self._buffer.find(self.EXPLANATION, 0, self._lead_end)
+                if lead >= 0 and (at < 0 or lead < at):
+                    self._buffer = self._buffer[lead + len(self.EXPLANATION):].lstrip()
+                    self.section = "explanation"
+                    continue
+                if at < 0 and len(self._buffer) < self._lead_end:
+                    return out
+                self.section = "explanation"
+
+            if at >= 0:
+                out += self._emit(self._buffer[:at])
+                self._buffer = self._buffer[at + len(self.marker):].lstrip()
+                self.section = self.body_section
+                continue
+
+            # keep a tail that could still become a marker
+            keep = len(self.marker) - 1
+            cut = max(len(self._buffer) - keep, 0)
+            out += self._emit(self._buffer[:cut])
+            self._buffer = self._buffer[cut:]
+            return out
+
+    def close(self) -> List[Tuple[str, str]]:
+        out = self._emit(self._buffer)
+        self._buffer = ""
+        return out
+
+
+async def astream_incident_diagnosis(
+    incident: Dict,
+    logs: List[Dict],
+    use_cache: bool = True,
+) -> AsyncIterator[str]:
+    prompt = _incident_diagnosis_prompt(incident, logs)
+    project_id = str(incident["project_id"]) if incident.get("project_id") else None
+    async for delta in _astream(prompt, project_id, use_cache):
+        yield delta
+
+
+async def astream_fix_for_incident_file(
+    incident: Dict,
+    logs: List[Dict],
+    path: str,
+    content: str,
+    use_cache: bool = True,
+) -> AsyncIterator[Tuple[str, object]]:
+    """
+    Yields ("explanation" | "patch" | "updated_file", delta) pieces,
+    then ("done", (fixed_code, explanation)) parsed like the
+    non-streaming call. In patch mode a patch that does not apply is
+    followed by ("retry", reason) and the next answer is streamed
+    from the start: corrected hunks (LLM_PATCH_REPAIRS times), then
+    the UPDATED_FILE answer. For windowed files the updated_file
+    deltas are the edited excerpts; the done result is the whole file.
+    """
+    project_id = str(incident["project_id"]) if incident.get("project_id") else None
+
+    if LLM_FIX_MODE == "patch":
+        base = prompt = _incident_patch_prompt(incident, logs, path, content)
+        for attempt in range(LLM_PATCH_REPAIRS + 1):
+            parser = FixResponseStream("PATCH:", "patch")
+            raw: List[str] = []
+            async for delta in _astream(prompt, project_id, use_cache):
+                raw.append(delta)
+                for piece in parser.feed(delta):
+                    yield piece
+            for piece in parser.close():
+                yield piece
+
+            text = "".join(raw).strip()
+            try:
+                result = _finish_patch(text, content)
+            except PatchError as e:
+                prompt = _patch_repair_prompt(base, text, str(e))
+                next_step = "asking for corrected hunks" if attempt < LLM_PATCH_REPAIRS else "regenerating the file"
+                yield "retry", f"patch did not apply ({e}); {next_step}"
+                continue
+            yield "done", result
+            return
+
+    prompt, windows = _incident_fix_prompt(incident, logs, path, content)
+    parser = FixResponseStream()
+    raw = []
+
+    async for delta in _astream(prompt, project_id, use_cache):
+        raw.append(delta)
+        for piece in parser.feed(delta):
+            yield piece
+    for piece in parser.close():
+        yield piece
+    yield "done", _finish_fix("".join(raw).strip(), content, windows)
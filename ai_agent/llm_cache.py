@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from . import metrics
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "radar_llm_cache.sqlite3"),
+)
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL", str(7 * 86400)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+
+# Responses larger than this are not worth keeping
+MAX_CACHED_RESPONSE_BYTES = 1024 * 1024
+
+# Trim the on-disk tier every this many writes, not on each one
+_TRIM_EVERY = 100
+
+
+# ============================================================
+# 🔑 CACHE KEY
+# ============================================================
+
+def cache_key(model: str, params: Dict, prompt: str) -> str:
+    """
+    sha256 over model, generation parameters and the exact prompt.
+    """
+    raw = json.dumps({"model": model, "params": params, "prompt": prompt}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ============================================================
+# 🗄️ TWO-TIER CACHE (MEMORY LRU + SQLITE)
+# ============================================================
+
+class LLMCache:
+    """
+    Memory LRU in front of a SQLite file shared by every worker on
+    the host. Entries expire after LLM_CACHE_TTL; the file is kept
+    under LLM_CACHE_MAX_ENTRIES by dropping the oldest rows.
+
+    SQLite calls can block (up to the 5 s busy timeout), so async
+    callers use aget/aset, which run the disk tier in a thread. The
+    memory tier has its own lock and is never held across disk I/O.
+    """
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl: int = LLM_CACHE_TTL_SECONDS,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()       # memory tier
+        self._db_lock = threading.Lock()    # sqlite connection
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if self._db is None:
+            try:
+                conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    " key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache (created_at)")
+                conn.commit()
+                self._db = conn
+            except sqlite3.Error:
+                return None  # memory tier only
+        return self._db
+
+    def get(self, key: str) -> Optional[str]:
+        text = self._memory_get(key)
+        if text is not None:
+            return text
+        return self._disk_get(key)
+
+    async def aget(self, key: str) -> Optional[str]:
+        text = self._memory_get(key)
+        if text is not None:
+            return text
+        return await asyncio.to_thread(self._disk_get, key)
+
+    def set(self, key: str, response: str) -> None:
+        if len(response) > MAX_CACHED_RESPONSE_BYTES:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+        self._disk_set(key, response, now)
+
+    async def aset(self, key: str, response: str) -> None:
+        if len(response) > MAX_CACHED_RESPONSE_BYTES:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+        await asyncio.to_thread(self._disk_set, key, response, now)
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None or item[1] + self.ttl <= time.time():
+                return None
+            self._memory.move_to_end(key)
+        metrics.incr("llm_cache.memory_hits")
+        return item[0]
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        now = time.time()
+        row = None
+        with self._db_lock:
+            conn = self._conn()
+            if conn is not None:
+                try:
+                    row = conn.execute(
+                        "SELECT response, created_at FROM llm_cache WHERE key = ? AND created_at > ?",
+                        (key, now - self.ttl),
+                    ).fetchone()
+                except sqlite3.Error:
+                    row = None
+
+        if row is None:
+            metrics.incr("llm_cache.misses")
+            return None
+
+        with self._lock:
+            self._remember(key, row[0], row[1])
+        metrics.incr("llm_cache.disk_hits")
+        return row[0]
+
+    def _disk_set(self, key: str, response: str, now: float) -> None:
+        with self._db_lock:
+            conn = self._conn()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, now),
+                )
+                self._writes += 1
+                if self._writes % _TRIM_EVERY == 0:
+                    self._trim(conn, now)
+                conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def _remember(self, key: str, response: str, created_at: float) -> None:
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _trim(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            " SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
@@ -0,0 +1,180 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_CALL_DEADLINE_SECONDS = float(os.getenv("LLM_CALL_DEADLINE", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+
+# Per-project budget in prompt tokens (estimated at ~4 chars/token)
+LLM_PROJECT_TOKENS_PER_MINUTE = int(os.getenv("LLM_PROJECT_TOKENS_PER_MINUTE", "30000"))
+
+_BACKOFF_BASE_SECONDS = 0.5
+_BACKOFF_MAX_SECONDS = 8.0
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    pass
+
+
+# ============================================================
+# 🪣 PER-PROJECT TOKEN BUCKET
+# ============================================================
+
+class TokenBucket:
+    """
+    Refills at `rate` tokens/second up to `capacity`. reserve() takes
+    the tokens immediately (the balance may go negative) and returns
+    how long the caller must wait, so waiters are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost: float) -> float:
+        cost = min(cost, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= cost
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self, cost: float) -> None:
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + min(cost, self.capacity))
+
+
+_BUCKETS: Dict[str, TokenBucket] = {}
+_BUCKETS_LOCK = threading.Lock()
+
+
+def get_project_bucket(project_id: Optional[str]) -> Optional[TokenBucket]:
+    if not project_id or LLM_PROJECT_TOKENS_PER_MINUTE <= 0:
+        return None
+
+    bucket = _BUCKETS.get(project_id)
+    if bucket is None:
+        with _BUCKETS_LOCK:
+            bucket = _BUCKETS.setdefault(
+                project_id,
+                TokenBucket(LLM_PROJECT_TOKENS_PER_MINUTE / 60.0, LLM_PROJECT_TOKENS_PER_MINUTE),
+            )
+    return bucket
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+# ============================================================
+# 🔁 RATE-LIMIT RETRIES
+# ============================================================
+
+def _status_code(exc: Exception) -> Optional[int]:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    return _status_code(exc) == 429 or "rate limit" in str(exc).lower()
+
+
+def backoff_delay(attempt: int, exc: Optional[Exception] = None) -> float:
+    """
+    Provider Retry-After when given, else full-jitter exponential.
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after") if hasattr(headers, "get") else None
+    if retry_after:
+        try:
+            return min(float(retry_after), _BACKOFF_MAX_SECONDS) + random.uniform(0, 0.25)
+        except ValueError:
+            pass
+    return random.uniform(0, min(_BACKOFF_MAX_SECONDS, _BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+# ============================================================
+# 🚦 GLOBAL CONCURRENCY LIMIT
+# ============================================================
+
+class ConcurrencyLimiter:
+    """
+    asyncio.Semaphore-like limit shared by every event loop in the
+    process (the API loop, the job worker and pre-diagnosis threads
+    each run their own). acquire() is awaited on the caller's loop;
+    release() may come from any thread and hands the slot straight
+    to the oldest waiter, waking it on its own loop.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        fut = waiter[1]
+        try:
+            await fut
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            if not queued and fut.done() and not fut.cancelled():
+                self.release()   # granted just as we were cancelled
+            # (granted but not yet delivered: _grant passes it on)
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, fut = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(self._grant, fut)
+                    return   # the slot moves to the waiter
+                except RuntimeError:
+                    continue   # its loop is closed
+            self._active -= 1
+
+    def _grant(self, fut: asyncio.Future) -> None:
+        if fut.done():
+            self.release()   # cancelled meanwhile: next in line
+        else:
+            fut.set_result(None)
+
+    @property
+    def in_use(self) -> int:
+        return self._active
+
+
+_limiter = ConcurrencyLimiter(LLM_MAX_CONCURRENCY)
+
+
+def get_semaphore() -> ConcurrencyLimiter:
+    """
+    The process-wide LLM concurrency limit (LLM_MAX_CONCURRENCY),
+    whichever event loop the caller runs on.
+    """
+    return _limiter
@@ -0,0 +1,174 @@
+# ============================================================
+# 🔌 LLM PROVIDERS (LAZY)
+# ============================================================
+#
+# The chat model is built on first use, not at import, so processes
+# that never call the LLM (log ingest, watchers) don't load langchain
+# or need an API key. Selected by LLM_PROVIDER:
+#
+#     groq    ChatGroq (GROQ_API_KEY)                       [default]
+#     openai  any OpenAI-compatible /chat/completions endpoint
+#             (LLM_BASE_URL, LLM_API_KEY) - vLLM, Ollama, llama.cpp...
+#     stub    offline canned answers (see llm_stub.py)
+#
+# LLM_MODEL overrides the provider's default model. Every model
+# exposes invoke / ainvoke / astream returning objects with .content;
+# extra keyword arguments (temperature, seed) override sampling.
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from . import metrics
+
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+
+LLM_PARAMS = {"temperature": 0}
+
+
+# ============================================================
+# 🔹 OPENAI-COMPATIBLE CLIENT
+# ============================================================
+
+class ChatMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class OpenAICompatibleChatModel:
+    """
+    Minimal /chat/completions client over httpx. HTTP errors are
+    raised as httpx.HTTPStatusError, so 429s (and Retry-After) are
+    handled by the retry logic in llm.py like the Groq client's.
+    """
+
+    def __init__(self, base_url: str, model: str, api_key: Optional[str] = None, **params):
+        import httpx
+
+        self.model = model
+        self.params = params
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        url = base_url.rstrip("/") + "/chat/completions"
+        self._url = url
+        self._client = httpx.Client(headers=headers, timeout=LLM_REQUEST_TIMEOUT_SECONDS)
+        self._aclient = httpx.AsyncClient(headers=headers, timeout=LLM_REQUEST_TIMEOUT_SECONDS)
+
+    def _body(self, prompt: str, stream: bool = False, **params) -> Dict:
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream,
+            **self.params,
+            **params,
+        }
+
+    def invoke(self, prompt: str, **params) -> ChatMessage:
+        response = self._client.post(self._url, json=self._body(prompt, **params))
+        response.raise_for_status()
+        return ChatMessage(response.json()["choices"][0]["message"]["content"] or "")
+
+    async def ainvoke(self, prompt: str, **params) -> ChatMessage:
+        response = await self._aclient.post(self._url, json=self._body(prompt, **params))
+        response.raise_for_status()
+        return ChatMessage(response.json()["choices"][0]["message"]["content"] or "")
+
+    async def astream(self, prompt: str, **params):
+        async with self._aclient.stream("POST", self._url, json=self._body(prompt, stream=True, **params)) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield ChatMessage(delta)
+
+
+# ============================================================
+# 🔹 REGISTRY
+# ============================================================
+
+def _groq(model: str):
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        model=model,
+        api_key=os.getenv("GROQ_API_KEY"),
+        max_retries=0,  # 429s are retried in _invoke/_ainvoke
+        **LLM_PARAMS,
+    )
+
+
+def _openai(model: str):
+    return OpenAICompatibleChatModel(
+        base_url=os.getenv("LLM_BASE_URL", "http://localhost:8000/v1"),
+        model=model,
+        api_key=os.getenv("LLM_API_KEY"),
+        **LLM_PARAMS,
+    )
+
+
+def _stub(model: str):
+    from .llm_stub import StubChatModel
+
+    return StubChatModel()
+
+
+# name -> (factory(model) -> chat model, default model)
+_PROVIDERS: Dict[str, Tuple[Callable, str]] = {
+    "groq": (_groq, "llama-3.1-8b-instant"),
+    "openai": (_openai, "default"),
+    "stub": (_stub, "stub"),
+}
+
+
+def register_provider(name: str, factory: Callable, default_model: str) -> None:
+    """
+    Plug in another backend without touching llm.py.
+    """
+    _PROVIDERS[name] = (factory, default_model)
+
+
+def _configured() -> Tuple[str, str]:
+    # read at call time: llm.py loads .env after importing this module
+    name = os.getenv("LLM_PROVIDER", "groq")
+    if name not in _PROVIDERS:
+        raise ValueError(f"Unknown LLM_PROVIDER {name!r} (known: {', '.join(sorted(_PROVIDERS))})")
+    return name, os.getenv("LLM_MODEL") or _PROVIDERS[name][1]
+
+
+def provider_identity() -> str:
+    """
+    "provider/model", part of the LLM cache key so answers from
+    different backends never mix.
+    """
+    return "/".join(_configured())
+
+
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    """
+    The configured chat model, built on first call (thread-safe).
+    Construction time is exported as llm.provider_init_ms.
+    """
+    global _llm
+    if _llm is not None:
+        return _llm
+
+    with _llm_lock:
+        if _llm is None:
+            name, model = _configured()
+            start = time.perf_counter()
+            _llm = _PROVIDERS[name][0](model)
+            metrics.incr("llm.provider_init_ms", int((time.perf_counter() - start) * 1000))
+    return _llm
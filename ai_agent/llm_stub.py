@@ -0,0 +1,115 @@
+# ============================================================
+# 🧪 STUB CHAT MODEL (LOCAL LOAD TESTING)
+# ============================================================
+#
+# Stands in for the provider when LLM_PROVIDER=stub: fixed latency,
+# a configurable share of 429s, canned answers in the format the
+# prompts ask for. Also a small load driver:
+#
+#     LLM_PROVIDER=stub python -m ai_agent.llm_stub --calls 200
+#     LLM_PROVIDER=stub python -m ai_agent.llm_stub --calls 200 --duplicates 5
+#
+# Config (env): LLM_STUB_LATENCY (seconds), LLM_STUB_429_RATE (0..1).
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+LLM_STUB_LATENCY_SECONDS = float(os.getenv("LLM_STUB_LATENCY", "0.2"))
+LLM_STUB_429_RATE = float(os.getenv("LLM_STUB_429_RATE", "0"))
+
+_STUB_ANSWER = (
+    "EXPLANATION:\n"
+    "Stub diagnosis: the logs point at the most frequent error message.\n\n"
+    "UPDATED_FILE:\n"
+)
+
+
+class StubRateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self):
+        super().__init__("Rate limit reached (stub)")
+
+
+class StubMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class StubChatModel:
+    def __init__(self, latency: float = LLM_STUB_LATENCY_SECONDS, rate_limit_share: float = LLM_STUB_429_RATE):
+        self.latency = latency
+        self.rate_limit_share = rate_limit_share
+
+    def _answer(self) -> StubMessage:
+        if random.random() < self.rate_limit_share:
+            raise StubRateLimitError()
+        return StubMessage(_STUB_ANSWER)
+
+    def invoke(self, prompt: str, **params) -> StubMessage:
+        time.sleep(self.latency)
+        return self._answer()
+
+    async def ainvoke(self, prompt: str, **params) -> StubMessage:
+        await asyncio.sleep(self.latency)
+        return self._answer()
+
+    async def astream(self, prompt: str, **params):
+        # first token after `latency`, then 8-char chunks
+        await asyncio.sleep(self.latency)
+        text = self._answer().content
+        for i in range(0, len(text), 8):
+            yield StubMessage(text[i:i + 8])
+            await asyncio.sleep(0.005)
+
+
+# ============================================================
+# 🔹 LOAD DRIVER
+# ============================================================
+
+async def _drive(calls: int, projects: int, duplicates: int = 1) -> None:
+    from . import metrics
+    from .llm import _ainvoke
+
+    latencies = []
+    failures = 0
+
+    async def one(i: int):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            # every `duplicates` consecutive calls share a prompt (single-flight)
+            await _ainvoke(f"load test prompt {i // duplicates}", project_id=f"p{i % projects}", use_cache=False)
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    if latencies:
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"calls={calls} ok={len(latencies)} failed={failures} "
+              f"coalesced={metrics.get('llm.coalesced')} "
+              f"elapsed={elapsed:.2f}s p50={p50:.3f}s p99={p99:.3f}s")
+    else:
+        print(f"calls={calls} ok=0 failed={failures} elapsed={elapsed:.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--projects", type=int, default=4)
+    parser.add_argument("--duplicates", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(_drive(args.calls, args.projects, max(args.duplicates, 1)))
+
+
+if __name__ == "__main__":
+    main()
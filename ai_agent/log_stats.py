@@ -0,0 +1,132 @@
+import hashlib
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ============================================================
+# 📊 HYPERLOGLOG (DISTINCT MESSAGE ESTIMATE)
+# ============================================================
+#
+# 2^10 one-byte registers = 1 KiB per sketch, ~3% standard error,
+# and close to exact for the small counts grading cares about
+# (linear counting below 2.5 * m). Stored as a binary field.
+
+HLL_PRECISION = 10
+HLL_REGISTERS = 1 << HLL_PRECISION
+_HASH_BITS = 64
+_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+
+
+def hll_position(value: str) -> Tuple[int, int]:
+    """
+    (register index, rank) for a value.
+    """
+    h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+    index = h >> (_HASH_BITS - HLL_PRECISION)
+    rest = h & ((1 << (_HASH_BITS - HLL_PRECISION)) - 1)
+    rank = (_HASH_BITS - HLL_PRECISION) - rest.bit_length() + 1
+    return index, rank
+
+
+def hll_add(sketch: Optional[bytes], value: str) -> Optional[bytes]:
+    """
+    Sketch with `value` added, or None when no register changes
+    (most adds once a sketch has seen a few values), so callers
+    can skip the write.
+    """
+    registers = bytearray(sketch or bytes(HLL_REGISTERS))
+    index, rank = hll_position(value)
+    if registers[index] >= rank:
+        return None
+    registers[index] = rank
+    return bytes(registers)
+
+
+def hll_sketch(values) -> Optional[bytes]:
+    """
+    Sketch of many values (None if there are none).
+    """
+    sketch = None
+    for value in values:
+        sketch = hll_add(sketch, value) or sketch
+    return sketch
+
+
+def hll_merge(sketch: Optional[bytes], other: Optional[bytes]) -> Optional[bytes]:
+    """
+    Union of two sketches (register-wise max), or None when `other`
+    adds nothing to `sketch`, like hll_add.
+    """
+    if not other:
+        return None
+    if not sketch:
+        return bytes(other)
+    merged = bytes(map(max, sketch, other))
+    return None if merged == sketch else merged
+
+
+def hll_count(sketch: Optional[bytes]) -> int:
+    if not sketch:
+        return 0
+    m = len(sketch)
+    estimate = _ALPHA * m * m / sum(2.0 ** -r for r in sketch)
+    zeros = sketch.count(0)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)
+    return int(round(estimate))
+
+
+# ============================================================
+# 🔢 EXACT SMALL COUNTS
+# ============================================================
+#
+# Two messages whose hashes share a register read as one in the
+# sketch. Grading asks whether there is more than one message, so the
+# stats also keep the hashes of the first EXACT_MESSAGES distinct
+# messages, exactly.
+
+EXACT_MESSAGES = 2
+
+
+def message_hash(message: str) -> str:
+    return hashlib.blake2b(message.encode(), digest_size=8).hexdigest()
+
+
+def new_message_hashes(known: Optional[List[str]], messages: Iterable[str]) -> List[str]:
+    """
+    Hashes of `messages` missing from the stored `known` ones, up to
+    EXACT_MESSAGES in all; [] once that many are known.
+    """
+    seen = set(known or ())
+    added: List[str] = []
+    for message in messages:
+        if len(seen) >= EXACT_MESSAGES:
+            break
+        h = message_hash(message)
+        if h not in seen:
+            seen.add(h)
+            added.append(h)
+    return added
+
+
+def stats_summary(stats: Optional[Dict]) -> Optional[Dict]:
+    """
+    {total, errors, distinct_messages} from a stored stats document
+    (None if there is none yet). distinct_messages is exact below
+    EXACT_MESSAGES, an estimate above, and None when a document from
+    before the exact hashes only has a small estimate.
+    """
+    if not stats:
+        return None
+
+    distinct = hll_count(stats.get("message_sketch"))
+    hashes = stats.get("message_hashes")
+    if hashes is not None:
+        distinct = len(hashes) if len(hashes) < EXACT_MESSAGES else max(distinct, len(hashes))
+    elif distinct < EXACT_MESSAGES:
+        distinct = None
+
+    return {
+        "total": stats.get("total", 0),
+        "errors": stats.get("errors", 0),
+        "distinct_messages": distinct,
+    }
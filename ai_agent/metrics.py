@@ -0,0 +1,26 @@
+import threading
+from typing import Dict
+
+# ============================================================
+# 📈 PROCESS-LOCAL COUNTERS
+# ============================================================
+#
+# Named counters (cache hits/misses, calls...), exported as-is by
+# the gateway's /metrics endpoint. Per worker process.
+
+_COUNTERS: Dict[str, int] = {}
+_LOCK = threading.Lock()
+
+
+def incr(name: str, value: int = 1) -> None:
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + value
+
+
+def get(name: str) -> int:
+    return _COUNTERS.get(name, 0)
+
+
+def snapshot() -> Dict[str, int]:
+    with _LOCK:
+        return dict(sorted(_COUNTERS.items()))
@@ -0,0 +1,161 @@
+import difflib
+import re
+from typing import List, Optional, Tuple
+
+# ============================================================
+# 🩹 MODEL PATCHES (SEARCH/REPLACE + UNIFIED DIFF)
+# ============================================================
+#
+# The fix prompt asks for search/replace blocks:
+#
+#     <<<<<<< SEARCH
+#     lines copied from the file
+#     =======
+#     replacement lines
+#     >>>>>>> REPLACE
+#
+# Unified diffs ("@@ -a,b +c,d @@" hunks) are accepted too, since
+# models often answer with one anyway. Hunks are located by their
+# text, not their line numbers, and must match exactly once.
+
+_SEARCH_RE = re.compile(
+    r"^<{5,}\s*SEARCH[^\n]*\n(.*?)^={5,}[ \t]*\n(.*?)^>{5,}\s*REPLACE[^\n]*$",
+    re.M | re.S,
+)
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@.*$", re.M)
+
+
+class PatchError(ValueError):
+    pass
+
+
+Hunk = Tuple[List[str], List[str], Optional[int]]  # (old lines, new lines, line hint)
+
+
+def _strip_fence(text: str) -> str:
+    text = text.strip("\n")
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text
+
+
+def _lines(block: str) -> List[str]:
+    block = block[:-1] if block.endswith("\n") else block
+    return block.split("\n") if block else []
+
+
+def parse_search_replace(text: str) -> List[Hunk]:
+    return [(_lines(m.group(1)), _lines(m.group(2)), None) for m in _SEARCH_RE.finditer(text)]
+
+
+def parse_unified_diff(text: str) -> List[Hunk]:
+    hunks: List[Hunk] = []
+    headers = list(_HUNK_RE.finditer(text))
+    for i, m in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        old: List[str] = []
+        new: List[str] = []
+        for line in text[m.end():end].split("\n")[1:]:
+            if line.startswith(("--- ", "+++ ", "\\")):
+                continue
+            if line.startswith("-"):
+                old.append(line[1:])
+            elif line.startswith("+"):
+                new.append(line[1:])
+            elif line.startswith(" "):
+                old.append(line[1:])
+                new.append(line[1:])
+            elif line == "":
+                # blank context lines often lose their leading space
+                old.append("")
+                new.append("")
+        while old and new and old[-1] == "" and new[-1] == "":
+            old.pop()
+            new.pop()
+        hunks.append((old, new, int(m.group(1))))
+    return hunks
+
+
+def parse_patch(text: str) -> List[Hunk]:
+    """
+    Hunks from a model answer, search/replace blocks first.
+    Raises PatchError when there are none.
+    """
+    text = _strip_fence(text)
+    hunks = parse_search_replace(text) or parse_unified_diff(text)
+    if not hunks:
+        raise PatchError("no hunks in patch")
+    return hunks
+
+
+def _find(lines: List[str], old: List[str], hint: Optional[int]) -> int:
+    """
+    Start index of `old` in `lines`. Exact match first, then ignoring
+    trailing whitespace; a unique match is required unless a line
+    hint breaks the tie.
+    """
+    n = len(old)
+    for normalize in (lambda s: s, lambda s: s.rstrip()):
+        target = [normalize(s) for s in old]
+        first = normalize(old[0])
+        starts = [
+            i for i in range(len(lines) - n + 1)
+            if normalize(lines[i]) == first and [normalize(s) for s in lines[i:i + n]] == target
+        ]
+        if len(starts) == 1:
+            return starts[0]
+        if len(starts) > 1:
+            if hint is None:
+                raise PatchError("hunk matches %d places" % len(starts))
+            return min(starts, key=lambda i: abs(i + 1 - hint))
+    raise PatchError("hunk does not match the file")
+
+
+def apply_patch(content: str, hunks: List[Hunk]) -> str:
+    """
+    Apply hunks to `content`. All or nothing: raises PatchError if
+    any hunk is empty, does not match, or overlaps another (the
+    message names the hunk, for the model to correct it).
+    """
+    lines = content.splitlines()
+    edits = []
+    for n, (old, new, hint) in enumerate(hunks, 1):
+        if not old:
+            raise PatchError(f"hunk {n} of {len(hunks)} has no search text")
+        try:
+            start = _find(lines, old, hint)
+        except PatchError as e:
+            first = next((line.strip() for line in old if line.strip()), "")
+            raise PatchError(f"hunk {n} of {len(hunks)} (starting {first[:80]!r}): {e}")
+        edits.append((start, start + len(old), new, n))
+
+    edits.sort()
+    for (_, prev_end, _, a), (start, _, _, b) in zip(edits, edits[1:]):
+        if start < prev_end:
+            raise PatchError(f"hunks {a} and {b} overlap")
+
+    for start, end, new, _ in reversed(edits):
+        lines[start:end] = new
+
+    result = "\n".join(lines)
+    if content.endswith("\n") and result:
+        result += "\n"
+    return result
+
+
+def make_patch(path: str, original: str, fixed: str) -> str:
+    """
+    Unified diff of original -> fixed, as returned by the API.
+    """
+    a, b = original.splitlines(True), fixed.splitlines(True)
+    for lines in (a, b):
+        if lines and not lines[-1].endswith("\n"):
+            lines[-1] += "\n"
+    return "".join(difflib.unified_diff(
+        a,
+        b,
+        fromfile=f"a/{path}",
+        tofile=f"b/{path}",
+    ))
@@ -0,0 +1,314 @@
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+
+# ============================================================
+# 🔹 PATH NORMALIZATION
+# ============================================================
+
+def normalize_path(path: str) -> str:
+    """
+    Canonical key of a path: forward slashes, no leading "./" or
+    "/". Case is kept, so "Foo.py" and "foo.py" stay two files.
+    """
+    path = (path or "").replace("\\", "/").strip()
+    while path.startswith("./"):
+        path = path[2:]
+    return path.strip("/")
+
+
+def _fold(path: str) -> str:
+    # lookup tables are case-insensitive; each bucket lists the keys
+    return normalize_path(path).lower()
+
+
+def _segments(path: str) -> List[str]:
+    return [s for s in _fold(path).split("/") if s and s != "."]
+
+
+# ============================================================
+# 📂 PATH INDEX
+# ============================================================
+
+class PathIndex:
+    """
+    Per-project index over the watcher's file structure.
+
+    - paths:       normalized path -> file entry (O(1) membership)
+    - folded:      lowercase path -> paths (case-insensitive lookup)
+    - basenames:   lowercase basename -> paths
+    - extensions:  lowercase extension -> paths
+    - suffixes:    every trailing run of lowercase segments -> paths,
+                   e.g. "a/b/c.py" is reachable from "c.py", "b/c.py"
+                   and "a/b/c.py" (O(depth) longest-suffix match)
+    - trie:        lowercase path segments, for "files under this
+                   directory"; leaves hold the set of paths
+    """
+
+    _LEAF = "\0"
+
+    def __init__(self, files: Iterable[Dict] = (), version: Optional[int] = None):
+        self.version = version
+        self.paths: Dict[str, Dict] = {}
+        self.folded: Dict[str, Set[str]] = {}
+        self.basenames: Dict[str, Set[str]] = {}
+        self.extensions: Dict[str, Set[str]] = {}
+        self.suffixes: Dict[str, Set[str]] = {}
+        self.trie: Dict = {}
+        self._derived: Dict[str, tuple] = {}
+        self._lock = threading.RLock()
+
+        for f in files:
+            self.add(f)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    # ---------- mutation ----------
+
+    def add(self, file: Dict) -> None:
+        key = normalize_path(file.get("path", ""))
+        if not key:
+            return
+
+        with self._lock:
+            if key in self.paths:
+                self.paths[key] = file
+                return
+
+            self.paths[key] = file
+            folded = key.lower()
+            segs = folded.split("/")
+            name = segs[-1]
+            _, ext = os.path.splitext(name)
+
+            self.folded.setdefault(folded, set()).add(key)
+            self.basenames.setdefault(name, set()).add(key)
+            self.extensions.setdefault(ext, set()).add(key)
+            for i in range(len(segs)):
+                self.suffixes.setdefault("/".join(segs[i:]), set()).add(key)
+
+            node = self.trie
+            for seg in segs:
+                node = node.setdefault(seg, {})
+            node.setdefault(self._LEAF, set()).add(key)
+
+    def remove(self, path: str) -> None:
+        key = normalize_path(path)
+
+        with self._lock:
+            if self.paths.pop(key, None) is None:
+                return
+
+            folded = key.lower()
+            segs = folded.split("/")
+            name = segs[-1]
+            _, ext = os.path.splitext(name)
+
+            self._discard(self.folded, folded, key)
+            self._discard(self.basenames, name, key)
+            self._discard(self.extensions, ext, key)
+            for i in range(len(segs)):
+                self._discard(self.suffixes, "/".join(segs[i:]), key)
+
+            self._trie_remove(self.trie, segs, 0, key)
+
+    @staticmethod
+    def _discard(table: Dict[str, Set[str]], bucket: str, key: str) -> None:
+        paths = table.get(bucket)
+        if paths is None:
+            return
+        paths.discard(key)
+        if not paths:
+            del table[bucket]
+
+    def _trie_remove(self, node: Dict, segs: List[str], i: int, key: str) -> bool:
+        if i == len(segs):
+            leaf = node.get(self._LEAF)
+            if leaf is not None:
+                leaf.discard(key)
+                if not leaf:
+                    del node[self._LEAF]
+            return not node
+
+        child = node.get(segs[i])
+        if child is not None and self._trie_remove(child, segs, i + 1, key):
+            del node[segs[i]]
+        return not node
+
+    # ---------- derived indexes ----------
+
+    def derived(self, name: str, build: Callable[["PathIndex"], object]):
+        """
+        Data computed from the whole structure (ranking features,
+        token postings...), built lazily once per structure version.
+        """
+        with self._lock:
+            cached = self._derived.get(name)
+            if cached is None or cached[0] != self.version:
+                cached = (self.version, build(self))
+                self._derived[name] = cached
+            return cached[1]
+
+    def advance(self, version: int, added: List[Dict], modified: List[Dict], removed: List[str]) -> None:
+        """
+        Move to a new structure version after a delta. Derived data
+        that can patch itself (apply_delta) is kept, the rest is
+        rebuilt on next use.
+        """
+        with self._lock:
+            for name, (cached_version, data) in list(self._derived.items()):
+                apply_delta = getattr(data, "apply_delta", None)
+                if (
+                    cached_version == self.version
+                    and apply_delta is not None
+                    and apply_delta(added, modified, removed)
+                ):
+                    self._derived[name] = (version, data)
+                else:
+                    del self._derived[name]
+            self.version = version
+
+    # ---------- lookups ----------
+    #
+    # Lookups ignore case; results are the watcher's original paths.
+    # An exact (case-sensitive) match wins in get().
+
+    def _original(self, keys: Iterable[str]) -> List[str]:
+        return sorted(self.paths[k].get("path", k) for k in keys)
+
+    def contains(self, path: str) -> bool:
+        key = normalize_path(path)
+        with self._lock:
+            return key in self.paths or key.lower() in self.folded
+
+    def get(self, path: str) -> Optional[Dict]:
+        key = normalize_path(path)
+        with self._lock:
+            file = self.paths.get(key)
+            if file is None:
+                keys = self.folded.get(key.lower())
+                if keys:
+                    file = self.paths[min(keys)]
+            return file
+
+    def files(self) -> List[Dict]:
+        with self._lock:
+            return list(self.paths.values())
+
+    def with_basename(self, name: str) -> List[str]:
+        with self._lock:
+            return self._original(self.basenames.get(name.lower(), ()))
+
+    def with_extension(self, ext: str) -> List[str]:
+        ext = ext.lower()
+        if ext and not ext.startswith("."):
+            ext = "." + ext
+        with self._lock:
+            return self._original(self.extensions.get(ext, ()))
+
+    def with_suffix(self, suffix: str) -> List[str]:
+        with self._lock:
+            return self._original(self.suffixes.get(_fold(suffix), ()))
+
+    def match_suffix(self, path: str) -> List[str]:
+        """
+        Longest-suffix match of an arbitrary path (absolute, container,
+        Windows...) against known project paths.
+        """
+        segs = _segments(path)
+        with self._lock:
+            for i in range(len(segs)):
+                hits = self.suffixes.get("/".join(segs[i:]))
+                if hits:
+                    return self._original(hits)
+        return []
+
+    def under(self, directory: str) -> List[str]:
+        node = self.trie
+        with self._lock:
+            for seg in _segments(directory):
+                node = node.get(seg)
+                if node is None:
+                    return []
+
+            found = []
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                for seg, child in current.items():
+                    if seg == self._LEAF:
+                        found.extend(child)
+                    else:
+                        stack.append(child)
+            return self._original(found)
+
+
+# ============================================================
+# 🔹 PER-PROJECT REGISTRY (PROCESS LOCAL)
+# ============================================================
+#
+# Indexes are rebuilt from the state store whenever the structure
+# version moves, so every worker converges on the same view.
+
+_INDEXES: Dict[str, PathIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def build_path_index(project_id: str, entry: Dict) -> PathIndex:
+    index = PathIndex(entry.get("files", {}).values(), version=entry.get("version"))
+    with _INDEXES_LOCK:
+        _INDEXES[project_id] = index
+    return index
+
+
+def cached_path_index(project_id: str, version: Optional[int]) -> Optional[PathIndex]:
+    """
+    The cached index if it is at `version` (no structure fetch).
+    """
+    index = _INDEXES.get(project_id)
+    if index is not None and version is not None and index.version == version:
+        return index
+    return None
+
+
+def get_path_index(project_id: str, entry: Optional[Dict]) -> Optional[PathIndex]:
+    if not entry:
+        return None
+
+    index = _INDEXES.get(project_id)
+    if index is not None and index.version == entry.get("version"):
+        return index
+    return build_path_index(project_id, entry)
+
+
+def update_path_index(
+    project_id: str,
+    base_version: int,
+    entry: Dict,
+    added: List[Dict],
+    modified: List[Dict],
+    removed: List[str],
+) -> PathIndex:
+    """
+    Apply a structure delta to the cached index, or rebuild it
+    when the cached copy is not at base_version.
+    """
+    index = _INDEXES.get(project_id)
+    if index is None or index.version != base_version:
+        return build_path_index(project_id, entry)
+
+    for path in removed:
+        index.remove(path)
+    for f in added:
+        index.add(f)
+    merged = []
+    for f in modified:
+        current = entry["files"].get(f.get("path"))
+        if current:
+            index.add(current)
+            merged.append(current)
+
+    index.advance(entry.get("version"), added, merged, removed)
+    return index
@@ -0,0 +1,93 @@
+# ============================================================
+# 📏 PROMPT BUDGET BENCHMARK
+# ============================================================
+#
+# Prompt tokens and build time with the old verbatim prompt
+# sections (every log line, whole file) vs the budgeted builder.
+#
+#     python -m ai_agent.prompt_bench                      # synthetic corpus
+#     python -m ai_agent.prompt_bench --corpus incidents.jsonl
+#     python -m ai_agent.prompt_bench --mongo 50 --save incidents.jsonl
+#     python -m ai_agent.prompt_bench --corpus incidents.jsonl --llm
+#
+# Corpus: see eval_corpus.py (without path/content only the log
+# section is measured).
+# --llm also times real completions for both prompt versions.
+
+import argparse
+import statistics
+import time
+from typing import Dict, List
+
+from .eval_corpus import add_corpus_args, load_corpus
+from .llm_limits import estimate_tokens
+from .prompt_builder import focus_lines, format_logs_compact, window_file
+
+
+def _legacy_logs(logs: List[Dict]) -> str:
+    return "\n".join(
+        f"[{l.get('level', 'UNKNOWN')}] {l.get('timestamp', '')} - {l.get('message', '')}"
+        for l in logs
+    )
+
+
+def _measure(record: Dict) -> Dict:
+    logs, incident = record["logs"], record["incident"]
+    content = record.get("content") or ""
+
+    start = time.perf_counter()
+    log_section = format_logs_compact(logs)
+    file_section = content
+    if content:
+        file_section, _ = window_file(content, focus_lines(incident, logs, record.get("path", ""), content))
+    build_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "before": estimate_tokens(_legacy_logs(logs)) + (estimate_tokens(content) if content else 0),
+        "after": estimate_tokens(log_section) + (estimate_tokens(file_section) if content else 0),
+        "build_ms": build_ms,
+        "log_section": log_section,
+        "file_section": file_section,
+    }
+
+
+def _time_completion(prompt: str) -> float:
+    from .llm import _invoke
+
+    start = time.perf_counter()
+    _invoke(prompt, use_cache=False)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    add_corpus_args(parser)
+    parser.add_argument("--llm", action="store_true")
+    args = parser.parse_args()
+    corpus = load_corpus(args)
+
+    results = [_measure(r) for r in corpus]
+    before = [r["before"] for r in results]
+    after = [r["after"] for r in results]
+
+    print(f"incidents: {len(results)}")
+    print(f"prompt tokens (logs + file) before: median {statistics.median(before):.0f}, max {max(before)}")
+    print(f"prompt tokens (logs + file) after:  median {statistics.median(after):.0f}, max {max(after)}")
+    print(f"reduction: {1 - sum(after) / max(sum(before), 1):.1%}")
+    print(f"build time: median {statistics.median(r['build_ms'] for r in results):.2f} ms")
+
+    if args.llm:
+        old_latency, new_latency = [], []
+        for record, result in zip(corpus, results):
+            old_latency.append(_time_completion(
+                f"Logs:\n{_legacy_logs(record['logs'])}\n\nFile content:\n{record.get('content', '')}"
+            ))
+            new_latency.append(_time_completion(
+                f"Logs:\n{result['log_section']}\n\nFile content:\n{result['file_section']}"
+            ))
+        print(f"completion latency before: median {statistics.median(old_latency):.2f}s")
+        print(f"completion latency after:  median {statistics.median(new_latency):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from .llm_limits import estimate_tokens
+from .symbols import message_identifiers
+from .traceback_parser import extract_log_frames
+
+LOG_TOKEN_BUDGET = int(os.getenv("PROMPT_LOG_TOKEN_BUDGET", "1500"))
+FILE_TOKEN_BUDGET = int(os.getenv("PROMPT_FILE_TOKEN_BUDGET", "4000"))
+
+# Lines kept on each side of a traceback line / matched symbol
+WINDOW_CONTEXT_LINES = 20
+
+# One log group may use at most this share of the log budget
+# (long tracebacks are cut, not the other groups)
+_MAX_GROUP_SHARE = 0.4
+
+_LEVEL_RANK = {"CRITICAL": 0, "FATAL": 0, "ERROR": 1, "WARN": 2, "WARNING": 2, "INFO": 3, "DEBUG": 4}
+
+
+# ============================================================
+# 🔹 LOG COMPACTION
+# ============================================================
+
+_TEMPLATE_RES = [
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.I), "<uuid>"),
+    (re.compile(r"\b0x[0-9a-f]+\b|\b[0-9a-f]{16,}\b", re.I), "<hex>"),
+    (re.compile(r"'[^'\n]{0,200}'|\"[^\"\n]{0,200}\""), "<str>"),
+    (re.compile(r"\d+(?:\.\d+)?"), "<n>"),
+]
+
+
+def log_template(message: str) -> str:
+    """
+    Message with ids, numbers and quoted values masked, so repeats
+    of the same error collapse to one template.
+    """
+    for pattern, placeholder in _TEMPLATE_RES:
+        message = pattern.sub(placeholder, message)
+    return " ".join(message.split())
+
+
+def group_logs(logs: List[Dict]) -> List[Dict]:
+    """
+    (template, count, first/last timestamp, level, latest message),
+    most severe first, then most frequent, then most recent.
+    """
+    groups: Dict[str, Dict] = {}
+    for log in logs:
+        message = str(log.get("message", ""))
+        template = log_template(message)
+        ts = log.get("timestamp", "")
+        level = str(log.get("level", "UNKNOWN")).upper()
+
+        group = groups.get(template)
+        if group is None:
+            groups[template] = {
+                "template": template,
+                "message": message,
+                "level": level,
+                "count": 1,
+                "first": ts,
+                "last": ts,
+            }
+            continue
+
+        group["count"] += 1
+        if ts and (not group["last"] or str(ts) > str(group["last"])):
+            group["last"] = ts
+            group["message"] = message
+        if ts and (not group["first"] or str(ts) < str(group["first"])):
+            group["first"] = ts
+        if _LEVEL_RANK.get(level, 5) < _LEVEL_RANK.get(group["level"], 5):
+            group["level"] = level
+
+    ordered = sorted(groups.values(), key=lambda g: str(g["last"]), reverse=True)
+    ordered.sort(key=lambda g: (_LEVEL_RANK.get(g["level"], 5), -g["count"]))
+    return ordered
+
+
+def log_window_version(logs: List[Dict]) -> str:
+    """
+    Fingerprint of the distinct (level, template) pairs in a log
+    window. More repeats of the same errors keep the version; a new
+    kind of message changes it.
+    """
+    keys = sorted({
+        f"{str(log.get('level', 'UNKNOWN')).upper()} {log_template(str(log.get('message', '')))}"
+        for log in logs
+    })
+    return hashlib.sha1("\n".join(keys).encode()).hexdigest()
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    # keep both ends: the head names the error, the tail the raise site
+    half = max_chars // 2
+    return text[:half] + "\n  ... (truncated) ...\n" + text[-half:]
+
+
+def format_logs_compact(logs: List[Dict], budget: int = LOG_TOKEN_BUDGET) -> str:
+    """
+    Log section for a prompt within `budget` tokens: one line per
+    distinct message template with its count and time range.
+    """
+    lines: List[str] = []
+    used = 0
+    groups = group_logs(logs)
+    per_group = max(int(budget * _MAX_GROUP_SHARE), 1)
+
+    for i, g in enumerate(groups):
+        message = _clip(g["message"], per_group)
+        if g["count"] > 1:
+            line = f"[{g['level']}] x{g['count']} ({g['first']} .. {g['last']}) - {message}"
+        else:
+            line = f"[{g['level']}] {g['last']} - {message}"
+
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            lines.append(f"... {len(groups) - i} more distinct messages omitted")
+            break
+        lines.append(line)
+        used += cost
+
+    return "\n".join(lines)
+
+
+# ============================================================
+# 📄 FILE WINDOWING
+# ============================================================
+
+def _same_file(frame_path: str, path: str) -> bool:
+    a = [s for s in frame_path.replace("\\", "/").lower().split("/") if s]
+    b = [s for s in path.replace("\\", "/").lower().split("/") if s]
+    n = min(len(a), len(b))
+    return n > 0 and a[-n:] == b[-n:]
+
+
+def focus_lines(incident: Dict, logs: List[Dict], path: str, content: str) -> List[int]:
+    """
+    1-based lines of `content` the incident points at: traceback
+    frames in this file, then definitions of functions/classes the
+    logs or frames name.
+    """
+    frames = incident.get("frames") or extract_log_frames(logs)
+    lines: List[int] = [
+        f["line"] for f in frames
+        if f.get("line") and _same_file(f["path"], path)
+    ]
+
+    names: Set[str] = message_identifiers(str(log.get("message", "")) for log in logs)
+    names.update(f["function"] for f in frames if f.get("function"))
+    if names:
+        definition = re.compile(
+            r"^\s*(?:export\s+)?(?:async\s+)?(?:def|class|function)\s+([A-Za-z_$][\w$]*)"
+        )
+        for number, line in enumerate(content.splitlines(), start=1):
+            m = definition.match(line)
+            if m and m.group(1) in names:
+                lines.append(number)
+
+    return sorted(set(lines))
+
+
+def file_windows(total_lines: int, focus: List[int], context: int = WINDOW_CONTEXT_LINES) -> List[Tuple[int, int]]:
+    """
+    Merged, 1-based inclusive [start, end] ranges around focus lines.
+    """
+    windows: List[Tuple[int, int]] = []
+    for line in focus:
+        start, end = max(1, line - context), min(total_lines, line + context)
+        if windows and start <= windows[-1][1] + 1:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
+
+def window_file(
+    content: str,
+    focus: List[int],
+    budget: int = FILE_TOKEN_BUDGET,
+) -> Tuple[str, Optional[List[Tuple[int, int]]]]:
+    """
+    The file as shown to the model. Files within budget are sent
+    whole (windows None). Larger files are cut to line-numbered
+    windows around the focus lines, widest context first that fits;
+    without focus lines the head of the file is kept.
+    """
+    if estimate_tokens(content) <= budget:
+        return content, None
+
+    lines = content.splitlines()
+    focus = [n for n in focus if 1 <= n <= len(lines)] or [1]
+
+    for context in (WINDOW_CONTEXT_LINES * 2, WINDOW_CONTEXT_LINES, WINDOW_CONTEXT_LINES // 2, 5):
+        windows = file_windows(len(lines), focus, context)
+        text = render_windows(lines, windows)
+        if estimate_tokens(text) <= budget:
+            return text, windows
+
+    # still too large: keep windows in file order while they fit
+    kept: List[Tuple[int, int]] = []
+    for window in file_windows(len(lines), focus, 5):
+        if estimate_tokens(render_windows(lines, kept + [window])) > budget:
+            break
+        kept.append(window)
+    if not kept:
+        # even one narrow window is over budget (very long lines)
+        start = end = max(1, focus[0] - 5)
+        used = 0
+        while end < len(lines) and used + estimate_tokens(lines[end]) <= budget:
+            used += estimate_tokens(lines[end])
+            end += 1
+        kept = [(start, max(start, end))]
+    return render_windows(lines, kept), kept
+
+
+def render_windows(lines: List[str], windows: List[Tuple[int, int]]) -> str:
+    parts = []
+    for start, end in windows:
+        parts.append(f"@@ lines {start}-{end} @@")
+        parts.extend(lines[start - 1:end])
+    return "\n".join(parts)
+
+
+_WINDOW_HEADER_RE = re.compile(r"^@@ lines (\d+)-(\d+) @@\s*$", re.M)
+
+
+def apply_window_edits(content: str, updated: str, windows: List[Tuple[int, int]]) -> Optional[str]:
+    """
+    Splice the model's updated windows (same "@@ lines a-b @@"
+    headers) back into the full file. None when the answer does not
+    reference the windows it was shown. A header with an empty body
+    leaves that window unchanged. Line endings (CRLF or LF, and a
+    missing final newline) are kept as in the file.
+    """
+    allowed = set(windows)
+    headers = list(_WINDOW_HEADER_RE.finditer(updated))
+    if not headers:
+        return None
+
+    replacements: Dict[Tuple[int, int], List[str]] = {}
+    for i, m in enumerate(headers):
+        span = (int(m.group(1)), int(m.group(2)))
+        if span not in allowed:
+            return None
+        body_end = headers[i + 1].start() if i + 1 < len(headers) else len(updated)
+        body = updated[m.end():body_end].strip("\r\n")
+        if body.strip():
+            replacements[span] = [line.rstrip("\r") for line in body.split("\n")]
+
+    # same line numbering as window_file (str.splitlines)
+    lines = content.splitlines(keepends=True)
+    newline = "\r\n" if "\r\n" in content else "\n"
+    for (start, end) in sorted(replacements, reverse=True):
+        original = lines[start - 1:end]
+        if not original:
+            continue
+        bare = [line.splitlines()[0] for line in original]
+        new = _keep_edge_blanks(bare, replacements[(start, end)])
+        last_ending = original[-1][len(bare[-1]):]
+        lines[start - 1:end] = [line + newline for line in new[:-1]] + [new[-1] + last_ending]
+
+    return "".join(lines)
+
+
+def _blank_run(lines: List[str]) -> int:
+    n = 0
+    for line in lines:
+        if line.strip():
+            break
+        n += 1
+    return n
+
+
+def _keep_edge_blanks(original: List[str], updated: List[str]) -> List[str]:
+    # Answers are whitespace-stripped, which would eat blank lines at
+    # the window edges and glue neighbouring code together.
+    if not updated:
+        return updated
+    lead = _blank_run(original) - _blank_run(updated)
+    trail = _blank_run(original[::-1]) - _blank_run(updated[::-1])
+    return [""] * max(lead, 0) + updated + [""] * max(trail, 0)
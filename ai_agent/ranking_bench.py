@@ -0,0 +1,145 @@
+# ============================================================
+# 📏 FILE RANKING BENCHMARK
+# ============================================================
+#
+# List-based scoring (score_file over every file) vs the columnar
+# FileFeatureIndex with its path-token index, on a synthetic
+# structure.
+#
+#     python -m ai_agent.ranking_bench                  # 100k files
+#     python -m ai_agent.ranking_bench --files 20000 --rounds 50
+#     python -m ai_agent.ranking_bench --service billing
+#
+# Every file whose path contains the service name is boosted, so
+# ranking cost grows with how common that name is in paths (the
+# default, "payments", is in none; "billing" is in ~1/6).
+#
+# Reports the one-off index build, per-request ranking (warm and
+# first after a delta) and delta apply; the last step ranks while
+# another thread applies deltas, as the gateway does.
+
+import argparse
+import random
+import statistics
+import threading
+import time
+from typing import Dict, List
+
+from .file_features import FileFeatureIndex
+from .file_priority import rank_files
+
+DIRS = ["services", "api", "core", "utils", "lib", "handlers", "models", "web", "jobs", "tests"]
+EXTS = [".py", ".js", ".ts", ".go", ".md", ".json", ".txt"]
+
+
+def synthetic_structure(n: int, seed: int = 7) -> List[Dict]:
+    rng = random.Random(seed)
+    files = []
+    for i in range(n):
+        depth = rng.randint(1, 4)
+        # a few common top-level dirs, then project-specific packages
+        parts = [rng.choice(DIRS)] + [f"pkg{rng.randint(0, 400)}" for _ in range(depth - 1)]
+        name = f"{rng.choice(['index', 'utils', 'orders', 'billing', 'auth', 'module'])}_{i}{rng.choice(EXTS)}"
+        files.append({"path": "/".join(parts + [name]), "size": rng.randint(0, 60_000)})
+    return files
+
+
+def synthetic_logs(files: List[Dict], n: int = 50, seed: int = 7) -> List[Dict]:
+    rng = random.Random(seed)
+    logs = []
+    for j in range(n):
+        if j % 10 == 0:
+            path = rng.choice(files)["path"]
+            message = f'File "/app/{path}", line {rng.randint(1, 400)}, in handle\nKeyError: \'amount\''
+        else:
+            message = f"payment failed for order {rng.randint(1000, 99999)} after {rng.randint(1, 900)}ms"
+        logs.append({"level": "ERROR", "message": message})
+    return logs
+
+
+def _ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def _median_ms(fn, rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(_ms(start))
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--service", default="payments")
+    args = parser.parse_args()
+
+    files = synthetic_structure(args.files)
+    logs = synthetic_logs(files)
+    service = args.service
+
+    print(f"files: {len(files)}, logs: {len(logs)}")
+
+    legacy = _median_ms(lambda: rank_files(files, logs, service), max(args.rounds // 4, 1))
+    print(f"list-based ranking:      {legacy:.1f} ms/request")
+
+    start = time.perf_counter()
+    features = FileFeatureIndex(files)
+    print(f"index build (one-off):   {_ms(start):.1f} ms")
+
+    features.rank(logs, service, 5)
+    warm = _median_ms(lambda: features.rank(logs, service, 5), args.rounds)
+    print(f"indexed ranking (warm):  {warm:.2f} ms/request")
+
+    rng = random.Random(11)
+    next_id = [len(files)]
+
+    def delta():
+        added = [{"path": f"services/billing/new_{next_id[0] + k}.py", "size": 900} for k in range(20)]
+        next_id[0] += 20
+        removed = [rng.choice(files)["path"] for _ in range(20)]
+        modified = [{"path": rng.choice(files)["path"], "size": rng.randint(0, 60_000)} for _ in range(20)]
+        return added, modified, removed
+
+    applies, firsts = [], []
+    for _ in range(args.rounds):
+        added, modified, removed = delta()
+        start = time.perf_counter()
+        features.apply_delta(added, modified, removed)
+        applies.append(_ms(start))
+        start = time.perf_counter()
+        features.rank(logs, service, 5)
+        firsts.append(_ms(start))
+    print(f"delta apply (60 files):  {statistics.median(applies):.2f} ms")
+    print(f"first ranking after:     {statistics.median(firsts):.2f} ms")
+
+    # ranking concurrently with deltas (PathIndex.advance in the gateway)
+    errors: List[BaseException] = []
+    stop = threading.Event()
+
+    def apply_loop():
+        while not stop.is_set():
+            features.apply_delta(*delta())
+
+    writer = threading.Thread(target=apply_loop)
+    writer.start()
+    start = time.perf_counter()
+    ranked = 0
+    try:
+        while time.perf_counter() - start < 2:
+            try:
+                features.rank(logs, service, 5)
+            except Exception as e:
+                errors.append(e)
+            ranked += 1
+    finally:
+        stop.set()
+        writer.join()
+    print(f"ranking during deltas:   {ranked} requests in 2 s, {len(errors)} errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from dotenv import load_dotenv
 from pymongo import MongoClient, DESCENDING
 from pymongo.errors import PyMongoError
 from bson import ObjectId
+from bson.errors import InvalidId
+
+from .log_stats import stats_summary
 
 load_dotenv()
 
@@ -83,3 +86,18 @@ def retrieve_incident_logs(
         return list(cursor)
     except PyMongoError:
         return []
+
+
+# ============================================================
+# 🆕 INGEST-TIME LOG STATS (O(1) GRADING)
+# ============================================================
+def retrieve_log_stats(project_id: str, service: str) -> Optional[Dict]:
+    """
+    Running {total, errors, distinct_messages} for a project +
+    service, maintained at ingest. None when unknown.
+    """
+    try:
+        doc = _db.log_stats.find_one({"project_id": ObjectId(project_id), "service": service})
+    except (PyMongoError, InvalidId, TypeError):
+        return None
+    return stats_summary(doc)
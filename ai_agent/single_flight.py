@@ -0,0 +1,244 @@
+import asyncio
+import concurrent.futures
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from api_gateway.agent_state import LLM_CLAIM, LLM_RESULT, StateTooLarge, get_state_store
+
+from . import metrics
+
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "1") == "1"
+
+# Also coalesce across workers (and hosts, with the Redis backend)
+# through claims in the agent state store (see SHARED FLIGHTS)
+LLM_SINGLE_FLIGHT_SHARED = os.getenv("LLM_SINGLE_FLIGHT_SHARED", "0") == "1"
+
+# Waiters wake on the store's notifications; this slow poll only
+# covers notifications that were lost
+SHARED_POLL_SECONDS = float(os.getenv("LLM_SINGLE_FLIGHT_POLL", "1"))
+
+
+# ============================================================
+# ✈️ SINGLE-FLIGHT (IDENTICAL CONCURRENT CALLS)
+# ============================================================
+#
+# The first caller for a key (cache key = model + params + prompt)
+# leads and makes the call; callers arriving while it runs follow,
+# waiting on the same future instead of calling the provider again.
+# The future is a concurrent.futures.Future, so followers can be
+# threads (sync _invoke) or asyncio tasks on any loop.
+#
+# A leader that is cancelled or runs out of its own deadline
+# "abandons" the flight: followers don't inherit that, they retry
+# (one of them becomes the new leader). Any other error is shared.
+
+class FlightAbandoned(Exception):
+    pass
+
+
+class Flight:
+    def __init__(self):
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def wait(self, timeout: float) -> str:
+        """
+        The leader's answer; concurrent.futures.TimeoutError after
+        `timeout` seconds (the caller's remaining deadline).
+        """
+        return self.future.result(timeout=max(timeout, 0))
+
+    async def await_result(self, timeout: float) -> str:
+        # shield: a follower timing out must not cancel the shared future
+        return await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(self.future)),
+            timeout=max(timeout, 0),
+        )
+
+
+_FLIGHTS: Dict[str, Flight] = {}
+_LOCK = threading.Lock()
+
+
+def join(key: str) -> Tuple[Optional[Flight], bool]:
+    """
+    (flight, True) when the caller leads, (flight, False) when one
+    is already in the air. (None, True) when single-flight is off.
+    """
+    if not LLM_SINGLE_FLIGHT:
+        return None, True
+    with _LOCK:
+        flight = _FLIGHTS.get(key)
+        if flight is not None:
+            metrics.incr("llm.coalesced")
+            return flight, False
+        flight = _FLIGHTS[key] = Flight()
+        return flight, True
+
+
+def land(
+    key: str,
+    flight: Optional[Flight],
+    text: Optional[str] = None,
+    error: Optional[BaseException] = None,
+    abandoned: bool = False,
+) -> None:
+    """
+    Resolve the flight for its followers and let the next caller lead.
+    Call after the answer is cached, so nobody in between misses both.
+    """
+    if flight is None:
+        return
+    with _LOCK:
+        if _FLIGHTS.get(key) is flight:
+            del _FLIGHTS[key]
+
+    if abandoned:
+        flight.future.set_exception(FlightAbandoned())
+    elif error is not None:
+        flight.future.set_exception(error)
+    else:
+        flight.future.set_result(text)
+
+
+# ============================================================
+# 🌐 SHARED FLIGHTS (ACROSS WORKERS)
+# ============================================================
+#
+# With LLM_SINGLE_FLIGHT_SHARED, a local leader also claims the key
+# in the agent state store (SET NX PX on Redis, so every worker on
+# every host sees the same claim). The holder calls the provider,
+# publishes the answer under LLM_RESULT and notifies; the others wait
+# for that notification and take the published answer. A holder that
+# fails only releases, and the next waiter claims and calls.
+#
+# Store I/O is blocking, so the async variants run it in a thread
+# and await a future that the notification resolves: nothing polls
+# on the event loop.
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+_WAITERS: Dict[str, List[concurrent.futures.Future]] = {}
+_subscribed_to = None   # the store _on_change is subscribed to
+
+
+def _on_change(namespace: str, key: str) -> None:
+    if namespace not in (LLM_CLAIM, LLM_RESULT):
+        return
+    with _LOCK:
+        waiters = _WAITERS.pop(key, [])
+    for waiter in waiters:
+        try:
+            waiter.set_result(None)
+        except concurrent.futures.InvalidStateError:
+            pass   # its wait already timed out
+
+
+def _watch(key: str) -> concurrent.futures.Future:
+    """
+    A future resolved at the next change to `key`'s claim or result.
+    Registered before the store is read, so a change in between is
+    not missed.
+    """
+    global _subscribed_to
+    waiter: concurrent.futures.Future = concurrent.futures.Future()
+    store = get_state_store()
+    with _LOCK:
+        if _subscribed_to is not store:
+            store.subscribe(_on_change)
+            _subscribed_to = store
+        _WAITERS.setdefault(key, []).append(waiter)
+    return waiter
+
+
+def _unwatch(key: str, waiter: concurrent.futures.Future) -> None:
+    with _LOCK:
+        waiters = _WAITERS.get(key)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del _WAITERS[key]
+
+
+def _try_claim(key: str, ttl: float) -> Tuple[bool, Optional[str]]:
+    """
+    (True, None) when this worker now holds the claim, (False, text)
+    when the answer is already published, (False, None) while
+    another worker holds it.
+    """
+    store = get_state_store()
+    result = store.get(LLM_RESULT, key)
+    if result is None and store.claim(LLM_CLAIM, key, _OWNER, ttl):
+        # the previous holder may have published and released in between
+        result = store.get(LLM_RESULT, key)
+        if result is None:
+            return True, None
+        store.release(LLM_CLAIM, key, _OWNER)
+    return False, result["text"] if result else None
+
+
+def claim_or_wait(key: str, ttl: float, ends_at: float) -> Optional[str]:
+    """
+    None once this worker holds the shared claim on `key`, or the
+    answer the holder published. concurrent.futures.TimeoutError at
+    `ends_at` (time.monotonic()).
+    """
+    while True:
+        waiter = _watch(key)
+        try:
+            claimed, text = _try_claim(key, ttl)
+            if claimed:
+                return None
+            if text is not None:
+                metrics.incr("llm.coalesced_shared")
+                return text
+            left = ends_at - time.monotonic()
+            if left <= 0:
+                raise concurrent.futures.TimeoutError()
+            try:
+                waiter.result(timeout=min(left, SHARED_POLL_SECONDS))
+            except concurrent.futures.TimeoutError:
+                pass
+        finally:
+            _unwatch(key, waiter)
+
+
+async def aclaim_or_wait(key: str, ttl: float, ends_at: float) -> Optional[str]:
+    """
+    claim_or_wait for async paths; asyncio.TimeoutError at `ends_at`.
+    """
+    while True:
+        waiter = _watch(key)
+        try:
+            claimed, text = await asyncio.to_thread(_try_claim, key, ttl)
+            if claimed:
+                return None
+            if text is not None:
+                metrics.incr("llm.coalesced_shared")
+                return text
+            left = ends_at - time.monotonic()
+            if left <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                await asyncio.wait_for(asyncio.wrap_future(waiter), timeout=min(left, SHARED_POLL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            _unwatch(key, waiter)
+
+
+def release(key: str, text: Optional[str] = None) -> None:
+    """
+    Publish the holder's answer (if any), drop the claim and wake
+    the waiters.
+    """
+    store = get_state_store()
+    if text is not None:
+        try:
+            store.set(LLM_RESULT, key, {"text": text})
+        except StateTooLarge:
+            pass   # waiters claim and call themselves
+    store.release(LLM_CLAIM, key, _OWNER)
+    store.notify(LLM_CLAIM, key)
@@ -0,0 +1,187 @@
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from .path_index import PathIndex
+
+MAX_SYMBOLS_PER_FILE = 200
+MIN_SYMBOL_LENGTH = 3
+
+# Symbols defined in more files than this ("main", "handler",
+# "render") say nothing about which file is meant.
+MAX_SYMBOL_FANOUT = 5
+
+
+# ============================================================
+# 🔍 EXTRACTION (WATCHER SIDE)
+# ============================================================
+
+# Module-level def/class, and methods one indent level in. A regex
+# rather than `ast`: ~20x cheaper and tolerant of syntax errors.
+_PY_DEF_RE = re.compile(
+    r"^(?:(?:async[ \t]+)?def|class)[ \t]+([A-Za-z_]\w*)"
+    r"|^(?:    |\t)(?:async[ \t]+)?def[ \t]+([A-Za-z_]\w*)",
+    re.M,
+)
+
+_JS_PATTERNS = [
+    # function getUser() / export default async function getUser()
+    re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)", re.M),
+    # class UserService / export abstract class UserService
+    re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)", re.M),
+    # const getUser = async (req) => / = function
+    re.compile(
+        r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*"
+        r"(?:async\s*)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[A-Za-z_$][\w$]*\s*=>)",
+        re.M,
+    ),
+    # exports.getUser = / module.exports.getUser =
+    re.compile(r"^\s*(?:module\.)?exports\.([A-Za-z_$][\w$]*)\s*=", re.M),
+    # interface / type / enum (TypeScript)
+    re.compile(r"^\s*(?:export\s+)?(?:declare\s+)?(?:interface|type|enum)\s+([A-Za-z_$][\w$]*)", re.M),
+    # class methods: "  async getUser(id) {"
+    re.compile(
+        r"^[ \t]+(?:public\s+|private\s+|protected\s+|static\s+|async\s+)*"
+        r"(?!if\b|for\b|while\b|switch\b|catch\b|return\b)([A-Za-z_$][\w$]*)\s*\([^)]*\)\s*(?::[^{]+)?\{",
+        re.M,
+    ),
+]
+
+_PY_EXTENSIONS = {".py"}
+_JS_EXTENSIONS = {".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs"}
+
+
+def supports_symbols(path: str) -> bool:
+    _, ext = os.path.splitext(path)
+    ext = ext.lower()
+    return ext in _PY_EXTENSIONS or ext in _JS_EXTENSIONS
+
+
+def _python_symbols(source: str) -> List[str]:
+    return [top or method for top, method in _PY_DEF_RE.findall(source)]
+
+
+def _js_symbols(source: str) -> List[str]:
+    names = []
+    for pattern in _JS_PATTERNS:
+        names.extend(pattern.findall(source))
+    return names
+
+
+def extract_symbols(path: str, source: str) -> List[str]:
+    """
+    Top-level functions/classes (and their methods) defined in a
+    file, by language-specific regexes.
+    """
+    _, ext = os.path.splitext(path)
+    ext = ext.lower()
+    if ext in _PY_EXTENSIONS:
+        names = _python_symbols(source)
+    elif ext in _JS_EXTENSIONS:
+        names = _js_symbols(source)
+    else:
+        return []
+
+    symbols = [
+        n for n in dict.fromkeys(names)
+        if len(n) >= MIN_SYMBOL_LENGTH and not (n.startswith("__") and n.endswith("__"))
+    ]
+    return symbols[:MAX_SYMBOLS_PER_FILE]
+
+
+# ============================================================
+# 📇 SYMBOL -> FILE INDEX (GATEWAY SIDE)
+# ============================================================
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_$][\w$]{%d,}" % (MIN_SYMBOL_LENGTH - 1))
+
+
+def message_identifiers(messages: Iterable[str]) -> Set[str]:
+    """
+    Identifier-shaped words in log messages ("getUser", "load_user",
+    "UserService.getUser" -> both parts).
+    """
+    found: Set[str] = set()
+    for message in dict.fromkeys(messages):
+        if message:
+            found.update(_IDENTIFIER_RE.findall(message))
+    return found
+
+
+class SymbolIndex:
+    """
+    symbol -> paths, built from the `symbols` list the watcher
+    attaches to structure entries. Patched in place on deltas.
+
+    apply_delta() runs from PathIndex.advance() while requests match,
+    so both take `_lock` (as in FileFeatureIndex).
+    """
+
+    def __init__(self, files: Iterable[Dict] = ()):
+        self.paths: Dict[str, Set[str]] = {}
+        self._by_path: Dict[str, List[str]] = {}
+        self._lock = threading.RLock()
+        for f in files:
+            self._add(f)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _add(self, file: Dict) -> None:
+        path = file.get("path")
+        symbols = file.get("symbols")
+        if not path or not symbols:
+            return
+        self._by_path[path] = symbols
+        for symbol in symbols:
+            self.paths.setdefault(symbol, set()).add(path)
+
+    def _remove(self, path: str) -> None:
+        for symbol in self._by_path.pop(path, ()):
+            paths = self.paths.get(symbol)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self.paths[symbol]
+
+    def apply_delta(self, added: List[Dict], modified: List[Dict], removed: List[str]) -> bool:
+        with self._lock:
+            for path in removed:
+                self._remove(path)
+            for f in [*added, *modified]:
+                # entries without "symbols" keep what was indexed before
+                if "symbols" in f:
+                    self._remove(f.get("path"))
+                    self._add(f)
+        return True
+
+    def lookup(self, symbol: str) -> List[str]:
+        with self._lock:
+            return sorted(self.paths.get(symbol, ()))
+
+    def match(self, identifiers: Iterable[str]) -> Dict[str, float]:
+        """
+        path -> relevance in [0, 1]. A symbol defined in one file is
+        worth 1.0, split across files otherwise; very common symbols
+        are skipped.
+        """
+        relevance: Dict[str, float] = {}
+        with self._lock:
+            for name in identifiers:
+                paths = self.paths.get(name)
+                if not paths or len(paths) > MAX_SYMBOL_FANOUT:
+                    continue
+                share = 1.0 / len(paths)
+                for path in paths:
+                    relevance[path] = min(relevance.get(path, 0.0) + share, 1.0)
+        return relevance
+
+
+def get_symbol_index(path_index: Optional[PathIndex]) -> Optional[SymbolIndex]:
+    if path_index is None:
+        return None
+    return path_index.derived(
+        "symbols",
+        lambda index: SymbolIndex(index.files()),
+    )
@@ -0,0 +1,157 @@
+import math
+import os
+import re
+from typing import Dict, Iterable, List, Set
+
+# Field weights: how strongly a log token hitting this part of a
+# path points at the file.
+BASENAME_WEIGHT = 1.0   # "user_service.py"
+MODULE_WEIGHT = 1.0     # "services.user_service", "com.acme.userservice"
+STEM_WEIGHT = 0.6       # "user_service"
+DIR_WEIGHT = 0.2        # "services"
+
+# Tokens in a large share of files carry ~no signal; skipping them
+# keeps match cost independent of repository size.
+MIN_IDF = 0.1
+
+_LOG_TOKEN_RE = re.compile(r"[a-z0-9_.\-/\\$]+")
+
+
+# ============================================================
+# 🔹 TOKENIZATION
+# ============================================================
+
+def log_tokens(messages: Iterable[str]) -> Set[str]:
+    """
+    Candidate path tokens mentioned in log messages. Each distinct
+    message is tokenized once; cost depends on log text only.
+    """
+    tokens: Set[str] = set()
+    for message in dict.fromkeys(messages):
+        if not message:
+            continue
+        for raw in _LOG_TOKEN_RE.findall(message.lower()):
+            raw = raw.strip(".-$")
+            if not raw:
+                continue
+            tokens.add(raw)
+
+            if "/" in raw or "\\" in raw:
+                segs = [s for s in raw.replace("\\", "/").split("/") if s]
+                tokens.update(segs)
+                if segs:
+                    tokens.add(os.path.splitext(segs[-1])[0])
+            elif "." in raw:
+                # "app.services.user_service" / "user_service.py"
+                parts = raw.split(".")
+                tokens.update(p for p in parts if p)
+                for i in range(1, len(parts) - 1):
+                    tokens.add(".".join(parts[i:]))
+                tokens.add(".".join(parts[:-1]))
+    return tokens
+
+
+# ============================================================
+# 📇 INVERTED INDEX
+# ============================================================
+
+FIELD_WEIGHTS = {
+    "basename": BASENAME_WEIGHT,
+    "module": MODULE_WEIGHT,
+    "stem": STEM_WEIGHT,
+    "dir": DIR_WEIGHT,
+}
+
+
+class PathTokenIndex:
+    """
+    field -> token -> [file ids] over a structure, with BM25-style
+    idf so tokens shared by many files ("index", "utils", "src")
+    count for little.
+
+    Ids are only ever appended; removed files are filtered through
+    the owner's `alive` column at match time.
+    """
+
+    def __init__(self, files: List[Dict] = ()):
+        self.n = 0
+        self.postings: Dict[str, Dict[str, List[int]]] = {f: {} for f in FIELD_WEIGHTS}
+        self._basename = self.postings["basename"]
+        self._stem = self.postings["stem"]
+        self._module = self.postings["module"]
+        self._dir = self.postings["dir"]
+        for i, f in enumerate(files):
+            self.add(i, f["path"])
+
+    def add(self, i: int, path: str) -> None:
+        # path_tokens() inlined: this runs once per file per build
+        self.n += 1
+        segs = [s for s in path.lower().replace("\\", "/").split("/") if s]
+        if not segs:
+            return
+
+        name = segs[-1]
+        dot = name.rfind(".")
+        stem = name[:dot] if dot > 0 else name
+        dirs = segs[:-1]
+
+        self._post(self._basename, name, i)
+        if stem != name:
+            self._post(self._stem, stem, i)
+        for seg in dirs:
+            self._post(self._dir, seg, i)
+
+        module = stem
+        for seg in reversed(dirs):
+            module = seg + "." + module
+            self._post(self._module, module, i)
+
+    @staticmethod
+    def _post(table: Dict[str, List[int]], token: str, i: int) -> None:
+        ids = table.get(token)
+        if ids is None:
+            table[token] = [i]
+        else:
+            ids.append(i)
+
+    def discard(self) -> None:
+        self.n -= 1
+
+    def _idf(self, df: int) -> float:
+        return math.log(1 + (self.n - df + 0.5) / (df + 0.5))
+
+    def idf(self, token: str, field: str = "basename") -> float:
+        """
+        Normalized to 1.0 for a token unique to one file.
+        """
+        ids = self.postings[field].get(token)
+        if not ids or self.n <= 0:
+            return 0.0
+        return self._idf(len(ids)) / (self._idf(1) or 1.0)
+
+    def match(self, tokens: Iterable[str], alive=None) -> Dict[int, float]:
+        """
+        file id -> relevance in [0, 1] for a set of log tokens.
+        """
+        relevance: Dict[int, float] = {}
+        if self.n <= 0:
+            return relevance
+        idf_max = self._idf(1) or 1.0
+
+        for token in tokens:
+            for field, weight in FIELD_WEIGHTS.items():
+                ids = self.postings[field].get(token)
+                if not ids:
+                    continue
+                idf = self._idf(len(ids)) / idf_max
+                if idf < MIN_IDF:
+                    continue
+                for i in ids:
+                    relevance[i] = relevance.get(i, 0.0) + weight * idf
+
+        for i in list(relevance):
+            if alive is not None and not alive[i]:
+                del relevance[i]
+            elif relevance[i] > 1.0:
+                relevance[i] = 1.0
+        return relevance
@@ -0,0 +1,150 @@
+import re
+from typing import Dict, Iterable, List, Optional
+
+from .path_index import PathIndex
+
+MAX_FRAMES = 20
+
+# ============================================================
+# 🔹 FRAME PATTERNS
+# ============================================================
+
+# File "/app/services/user.py", line 42, in get_user
+_PY_FRAME = re.compile(r'File "(?P<path>[^"]+)", line (?P<line>\d+)(?:, in (?P<func>\S+))?')
+
+# at getUser (/app/src/user.js:42:13)  |  at /app/src/user.js:42:13
+_NODE_FRAME = re.compile(
+    r"\bat (?:(?P<func>[^\s(]+) )?\(?(?:file://)?(?P<path>[^\s()]+?\.[cm]?[jt]sx?):(?P<line>\d+)(?::\d+)?\)?"
+)
+
+# at com.acme.user.UserService.getUser(UserService.java:42)
+_JAVA_FRAME = re.compile(
+    r"\bat (?P<func>[\w$.<>]+)\((?P<file>[\w$]+\.(?:java|kt|scala|groovy)):(?P<line>\d+)\)"
+)
+
+_LIBRARY_MARKERS = (
+    "site-packages/",
+    "dist-packages/",
+    "node_modules/",
+    "<frozen ",
+    "node:internal",
+    "/lib/python",
+)
+_JAVA_LIBRARY_PREFIXES = ("java.", "javax.", "jdk.", "sun.", "kotlin.", "scala.")
+
+
+# ============================================================
+# 🔍 EXTRACTION
+# ============================================================
+
+def _is_library(path: str) -> bool:
+    path = path.replace("\\", "/")
+    return any(marker in path for marker in _LIBRARY_MARKERS)
+
+
+def extract_frames(text: str) -> List[Dict]:
+    """
+    Application frames from one log message, innermost first.
+    Handles Python, Node and Java (JVM) traces.
+    """
+    if not text:
+        return []
+
+    frames: List[Dict] = []
+
+    if 'File "' in text:
+        py = []
+        for m in _PY_FRAME.finditer(text):
+            if not _is_library(m.group("path")):
+                py.append({
+                    "path": m.group("path"),
+                    "line": int(m.group("line")),
+                    "function": m.group("func"),
+                    "lang": "python",
+                })
+        # Python prints the innermost frame last
+        frames.extend(reversed(py))
+
+    if "at " in text:
+        for m in _NODE_FRAME.finditer(text):
+            if not _is_library(m.group("path")):
+                frames.append({
+                    "path": m.group("path"),
+                    "line": int(m.group("line")),
+                    "function": m.group("func"),
+                    "lang": "node",
+                })
+
+        for m in _JAVA_FRAME.finditer(text):
+            func = m.group("func")
+            if func.startswith(_JAVA_LIBRARY_PREFIXES):
+                continue
+            # com.acme.user.UserService.getUser -> com/acme/user/UserService.java
+            package = func.rsplit(".", 2)[0] if func.count(".") >= 2 else ""
+            path = m.group("file")
+            if package:
+                path = package.replace(".", "/") + "/" + path
+            frames.append({
+                "path": path,
+                "line": int(m.group("line")),
+                "function": func.rsplit(".", 1)[-1],
+                "lang": "java",
+            })
+
+    return frames
+
+
+def extract_log_frames(logs: Iterable[Dict], limit: int = MAX_FRAMES) -> List[Dict]:
+    """
+    Distinct frames across logs (most recent log first), plus the
+    file/line a log was ingested with.
+    """
+    frames: List[Dict] = []
+    seen = set()
+
+    def add(frame: Dict):
+        key = (frame["path"], frame["line"])
+        if key not in seen:
+            seen.add(key)
+            frames.append(frame)
+
+    for message in dict.fromkeys(log.get("message", "") for log in logs):
+        for frame in extract_frames(message):
+            add(frame)
+            if len(frames) >= limit:
+                return frames
+
+    for log in logs:
+        if log.get("file") and log.get("line") is not None:
+            add({"path": log["file"], "line": log["line"], "function": None, "lang": None})
+            if len(frames) >= limit:
+                break
+
+    return frames
+
+
+# ============================================================
+# 📂 RESOLUTION AGAINST THE STRUCTURE
+# ============================================================
+
+def resolve_frames(frames: List[Dict], path_index: Optional[PathIndex]) -> List[Dict]:
+    """
+    Map frames to structure paths by longest-suffix match
+    (/app/src/api/user.py -> src/api/user.py). Frames that match
+    nothing are dropped; ambiguous ones keep their candidate count.
+    """
+    if not frames or path_index is None:
+        return []
+
+    resolved = []
+    for depth, frame in enumerate(frames):
+        matches = path_index.match_suffix(frame["path"])
+        for path in matches:
+            resolved.append({
+                "path": path,
+                "line": frame.get("line"),
+                "function": frame.get("function"),
+                "depth": depth,
+                "candidates": len(matches),
+            })
+    return resolved
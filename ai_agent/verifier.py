@@ -1,4 +1,7 @@
-from typing import List, Dict
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
 
 
 _STOP_WORDS = {
@@ -7,29 +10,144 @@ _STOP_WORDS = {
     "failed", "failure", "service", "user", "auth", "token",
 }
 
+# Runs of alphanumerics, "." and "_"
+_TOKEN_RE = re.compile(r"[\w.]+")
+
 
 def _extract_tokens(message: str) -> List[str]:
-    tokens = []
-    current = []
-
-    for ch in message:
-        if ch.isalnum() or ch in {".", "_"}:
-            current.append(ch)
-        else:
-            if current:
-                token = "".join(current).lower()
-                if len(token) >= 4 and token not in _STOP_WORDS:
-                    tokens.append(token)
-                current = []
-    if current:
-        token = "".join(current).lower()
-        if len(token) >= 4 and token not in _STOP_WORDS:
-            tokens.append(token)
-
-    return tokens
-
-
-def verify_answer(answer: str, logs: List[Dict]) -> bool:
+    return [
+        token for token in (t.lower() for t in _TOKEN_RE.findall(message))
+        if len(token) >= 4 and token not in _STOP_WORDS
+    ]
+
+
+# ============================================================
+# 🔎 GROUNDING INDEX (AHO-CORASICK)
+# ============================================================
+#
+# Built once per log window: every distinct token of the ERROR logs
+# goes into one automaton, so checking an answer is a single pass
+# over its text however many logs there are.
+
+class GroundingIndex:
+    def __init__(self, logs: List[Dict]):
+        self.error_logs = 0
+        self.tokens: List[str] = []
+        self.token_logs: List[List[str]] = []   # token id -> supporting log ids
+
+        ids: Dict[str, int] = {}
+        for n, log in enumerate(logs):
+            if log.get("level") != "ERROR":
+                continue
+            self.error_logs += 1
+            log_id = str(log.get("_id", n))
+            for token in _extract_tokens(str(log.get("message", ""))):
+                tid = ids.get(token)
+                if tid is None:
+                    tid = ids[token] = len(self.tokens)
+                    self.tokens.append(token)
+                    self.token_logs.append([])
+                if not self.token_logs[tid] or self.token_logs[tid][-1] != log_id:
+                    self.token_logs[tid].append(log_id)
+
+        self._build()
+
+    def _build(self) -> None:
+        # trie: goto[state] = {char: state}; out[state] = token ids ending here
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for tid, token in enumerate(self.tokens):
+            state = 0
+            for ch in token:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(tid)
+
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def matched_tokens(self, answer: str) -> List[int]:
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in answer.lower():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return sorted(found)
+
+    def ground(self, answer: str) -> Dict:
+        """
+        Evidence for an answer: the log tokens it mentions, the ERROR
+        logs those tokens come from, and coverage = share of ERROR
+        logs supported by at least one of them.
+        """
+        matched = self.matched_tokens(answer or "")
+        log_ids: List[str] = []
+        seen = set()
+        for tid in matched:
+            for log_id in self.token_logs[tid]:
+                if log_id not in seen:
+                    seen.add(log_id)
+                    log_ids.append(log_id)
+
+        return {
+            "grounded": bool(matched),
+            "evidence": [self.tokens[tid] for tid in matched],
+            "coverage": round(len(log_ids) / self.error_logs, 2) if self.error_logs else 0.0,
+            "log_ids": log_ids,
+        }
+
+
+_INDEX_CACHE: "OrderedDict[tuple, GroundingIndex]" = OrderedDict()
+_INDEX_CACHE_SIZE = 64
+_INDEX_CACHE_LOCK = threading.Lock()
+
+
+def grounding_index(logs: List[Dict]) -> GroundingIndex:
+    """
+    Cached per log window, so retries and parallel candidates over
+    the same logs share one automaton. Called from request threads
+    and event loops alike; the build runs outside the lock.
+    """
+    key = tuple(
+        (str(log.get("_id", "")), log.get("level"), str(log.get("message", "")))
+        for log in logs
+    )
+    with _INDEX_CACHE_LOCK:
+        index = _INDEX_CACHE.get(key)
+        if index is not None:
+            _INDEX_CACHE.move_to_end(key)
+            return index
+
+    index = GroundingIndex(logs)
+    with _INDEX_CACHE_LOCK:
+        index = _INDEX_CACHE.setdefault(key, index)
+        _INDEX_CACHE.move_to_end(key)
+        while len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    return index
+
+
+def verify_answer(answer: str, logs: List[Dict], index: Optional[GroundingIndex] = None) -> bool:
     """
     Simple grounding verification.
 
@@ -39,17 +157,5 @@ def verify_answer(answer: str, logs: List[Dict]) -> bool:
     if not answer or not logs:
         return False
 
-    ans = answer.lower()
-
-    for log in logs:
-        if log.get("level") != "ERROR":
-            continue
-
-        message = str(log.get("message", ""))
-        tokens = _extract_tokens(message)
-
-        for token in tokens:
-            if token in ans:
-                return True
-
-    return False
+    index = index or grounding_index(logs)
+    return bool(index.matched_tokens(answer))
@@ -0,0 +1,712 @@
+# ============================================================
+# 🤖 RADAR LOCAL WATCHER
+# ============================================================
+#
+# Runs on the user's machine next to their code:
+# - pushes the project file structure (full once, then deltas)
+# - answers file requests from the gateway (WebSocket, HTTP poll fallback)
+# - tails log files and ingests them in batches
+#
+#     python -m ai_agent.watcher
+#
+# Config (env): RADAR_API_URL, RADAR_PROJECT_ID, RADAR_PROJECT_SECRET,
+# PROJECT_ROOT, RADAR_LOG_FILES ("service=path,service=path"),
+# RADAR_TRANSPORT (ws | http), RADAR_SYMBOLS (1 | 0).
+
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import re
+import select
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+# Runs on user machines: nothing from the gateway's server stack
+# (fastapi, the state store) may be imported here.
+from .agent_client import GatewayClient, GatewaySocket
+from .file_rules import DENY_DIR_NAMES, _is_allowed_file
+from .symbols import extract_symbols, supports_symbols
+
+load_dotenv()
+
+PROJECT_ROOT = os.path.realpath(os.getenv("PROJECT_ROOT", "").strip() or ".")
+
+SCAN_DEBOUNCE_SECONDS = float(os.getenv("RADAR_DEBOUNCE", "0.5"))
+POLL_INTERVAL_SECONDS = float(os.getenv("RADAR_POLL_INTERVAL", "2"))
+FULL_RESCAN_EVERY = int(os.getenv("RADAR_FULL_RESCAN_EVERY", "150"))
+LOG_BATCH_SIZE = 100
+# Records kept while the gateway is unreachable (oldest dropped first)
+MAX_LOG_BACKLOG = int(os.getenv("RADAR_MAX_LOG_BACKLOG", "10000"))
+# Longest wait between full-push retries while the gateway is down
+MAX_RESYNC_BACKOFF_SECONDS = 60.0
+SYMBOLS_ENABLED = os.getenv("RADAR_SYMBOLS", "1") == "1"
+MAX_SYMBOL_FILE_BYTES = 512 * 1024
+
+# Directories changed this recently are re-listed on the next scan too,
+# since a second write inside the same mtime tick would go unnoticed.
+_RACY_MTIME_NS = 2_000_000_000
+
+
+# ============================================================
+# 📂 INCREMENTAL SCANNER
+# ============================================================
+
+class _DirState:
+    __slots__ = ("mtime_ns", "files", "subdirs")
+
+    def __init__(self, mtime_ns: int, files: Dict[str, Tuple[int, int]], subdirs: List[str]):
+        self.mtime_ns = mtime_ns
+        self.files = files        # name -> (size, mtime_ns)
+        self.subdirs = subdirs    # relative dir paths
+
+
+class FileScanner:
+    """
+    Walks the project with os.scandir and keeps a per-directory
+    mtime cache. A rescan stats every directory but only lists and
+    stats the files of directories whose mtime moved (or that were
+    marked dirty by inotify), and yields a delta.
+
+    Editing a file in place does not touch its directory's mtime, so
+    without inotify pass check_files=True: the files of unchanged
+    directories are stat'ed too.
+    """
+
+    def __init__(self, root: str = PROJECT_ROOT):
+        self.root = os.path.realpath(root)
+        self._dirs: Dict[str, _DirState] = {}
+        self._dirty: Set[str] = set()
+
+    def mark_dirty(self, rel_dir: str) -> None:
+        self._dirty.add(rel_dir)
+
+    def directories(self) -> List[str]:
+        return list(self._dirs)
+
+    def snapshot(self) -> List[Dict]:
+        files = []
+        for rel_dir, state in self._dirs.items():
+            for name, (size, mtime_ns) in state.files.items():
+                files.append(_file_entry(rel_dir, name, size, mtime_ns))
+        return files
+
+    def scan(self, full: bool = False, check_files: bool = False) -> Dict[str, List]:
+        """
+        Returns {added, modified, removed} since the previous scan.
+        """
+        added: List[Dict] = []
+        modified: List[Dict] = []
+        removed: List[str] = []
+
+        seen: Set[str] = set()
+        stack = [""]
+        now_ns = time.time_ns()
+
+        while stack:
+            rel_dir = stack.pop()
+            abs_dir = os.path.join(self.root, rel_dir)
+            try:
+                mtime_ns = os.stat(abs_dir).st_mtime_ns
+            except OSError:
+                continue
+
+            seen.add(rel_dir)
+            old = self._dirs.get(rel_dir)
+
+            if (
+                full
+                or old is None
+                or old.mtime_ns != mtime_ns
+                or rel_dir in self._dirty
+                or now_ns - mtime_ns < _RACY_MTIME_NS
+            ):
+                new = self._list_dir(rel_dir, abs_dir, mtime_ns)
+                self._diff_dir(rel_dir, old, new, added, modified, removed)
+                self._dirs[rel_dir] = new
+                stack.extend(new.subdirs)
+            else:
+                if check_files:
+                    self._check_files(rel_dir, abs_dir, old, modified)
+                stack.extend(old.subdirs)
+
+        for rel_dir in [d for d in self._dirs if d not in seen]:
+            state = self._dirs.pop(rel_dir)
+            removed.extend(_join(rel_dir, name) for name in state.files)
+
+        self._dirty.clear()
+        return {"added": added, "modified": modified, "removed": removed}
+
+    def _list_dir(self, rel_dir: str, abs_dir: str, mtime_ns: int) -> _DirState:
+        files: Dict[str, Tuple[int, int]] = {}
+        subdirs: List[str] = []
+
+        try:
+            with os.scandir(abs_dir) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in DENY_DIR_NAMES:
+                                subdirs.append(_join(rel_dir, entry.name))
+                        elif entry.is_file(follow_symlinks=False) and _is_allowed_file(entry.name):
+                            st = entry.stat(follow_symlinks=False)
+                            files[entry.name] = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+
+        return _DirState(mtime_ns, files, subdirs)
+
+    @staticmethod
+    def _check_files(rel_dir: str, abs_dir: str, state: _DirState, modified: List[Dict]) -> None:
+        # removals/additions move the directory mtime; only edits land here
+        for name, meta in state.files.items():
+            try:
+                st = os.stat(os.path.join(abs_dir, name), follow_symlinks=False)
+            except OSError:
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != meta:
+                state.files[name] = current
+                modified.append(_file_entry(rel_dir, name, *current))
+
+    @staticmethod
+    def _diff_dir(rel_dir, old, new, added, modified, removed) -> None:
+        old_files = old.files if old else {}
+
+        for name, meta in new.files.items():
+            prev = old_files.get(name)
+            if prev is None:
+                added.append(_file_entry(rel_dir, name, *meta))
+            elif prev != meta:
+                modified.append(_file_entry(rel_dir, name, *meta))
+
+        for name in old_files:
+            if name not in new.files:
+                removed.append(_join(rel_dir, name))
+
+
+def _join(rel_dir: str, name: str) -> str:
+    return f"{rel_dir}/{name}" if rel_dir else name
+
+
+def _file_entry(rel_dir: str, name: str, size: int, mtime_ns: int) -> Dict:
+    return {"path": _join(rel_dir, name), "size": size, "mtime": mtime_ns // 1_000_000_000}
+
+
+# ============================================================
+# 🏷️ SYMBOL EXTRACTION (INCREMENTAL)
+# ============================================================
+
+class SymbolCache:
+    """
+    Top-level symbols per file, keyed by content hash. Unchanged
+    files (same size/mtime) are not read again; changed files are
+    read and hashed, and only parsed when the hash is new, so
+    reverts, copies and branch switches cost a read, not a parse.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._stamps: Dict[str, Tuple[int, int, str]] = {}   # path -> (size, mtime, hash)
+        self._by_hash: Dict[str, List[str]] = {}
+
+    def annotate(self, entries: List[Dict], changed: bool = False) -> None:
+        """
+        Set entry["symbols"] on supported files. `changed` entries come
+        from a scan delta and are always re-read.
+        """
+        for entry in entries:
+            if supports_symbols(entry["path"]):
+                symbols = self._symbols_for(entry, changed)
+                if symbols is not None:
+                    entry["symbols"] = symbols
+
+    def _symbols_for(self, entry: Dict, changed: bool) -> Optional[List[str]]:
+        path = entry["path"]
+        size, mtime = entry.get("size", 0), entry.get("mtime", 0)
+
+        stamp = self._stamps.get(path)
+        if not changed and stamp is not None and stamp[:2] == (size, mtime):
+            return self._by_hash.get(stamp[2], [])
+
+        if size > MAX_SYMBOL_FILE_BYTES:
+            return []
+        try:
+            with open(os.path.join(self.root, path), "rb") as f:
+                raw = f.read()
+        except OSError:
+            return None
+
+        digest = hashlib.sha1(raw).hexdigest()
+        symbols = self._by_hash.get(digest)
+        if symbols is None:
+            symbols = extract_symbols(path, raw.decode("utf-8", errors="replace"))
+            self._by_hash[digest] = symbols
+
+        self._stamps[path] = (size, mtime, digest)
+        return symbols
+
+    def forget(self, paths: List[str]) -> None:
+        for path in paths:
+            self._stamps.pop(path, None)
+
+    def prune(self) -> None:
+        live = {stamp[2] for stamp in self._stamps.values()}
+        for digest in [d for d in self._by_hash if d not in live]:
+            del self._by_hash[digest]
+
+
+# ============================================================
+# 👀 INOTIFY (LINUX) WITH POLLING FALLBACK
+# ============================================================
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+    | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_ONLYDIR
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """
+    Minimal ctypes binding: one watch per directory, events are
+    reported as the relative directories that changed.
+    """
+
+    def __init__(self, root: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._libc = libc
+        self.root = root
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wd_to_dir: Dict[int, str] = {}
+        self._dir_to_wd: Dict[str, int] = {}
+
+    def watch(self, rel_dirs: List[str]) -> None:
+        for rel_dir in rel_dirs:
+            if rel_dir in self._dir_to_wd:
+                continue
+            path = os.path.join(self.root, rel_dir).encode()
+            wd = self._libc.inotify_add_watch(self.fd, path, _WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+            self._wd_to_dir[wd] = rel_dir
+            self._dir_to_wd[rel_dir] = wd
+
+    def read(self, timeout: float) -> Tuple[Set[str], bool]:
+        """
+        Returns (changed relative dirs, overflowed).
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set(), False
+
+        changed: Set[str] = set()
+        overflow = False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed, overflow
+
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size + length
+
+            if mask & _IN_Q_OVERFLOW:
+                overflow = True
+                continue
+
+            rel_dir = self._wd_to_dir.get(wd)
+            if rel_dir is None:
+                continue
+            changed.add(rel_dir)
+
+            if mask & (_IN_IGNORED | _IN_DELETE_SELF):
+                self._wd_to_dir.pop(wd, None)
+                self._dir_to_wd.pop(rel_dir, None)
+
+        return changed, overflow
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+# ============================================================
+# 📜 LOG TAILING
+# ============================================================
+
+_LEVEL_RE = re.compile(r"\b(CRITICAL|FATAL|ERROR|WARN(?:ING)?|INFO|DEBUG)\b")
+_CONTINUATION_RE = re.compile(r"^(\s+|Traceback |Caused by:|During handling|The above exception)")
+# Last line of a Python traceback: "ValueError: bad input"
+_EXCEPTION_LINE_RE = re.compile(r"^[A-Za-z_][\w.]*(Error|Exception|Exit|Interrupt|Warning)\b")
+
+
+class LogTailer:
+    """
+    Follows one log file across rotation. Indented / traceback
+    continuation lines are folded into the previous record so a
+    traceback is ingested as one message.
+    """
+
+    def __init__(self, service: str, path: str):
+        self.service = service
+        self.path = path
+        self._inode: Optional[int] = None
+        self._offset = 0
+        self._partial = ""
+
+    def read_records(self) -> List[Dict]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return []
+
+        if self._inode is None:
+            # start at the end: only new lines are ingested
+            self._inode, self._offset = st.st_ino, st.st_size
+            return []
+
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._inode, self._offset, self._partial = st.st_ino, 0, ""
+
+        if st.st_size == self._offset:
+            return []
+
+        with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+            f.seek(self._offset)
+            data = f.read()
+            self._offset = f.tell()
+
+        text = self._partial + data
+        lines = text.split("\n")
+        self._partial = lines.pop()
+
+        records: List[Dict] = []
+        in_traceback = False
+        for line in lines:
+            if not line.strip():
+                continue
+            if records and _CONTINUATION_RE.match(line):
+                records[-1]["message"] += "\n" + line
+                if line.startswith("Traceback "):
+                    records[-1]["level"] = "ERROR"
+                    in_traceback = True
+                continue
+            if records and in_traceback and _EXCEPTION_LINE_RE.match(line):
+                records[-1]["message"] += "\n" + line
+                in_traceback = False
+                continue
+            in_traceback = False
+            records.append({
+                "service": self.service,
+                "level": _detect_level(line),
+                "message": line,
+            })
+        return records
+
+
+def _detect_level(line: str) -> str:
+    m = _LEVEL_RE.search(line)
+    if not m:
+        return "ERROR" if line.startswith("Traceback ") else "INFO"
+
+    level = m.group(1)
+    if level in ("CRITICAL", "FATAL"):
+        return "ERROR"
+    if level.startswith("WARN"):
+        return "WARNING"
+    return level
+
+
+def _parse_log_files(spec: str) -> List[LogTailer]:
+    tailers = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        service, _, path = item.partition("=")
+        if not path:
+            service, path = "backend", service
+        tailers.append(LogTailer(service.strip(), path.strip()))
+    return tailers
+
+
+# ============================================================
+# 🤖 WATCHER
+# ============================================================
+
+class Watcher:
+    def __init__(
+        self,
+        client: GatewayClient,
+        root: str = PROJECT_ROOT,
+        tailers: Optional[List[LogTailer]] = None,
+        transport: str = "ws",
+    ):
+        self.client = client
+        self.scanner = FileScanner(root)
+        self.symbols = SymbolCache(self.scanner.root) if SYMBOLS_ENABLED else None
+        self.tailers = tailers or []
+        self.transport = transport
+        self.version: Optional[int] = None
+        self.socket: Optional[GatewaySocket] = None
+        self.inotify: Optional[Inotify] = None
+        self._stop = threading.Event()
+        self._log_backlog: List[Dict] = []
+        self._push_failures = 0
+        self._resync_at = 0.0
+
+    # ---------- structure ----------
+
+    def _push(self, payload: Dict) -> Dict:
+        if self.socket is not None and not self.socket.closed.is_set():
+            try:
+                return self.socket.request({"type": "structure", **payload})
+            except Exception:
+                self.socket = None
+        return self.client.push_structure(payload)
+
+    def push_full(self) -> None:
+        """
+        On failure the version is cleared and retried from the main
+        loop with exponential backoff.
+        """
+        try:
+            files = self.scanner.snapshot()
+            if self.symbols is not None:
+                self.symbols.annotate(files)
+                self.symbols.prune()
+            result = self._push({"files": files})
+        except Exception:
+            self.version = None
+            self._push_failures += 1
+            self._resync_at = time.monotonic() + min(2.0 ** self._push_failures, MAX_RESYNC_BACKOFF_SECONDS)
+            raise
+        self.version = result.get("version")
+        self._push_failures = 0
+
+    def push_delta(self, delta: Dict) -> None:
+        if any(delta.values()) and self.symbols is not None:
+            self.symbols.forget(delta["removed"])
+            self.symbols.annotate(delta["added"] + delta["modified"], changed=True)
+        if self.version is None:
+            # never pushed, or the last push failed: resync in full
+            if time.monotonic() >= self._resync_at:
+                self.push_full()
+            return
+        if not any(delta.values()):
+            return
+
+        result = self._push({"mode": "delta", "base_version": self.version, **delta})
+        if result.get("status") == "resync_required":
+            return self.push_full()
+        self.version = result.get("version")
+
+    # ---------- file requests ----------
+
+    def serve_file(self, path: str, request_id: Optional[str] = None) -> None:
+        content = _read_allowed(self.scanner.root, path)
+        if content is None:
+            return
+
+        if self.socket is not None and not self.socket.closed.is_set():
+            try:
+                self.socket.send({
+                    "type": "file_content",
+                    "id": request_id,
+                    "path": path,
+                    "content": content,
+                })
+                return
+            except Exception:
+                self.socket = None
+        self.client.send_file(path, content, request_id)
+
+    def _poll_loop(self) -> None:
+        while not self._stop.is_set():
+            if self.socket is None or self.socket.closed.is_set():
+                try:
+                    req = self.client.poll()
+                    if req:
+                        self.serve_file(req["path"], req.get("request_id"))
+                except Exception:
+                    pass
+            self._stop.wait(1.0)
+
+    # ---------- logs ----------
+
+    def flush_logs(self) -> None:
+        """
+        Records that fail to send stay in a backlog (up to
+        MAX_LOG_BACKLOG, oldest dropped first) and go out with the
+        next flush. A batch the gateway rejects (4xx) is dropped, as
+        sending it again cannot succeed.
+        """
+        for tailer in self.tailers:
+            self._log_backlog.extend(tailer.read_records())
+
+        while self._log_backlog:
+            batch = self._log_backlog[:LOG_BATCH_SIZE]
+            try:
+                self.client.ingest_logs(batch)
+            except Exception as exc:
+                status = getattr(getattr(exc, "response", None), "status_code", None)
+                if status is None or status >= 500 or status == 429:
+                    break   # gateway unreachable or overloaded: retry next cycle
+            del self._log_backlog[:len(batch)]
+
+        overflow = len(self._log_backlog) - MAX_LOG_BACKLOG
+        if overflow > 0:
+            del self._log_backlog[:overflow]
+
+    # ---------- main loop ----------
+
+    def _connect_socket(self) -> None:
+        if self.transport != "ws":
+            return
+        try:
+            socket = GatewaySocket(
+                self.client.api_url,
+                self.client.project_id,
+                self.client.project_secret,
+                on_file_request=self.serve_file,
+            )
+            socket.connect()
+            self.socket = socket
+        except Exception:
+            self.socket = None  # HTTP fallback
+
+    def _start_inotify(self) -> None:
+        try:
+            self.inotify = Inotify(self.scanner.root)
+            self.inotify.watch(self.scanner.directories())
+        except (OSError, AttributeError):
+            if self.inotify is not None:
+                self.inotify.close()
+            self.inotify = None  # polling fallback
+
+    def _wait_for_changes(self) -> bool:
+        """
+        Block until something changed (debounced) or the poll
+        interval passed. Returns True when a full rescan is needed.
+        """
+        if self.inotify is None:
+            self._stop.wait(POLL_INTERVAL_SECONDS)
+            return False
+
+        changed, overflow = self.inotify.read(POLL_INTERVAL_SECONDS)
+        if not changed and not overflow:
+            return False
+
+        deadline = time.monotonic() + SCAN_DEBOUNCE_SECONDS * 4
+        while time.monotonic() < deadline:
+            more, more_overflow = self.inotify.read(SCAN_DEBOUNCE_SECONDS)
+            overflow = overflow or more_overflow
+            if not more:
+                break
+            changed |= more
+
+        for rel_dir in changed:
+            self.scanner.mark_dirty(rel_dir)
+        return overflow
+
+    def run(self) -> None:
+        self.scanner.scan(full=True)
+        self._connect_socket()
+        try:
+            self.push_full()
+        except Exception:
+            pass   # retried by push_delta once the backoff passes
+        self._start_inotify()
+
+        threading.Thread(target=self._poll_loop, daemon=True).start()
+
+        cycles = 0
+        while not self._stop.is_set():
+            full = self._wait_for_changes()
+            cycles += 1
+
+            if self.socket is None or self.socket.closed.is_set():
+                self._connect_socket()
+
+            try:
+                self.push_delta(self.scanner.scan(
+                    full=full or cycles % FULL_RESCAN_EVERY == 0,
+                    check_files=self.inotify is None,
+                ))
+            except Exception:
+                self.version = None  # next cycle resyncs
+
+            if self.inotify is not None:
+                try:
+                    self.inotify.watch(self.scanner.directories())
+                except OSError:
+                    self.inotify.close()
+                    self.inotify = None
+
+            self.flush_logs()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self.socket is not None:
+            self.socket.close()
+
+
+def _read_allowed(root: str, rel_path: str) -> Optional[str]:
+    """
+    Same guards as the gateway's local mode: inside the project root,
+    allowed extension, never a secret file.
+    """
+    abs_path = os.path.realpath(os.path.join(root, rel_path))
+    if os.path.commonpath([root, abs_path]) != root:
+        return None
+    if not _is_allowed_file(abs_path) or not os.path.isfile(abs_path):
+        return None
+
+    try:
+        with open(abs_path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def main() -> None:
+    client = GatewayClient(
+        api_url=os.getenv("RADAR_API_URL", "http://localhost:8000"),
+        project_id=os.environ["RADAR_PROJECT_ID"],
+        project_secret=os.environ["RADAR_PROJECT_SECRET"],
+    )
+    watcher = Watcher(
+        client,
+        root=PROJECT_ROOT,
+        tailers=_parse_log_files(os.getenv("RADAR_LOG_FILES", "")),
+        transport=os.getenv("RADAR_TRANSPORT", "ws"),
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+
+
+if __name__ == "__main__":
+    main()
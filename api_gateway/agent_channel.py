@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import secrets
+from typing import Dict, Optional, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+
+from .agent_state import (
+    FILE_REQUEST,
+    get_state_store,
+    record_file_content,
+)
+from .structure_sync import handle_structure_payload
+
+
+# ============================================================
+# 🔌 WATCHER WEBSOCKET CHANNEL
+# ============================================================
+#
+# One authenticated socket per watcher, multiplexing:
+#
+#   watcher -> gateway
+#     { type: "structure",    id, ...structure payload }
+#     { type: "file_content", id, path, content }
+#     { type: "ping",         id }
+#
+#   gateway -> watcher
+#     { type: "structure_ack", id, ...result }
+#     { type: "file_request",  id, path }
+#     { type: "pong",          id }
+#     { type: "error",         id, detail }
+#
+# `id` correlates a reply with its request. A frame that is not a
+# JSON object, or whose handler fails, gets an "error" reply and the
+# socket stays open. HTTP endpoints remain the fallback for watchers
+# without a socket.
+#
+# File requests raised in other workers reach the socket through the
+# state store's change notifications (Redis pub/sub when shared); a
+# slow poll covers notifications lost while reconnecting.
+
+STORE_POLL_INTERVAL = float(os.getenv("AGENT_STORE_POLL_INTERVAL", "10"))
+
+# project_id -> live channel (this worker only)
+CHANNELS: Dict[str, "AgentChannel"] = {}
+
+
+class AgentChannel:
+    def __init__(self, project_id: str, websocket: WebSocket):
+        self.project_id = project_id
+        self.websocket = websocket
+        self.loop = asyncio.get_running_loop()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._send_lock = asyncio.Lock()
+        self._forwarded: Optional[str] = None
+        self._wake = asyncio.Event()
+
+    async def send(self, message: Dict) -> None:
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    async def request_file(self, path: str, timeout: float) -> Optional[str]:
+        request_id = secrets.token_hex(8)
+        future = self.loop.create_future()
+        self._pending[request_id] = future
+
+        try:
+            await self.send({"type": "file_request", "id": request_id, "path": path})
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, WebSocketDisconnect, RuntimeError):
+            return None
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def serve(self) -> None:
+        previous = CHANNELS.get(self.project_id)
+        CHANNELS[self.project_id] = self
+        if previous is not None:
+            await previous.close()
+
+        _subscribe_once()
+        forwarder = asyncio.create_task(self._forward_store_requests())
+        try:
+            while True:
+                try:
+                    raw = await self.websocket.receive_text()
+                except KeyError:   # binary frame
+                    await self._error(None, "Expected a text frame")
+                    continue
+                await self._handle(raw)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            forwarder.cancel()
+            if CHANNELS.get(self.project_id) is self:
+                del CHANNELS[self.project_id]
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_result(None)
+
+    async def close(self) -> None:
+        try:
+            await self.websocket.close()
+        except RuntimeError:
+            pass
+
+    async def _error(self, message_id, detail: str) -> None:
+        await self.send({"type": "error", "id": message_id, "detail": detail})
+
+    async def _handle(self, raw: str) -> None:
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            await self._error(None, "Invalid JSON frame")
+            return
+        if not isinstance(message, dict):
+            await self._error(None, "Frame must be a JSON object")
+            return
+
+        try:
+            await self._dispatch(message)
+        except WebSocketDisconnect:
+            raise
+        except Exception as exc:
+            await self._error(message.get("id"), str(exc) or type(exc).__name__)
+
+    async def _dispatch(self, message: Dict) -> None:
+        kind = message.get("type")
+        message_id = message.get("id")
+
+        if kind == "structure":
+            result = await run_in_threadpool(
+                handle_structure_payload, self.project_id, message
+            )
+            await self.send({"type": "structure_ack", "id": message_id, **result})
+
+        elif kind == "file_content":
+            path = message.get("path")
+            content = message.get("content")
+            await run_in_threadpool(
+                record_file_content, self.project_id, path, content, message_id
+            )
+
+            future = self._pending.get(message_id)
+            if future is not None and not future.done():
+                future.set_result(content)
+
+        elif kind == "ping":
+            await self.send({"type": "pong", "id": message_id})
+
+        else:
+            await self._error(message_id, f"Unknown message type: {kind}")
+
+    async def _forward_store_requests(self) -> None:
+        # Requests raised in other workers only reach the state store.
+        store = get_state_store()
+        while True:
+            self._wake.clear()
+            req = await run_in_threadpool(store.get, FILE_REQUEST, self.project_id)
+            if (
+                req
+                and req.get("status") == "WAITING"
+                and req.get("request_id") != self._forwarded
+            ):
+                self._forwarded = req.get("request_id")
+                await self.send({
+                    "type": "file_request",
+                    "id": req.get("request_id"),
+                    "path": req["path"],
+                })
+            try:
+                await asyncio.wait_for(self._wake.wait(), STORE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+def _on_store_change(namespace: str, key: str) -> None:
+    channel = CHANNELS.get(key) if namespace == FILE_REQUEST else None
+    if channel is not None:
+        channel.loop.call_soon_threadsafe(channel._wake.set)
+
+
+_subscribed = False
+
+
+def _subscribe_once() -> None:
+    global _subscribed
+    if not _subscribed:
+        _subscribed = True
+        get_state_store().subscribe(_on_store_change)
+
+
+def request_file_via_channel(
+    project_id: str,
+    path: str,
+    timeout: float = 3.0,
+) -> Tuple[bool, Optional[str]]:
+    """
+    Blocking bridge for sync callers (threadpool endpoints).
+
+    Returns (handled, content). handled is False when this worker
+    holds no socket for the project and the caller should fall back
+    to the state store.
+    """
+    channel = CHANNELS.get(project_id)
+    if channel is None:
+        return False, None
+
+    future = asyncio.run_coroutine_threadsafe(
+        channel.request_file(path, timeout), channel.loop
+    )
+    try:
+        return True, future.result(timeout + 0.5)
+    except Exception:
+        return True, None
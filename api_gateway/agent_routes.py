@@ -1,34 +1,84 @@
-from fastapi import APIRouter, HTTPException
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
 from bson import ObjectId
+from bson.errors import InvalidId
+import json
+import time
 
 from .db import db
 from .agent_state import (
-    FILE_STRUCTURE_CACHE,
-    FILE_REQUEST_CACHE,
-    FILE_CONTENT_CACHE,
+    FILE_REQUEST,
+    StateTooLarge,
+    get_state_store,
+    record_file_content,
+    record_file_request,
 )
+from .agent_channel import AgentChannel
+from .uploads import (
+    CHUNK_SIZE,
+    CHUNKED_UPLOAD_THRESHOLD,
+    MAX_FILE_CONTENT_BYTES,
+    append_chunk,
+    finish_upload,
+    get_upload,
+    json_body_limit,
+    max_file_bytes,
+    read_body,
+    start_upload,
+)
+from .structure_sync import handle_structure_payload
 
 router = APIRouter()
-@router.post("/agent/structure")
-def receive_structure(payload: dict):
-    project_id = payload.get("project_id")
-    project_secret = payload.get("project_secret")
-    files = payload.get("files", [])
+
+# ============================================================
+# 🔐 WATCHER AUTH (CACHED)
+# ============================================================
+#
+# Watchers hit these endpoints every few seconds; a short-lived
+# cache keeps each call from re-authenticating against Mongo.
+
+AGENT_AUTH_TTL_SECONDS = 60
+_AUTH_CACHE: dict = {}
+
+
+def _get_agent_project(project_id, project_secret):
+    key = (project_id, project_secret)
+    cached = _AUTH_CACHE.get(key)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    try:
+        oid = ObjectId(project_id)
+    except (InvalidId, TypeError):
+        return None
 
     project = db.projects.find_one({
-        "_id": ObjectId(project_id),
+        "_id": oid,
         "project_secret": project_secret
     })
+    if project:
+        if len(_AUTH_CACHE) > 10_000:
+            _AUTH_CACHE.clear()
+        _AUTH_CACHE[key] = (project, time.monotonic() + AGENT_AUTH_TTL_SECONDS)
+    return project
+
+
+@router.post("/agent/structure")
+def receive_structure(payload: dict):
+    """
+    Full push:  { files: [...] }
+    Delta push: { mode: "delta", base_version, added, modified, removed }
+    """
+    project_id = payload.get("project_id")
+
+    project = _get_agent_project(project_id, payload.get("project_secret"))
     if not project:
         raise HTTPException(403, "Invalid project")
 
-    FILE_STRUCTURE_CACHE[project_id] = {
-        "files": files,
-        "updated_at": datetime.utcnow()
-    }
-
-    return {"status": "structure_received", "count": len(files)}
+    try:
+        return handle_structure_payload(project_id, payload)
+    except StateTooLarge as exc:
+        raise HTTPException(413, str(exc))
 
 
 @router.post("/agent/request-file")
@@ -36,49 +86,169 @@ def request_file(payload: dict):
     project_id = payload.get("project_id")
     path = payload.get("path")
 
-    FILE_REQUEST_CACHE[project_id] = {
-        "path": path,
-        "status": "WAITING"
-    }
+    record_file_request(project_id, path)
 
     return {"status": "requested", "path": path}
 @router.get("/agent/poll")
 def poll(project_id: str, project_secret: str):
-    project = db.projects.find_one({
-        "_id": ObjectId(project_id),
-        "project_secret": project_secret
-    })
+    project = _get_agent_project(project_id, project_secret)
     if not project:
         raise HTTPException(403, "Invalid project")
 
-    req = FILE_REQUEST_CACHE.get(project_id)
+    req = get_state_store().get(FILE_REQUEST, project_id)
     if not req or req["status"] != "WAITING":
         return {"file": None}
 
-    return {"file": req["path"]}
+    return {"file": req["path"], "request_id": req.get("request_id")}
 
 
 @router.post("/agent/file-content")
-def receive_file(payload: dict):
+async def receive_file(request: Request):
+    """
+    JSON body { project_id, project_secret, path, content },
+    optionally sent with Content-Encoding: gzip | zstd.
+
+    Sending X-Project-Id / X-Project-Secret headers lets the
+    project's own size cap apply before the body is read.
+    """
+    header_project_id = request.headers.get("x-project-id")
+    cap = MAX_FILE_CONTENT_BYTES
+    project = None
+
+    if header_project_id:
+        project = await run_in_threadpool(
+            _get_agent_project,
+            header_project_id,
+            request.headers.get("x-project-secret"),
+        )
+        if not project:
+            raise HTTPException(403, "Invalid project")
+        cap = max_file_bytes(project)
+
+    body = await read_body(request, json_body_limit(cap))
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(400, "Invalid JSON body")
+    if not isinstance(payload, dict):
+        raise HTTPException(400, "JSON body must be an object")
+
     project_id = payload.get("project_id")
-    project_secret = payload.get("project_secret")
     path = payload.get("path")
     content = payload.get("content")
 
-    project = db.projects.find_one({
-        "_id": ObjectId(project_id),
-        "project_secret": project_secret
-    })
+    if project is None or str(project["_id"]) != project_id:
+        project = await run_in_threadpool(
+            _get_agent_project,
+            project_id,
+            payload.get("project_secret"),
+        )
+        if not project:
+            raise HTTPException(403, "Invalid project")
+
+    if content and len(content.encode("utf-8")) > max_file_bytes(project):
+        raise HTTPException(413, "File content exceeds the project size limit")
+
+    await run_in_threadpool(
+        record_file_content, project_id, path, content, payload.get("request_id")
+    )
+
+    return {"status": "file_received"}
+
+
+# ============================================================
+# 📦 CHUNKED FILE UPLOAD (LARGE FILES, RESUMABLE)
+# ============================================================
+
+@router.post("/agent/file-content/chunks")
+def start_chunked_upload(payload: dict):
+    project_id = payload.get("project_id")
+    project = _get_agent_project(project_id, payload.get("project_secret"))
     if not project:
         raise HTTPException(403, "Invalid project")
 
-    FILE_CONTENT_CACHE[project_id] = {
-        "path": path,
-        "content": content,
-        "received_at": datetime.utcnow()
+    path = payload.get("path")
+    size = payload.get("size")
+    if not path or not isinstance(size, int) or size < 0:
+        raise HTTPException(400, "path and size are required")
+
+    upload = start_upload(
+        project_id,
+        path,
+        size,
+        payload.get("sha256"),
+        cap=max_file_bytes(project),
+    )
+
+    return {
+        "upload_id": upload["upload_id"],
+        "received": 0,
+        "chunk_size": CHUNK_SIZE,
+        "threshold": CHUNKED_UPLOAD_THRESHOLD,
     }
 
-    if project_id in FILE_REQUEST_CACHE:
-        FILE_REQUEST_CACHE[project_id]["status"] = "RECEIVED"
 
-    return {"status": "file_received"}
+@router.get("/agent/file-content/chunks/{upload_id}")
+def upload_status(upload_id: str, project_id: str, project_secret: str):
+    if not _get_agent_project(project_id, project_secret):
+        raise HTTPException(403, "Invalid project")
+
+    upload = get_upload(upload_id, project_id)
+    return {
+        "upload_id": upload_id,
+        "received": upload["received"],
+        "size": upload["size"],
+    }
+
+
+@router.put("/agent/file-content/chunks/{upload_id}")
+async def upload_chunk(upload_id: str, offset: int, request: Request):
+    """
+    Raw chunk bytes (optionally gzip/zstd encoded) at `offset`.
+    Auth via X-Project-Id / X-Project-Secret headers.
+    """
+    project_id = request.headers.get("x-project-id")
+    project = await run_in_threadpool(
+        _get_agent_project,
+        project_id,
+        request.headers.get("x-project-secret"),
+    )
+    if not project:
+        raise HTTPException(403, "Invalid project")
+
+    upload = await run_in_threadpool(get_upload, upload_id, project_id)
+    remaining = upload["size"] - upload["received"]
+    data = await read_body(request, remaining)
+
+    upload = await run_in_threadpool(append_chunk, upload, offset, data)
+    if upload["received"] < upload["size"]:
+        return {"status": "chunk_received", "received": upload["received"]}
+
+    content = await run_in_threadpool(finish_upload, upload)
+    await run_in_threadpool(record_file_content, project_id, upload["path"], content)
+
+    return {"status": "file_received", "received": upload["received"]}
+
+
+# ============================================================
+# 🔌 WATCHER WEBSOCKET (PREFERRED TRANSPORT)
+# ============================================================
+
+@router.websocket("/agent/ws")
+async def agent_socket(websocket: WebSocket):
+    """
+    Single authenticated channel per watcher. See agent_channel
+    for the message protocol. Credentials come in the handshake's
+    X-Project-Id / X-Project-Secret headers, never in the URL
+    (which ends up in access logs).
+    """
+    project_id = websocket.headers.get("x-project-id")
+    project = await run_in_threadpool(
+        _get_agent_project, project_id, websocket.headers.get("x-project-secret")
+    )
+    if not project:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    await AgentChannel(project_id, websocket).serve()
@@ -1,10 +1,444 @@
+import copy
+import heapq
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, List, Optional
 
-# project_id -> { files, updated_at }
-FILE_STRUCTURE_CACHE = {}
 
-# project_id -> { path, status }
-FILE_REQUEST_CACHE = {}
+# ============================================================
+# 🔹 NAMESPACES
+# ============================================================
 
-# project_id -> { path, content }
-FILE_CONTENT_CACHE = {}
+# project_id -> { files: {path: entry}, version, updated_at }; file
+# entries are replaced, never edited in place (see _SHARED_ENTRIES)
+STRUCTURE = "structure"
+
+# project_id -> { version }: the STRUCTURE version alone, so cache
+# checks don't fetch and decode the whole structure
+STRUCTURE_VERSION = "structure_version"
+
+# project_id -> { path, status, request_id }
+FILE_REQUEST = "file_request"
+
+# project_id -> { path, content, request_id }
+FILE_CONTENT = "file_content"
+
+# upload_id -> chunked upload session (see api_gateway.uploads)
+FILE_UPLOAD = "file_upload"
+
+# LLM cache key -> { owner }: the worker making that call (see
+# ai_agent.single_flight); expires with the call deadline
+LLM_CLAIM = "llm_claim"
+
+# LLM cache key -> { text }: the claim holder's answer, for the
+# workers that waited on its claim
+LLM_RESULT = "llm_result"
+
+NAMESPACE_TTL_SECONDS = {
+    STRUCTURE: int(os.getenv("AGENT_STRUCTURE_TTL", "86400")),
+    STRUCTURE_VERSION: int(os.getenv("AGENT_STRUCTURE_TTL", "86400")),
+    FILE_REQUEST: int(os.getenv("AGENT_REQUEST_TTL", "300")),
+    FILE_CONTENT: int(os.getenv("AGENT_CONTENT_TTL", "300")),
+    FILE_UPLOAD: int(os.getenv("AGENT_UPLOAD_TTL", "600")),
+    LLM_RESULT: int(os.getenv("AGENT_LLM_RESULT_TTL", "60")),
+}
+
+AGENT_STATE_BACKEND = os.getenv("AGENT_STATE_BACKEND", "memory").lower()
+AGENT_STATE_MAX_BYTES = int(os.getenv("AGENT_STATE_MAX_BYTES", str(256 * 1024 * 1024)))
+AGENT_STATE_REDIS_URL = os.getenv("AGENT_STATE_REDIS_URL", "redis://localhost:6379/0")
+
+
+_SIZE_SAMPLE = 256
+
+
+def _estimate_size(value) -> int:
+    # Large containers (e.g. 50k-file structures) are sampled, so
+    # sizing stays cheap on every delta push.
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        items = value.items()
+        if len(value) > _SIZE_SAMPLE:
+            items = list(islice(items, _SIZE_SAMPLE))
+            sample = sum(_estimate_size(k) + _estimate_size(v) for k, v in items)
+            return 64 + sample * len(value) // _SIZE_SAMPLE
+        return 64 + sum(_estimate_size(k) + _estimate_size(v) for k, v in items)
+    if isinstance(value, (list, tuple, set)):
+        if len(value) > _SIZE_SAMPLE:
+            sample = sum(_estimate_size(v) for v in islice(value, _SIZE_SAMPLE))
+            return 56 + sample * len(value) // _SIZE_SAMPLE
+        return 56 + sum(_estimate_size(v) for v in value)
+    return 16
+
+
+# ============================================================
+# 🔹 STORE INTERFACE
+# ============================================================
+
+class StateTooLarge(ValueError):
+    pass
+
+
+class AgentStateStore:
+    """
+    Key/value store for watcher <-> gateway state.
+
+    Values are plain dicts. get() returns a copy: callers must write
+    back with set() after changing a value.
+    """
+
+    def get(self, namespace: str, key: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value: Dict) -> None:
+        raise NotImplementedError
+
+    def set_if_version(self, namespace: str, key: str, expected: int, value: Dict) -> bool:
+        """
+        Atomically replace the value only if the stored one's
+        "version" is still `expected`. False (nothing written) when
+        another writer got there first or the entry is gone.
+        """
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError
+
+    def claim(self, namespace: str, key: str, owner: str, ttl: float) -> bool:
+        """
+        Atomically store {"owner": owner} only if namespace/key is not
+        set. The claim expires after `ttl` seconds, so a dead owner
+        can't hold it. False when someone else holds it.
+        """
+        raise NotImplementedError
+
+    def release(self, namespace: str, key: str, owner: str) -> None:
+        """
+        Drop the claim if `owner` still holds it.
+        """
+        raise NotImplementedError
+
+    # ---------- change notifications ----------
+    #
+    # notify() tells every subscriber (in every worker sharing the
+    # store) that namespace/key changed; delivery is best effort, so
+    # subscribers keep a slow poll as a safety net.
+
+    def __init__(self):
+        self._subscribers: List[Callable[[str, str], None]] = []
+        self._subscribers_lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[str, str], None]) -> None:
+        """
+        callback(namespace, key), called from any thread.
+        """
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+
+    def notify(self, namespace: str, key: str) -> None:
+        self._deliver(namespace, key)
+
+    def _deliver(self, namespace: str, key: str) -> None:
+        for callback in list(self._subscribers):
+            try:
+                callback(namespace, key)
+            except Exception:
+                pass
+
+
+# ============================================================
+# 🧠 IN-MEMORY STORE (SINGLE WORKER)
+# ============================================================
+
+# Namespaces whose values keep {name: entry} maps that writers change
+# by replacing entries, never by editing one in place (see
+# api_gateway.structure_sync): the maps are copied, the entries are
+# shared, so a delta push doesn't deep-copy every file twice.
+_SHARED_ENTRIES = {STRUCTURE}
+
+# The expiry heap is rebuilt once overwritten keys leave this many
+# stale entries per live one
+_EXPIRY_HEAP_SLACK = 2
+
+
+def _copy_value(namespace: str, value: Dict) -> Dict:
+    if namespace not in _SHARED_ENTRIES:
+        return copy.deepcopy(value)
+    return {
+        field: dict(v) if isinstance(v, dict) else copy.deepcopy(v)
+        for field, v in value.items()
+    }
+
+
+class MemoryStateStore(AgentStateStore):
+    """
+    Process-local store with per-namespace TTL and a total byte cap.
+    Least recently used entries are evicted first. Values are copied
+    in and out, like a networked store would.
+
+    Expired entries are dropped when read, and swept in expiry order
+    (a heap) on writes, so a write doesn't scan the whole store.
+    """
+
+    def __init__(self, max_bytes: int = AGENT_STATE_MAX_BYTES, ttls: Optional[Dict] = None):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.ttls = ttls or NAMESPACE_TTL_SECONDS
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._expiries: List[tuple] = []   # heap of (expires_at, key)
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[Dict]:
+        k = (namespace, key)
+        with self._lock:
+            item = self._data.get(k)
+            if item is None:
+                return None
+
+            value, size, expires_at = item
+            if expires_at and expires_at < time.monotonic():
+                self._drop(k)
+                return None
+
+            self._data.move_to_end(k)
+            return _copy_value(namespace, value)
+
+    def set(self, namespace: str, key: str, value: Dict) -> None:
+        k, item = self._item(namespace, key, value)
+        with self._lock:
+            self._put(k, item)
+
+    def set_if_version(self, namespace: str, key: str, expected: int, value: Dict) -> bool:
+        k, item = self._item(namespace, key, value)
+        with self._lock:
+            current = self._data.get(k)
+            if current is None or (current[2] and current[2] < time.monotonic()):
+                return False
+            if current[0].get("version") != expected:
+                return False
+            self._put(k, item)
+            return True
+
+    def claim(self, namespace: str, key: str, owner: str, ttl: float) -> bool:
+        k, value = (namespace, key), {"owner": owner}
+        with self._lock:
+            current = self._data.get(k)
+            if current is not None and not (current[2] and current[2] < time.monotonic()):
+                return False
+            self._put(k, (value, _estimate_size(value), time.monotonic() + ttl))
+            return True
+
+    def release(self, namespace: str, key: str, owner: str) -> None:
+        k = (namespace, key)
+        with self._lock:
+            current = self._data.get(k)
+            if current is not None and current[0].get("owner") == owner:
+                self._drop(k)
+
+    def _item(self, namespace: str, key: str, value: Dict) -> tuple:
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            raise StateTooLarge(f"{namespace} value is ~{size} bytes, over the {self.max_bytes} byte store cap")
+        ttl = self.ttls.get(namespace)
+        expires_at = time.monotonic() + ttl if ttl else None
+        return (namespace, key), (_copy_value(namespace, value), size, expires_at)
+
+    def _put(self, k: tuple, item: tuple) -> None:
+        self._drop(k)
+        self._data[k] = item
+        self._bytes += item[1]
+        if item[2]:
+            heapq.heappush(self._expiries, (item[2], k))
+        self._evict()
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._drop((namespace, key))
+
+    def _drop(self, k: tuple) -> None:
+        item = self._data.pop(k, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._expiries and self._expiries[0][0] < now:
+            expires_at, k = heapq.heappop(self._expiries)
+            item = self._data.get(k)
+            if item is not None and item[2] == expires_at:   # not rewritten since
+                self._drop(k)
+
+        if len(self._expiries) > _EXPIRY_HEAP_SLACK * len(self._data) + 64:
+            self._expiries = [(item[2], k) for k, item in self._data.items() if item[2]]
+            heapq.heapify(self._expiries)
+
+        while self._bytes > self.max_bytes and self._data:
+            k = next(iter(self._data))
+            self._drop(k)
+
+
+# ============================================================
+# 🌐 REDIS STORE (SHARED ACROSS WORKERS)
+# ============================================================
+
+class RedisStateStore(AgentStateStore):
+    """
+    Shared store for multi-worker deployments.
+    Works against any Redis-protocol server (redis, valkey, dragonfly...).
+    Expiry and memory limits are enforced by the server.
+    """
+
+    KEY_PREFIX = "radar:agent"
+
+    def __init__(self, url: str = AGENT_STATE_REDIS_URL, ttls: Optional[Dict] = None):
+        import redis
+
+        super().__init__()
+        self.ttls = ttls or NAMESPACE_TTL_SECONDS
+        self._redis = redis.Redis.from_url(url)
+        self._listening = False
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.KEY_PREFIX}:{namespace}:{key}"
+
+    def get(self, namespace: str, key: str) -> Optional[Dict]:
+        raw = self._redis.get(self._key(namespace, key))
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def set(self, namespace: str, key: str, value: Dict) -> None:
+        self._redis.set(
+            self._key(namespace, key),
+            json.dumps(value, default=str),
+            ex=self.ttls.get(namespace) or None,
+        )
+
+    def set_if_version(self, namespace: str, key: str, expected: int, value: Dict) -> bool:
+        import redis
+
+        name = self._key(namespace, key)
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(name)
+                raw = pipe.get(name)
+                if raw is None or json.loads(raw).get("version") != expected:
+                    return False
+                pipe.multi()
+                pipe.set(name, json.dumps(value, default=str), ex=self.ttls.get(namespace) or None)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._redis.delete(self._key(namespace, key))
+
+    def claim(self, namespace: str, key: str, owner: str, ttl: float) -> bool:
+        return bool(self._redis.set(
+            self._key(namespace, key),
+            json.dumps({"owner": owner}),
+            nx=True,
+            px=max(1, int(ttl * 1000)),
+        ))
+
+    def release(self, namespace: str, key: str, owner: str) -> None:
+        import redis
+
+        name = self._key(namespace, key)
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(name)
+                raw = pipe.get(name)
+                if raw is None or json.loads(raw).get("owner") != owner:
+                    return
+                pipe.multi()
+                pipe.delete(name)
+                pipe.execute()
+            except redis.WatchError:
+                pass   # changed under us: no longer ours to drop
+
+    # One pub/sub connection per worker, opened by the first subscriber.
+
+    def subscribe(self, callback: Callable[[str, str], None]) -> None:
+        super().subscribe(callback)
+        with self._subscribers_lock:
+            if not self._listening:
+                self._listening = True
+                threading.Thread(target=self._listen, daemon=True).start()
+
+    def notify(self, namespace: str, key: str) -> None:
+        self._redis.publish(f"{self.KEY_PREFIX}:notify", json.dumps([namespace, key]))
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(f"{self.KEY_PREFIX}:notify")
+                for message in pubsub.listen():
+                    namespace, key = json.loads(message["data"])
+                    self._deliver(namespace, key)
+            except Exception:
+                time.sleep(1)   # reconnect; pollers cover the gap
+
+
+# ============================================================
+# 🔹 STORE SELECTION
+# ============================================================
+
+_store: Optional[AgentStateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_state_store() -> AgentStateStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if AGENT_STATE_BACKEND == "redis":
+                    _store = RedisStateStore()
+                else:
+                    _store = MemoryStateStore()
+    return _store
+
+
+# ============================================================
+# 🔹 FILE REQUEST HELPERS (HTTP + WEBSOCKET)
+# ============================================================
+
+def record_file_request(project_id: str, path: str) -> Dict:
+    req = {
+        "path": path,
+        "status": "WAITING",
+        "request_id": secrets.token_hex(8),
+    }
+    store = get_state_store()
+    store.set(FILE_REQUEST, project_id, req)
+    store.notify(FILE_REQUEST, project_id)
+    return req
+
+
+def record_file_content(
+    project_id: str,
+    path: str,
+    content: Optional[str],
+    request_id: Optional[str] = None,
+) -> None:
+    store = get_state_store()
+    store.set(FILE_CONTENT, project_id, {
+        "path": path,
+        "content": content,
+        "request_id": request_id,
+        "received_at": datetime.utcnow(),
+    })
+
+    req = store.get(FILE_REQUEST, project_id)
+    if req:
+        store.set(FILE_REQUEST, project_id, {**req, "status": "RECEIVED"})
@@ -1,28 +1,51 @@
 from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from bson import ObjectId
 from bson.errors import InvalidId
+import json
+import os
+from typing import Optional
 
 from ai_agent.incident_selector import prioritize_incidents
 from ai_agent.file_priority import (
     rank_files,
     rank_files_for_incident,
 )
+from ai_agent.file_features import get_feature_index
 from ai_agent.filesystem import (
+    get_project_path_index,
     list_project_files,
     read_project_file,
 )
+from ai_agent.symbols import get_symbol_index
+from ai_agent.traceback_parser import extract_log_frames, resolve_frames
 from ai_agent.retriever import (
     retrieve_logs,
     retrieve_incident_logs,
 )
 from ai_agent.llm import (
+    agenerate_incident_diagnosis,
+    astream_fix_for_incident_file,
+    astream_incident_diagnosis,
+    asuggest_fix_for_incident_file,
     suggest_fix_for_file,
-    suggest_fix_for_incident_file,
-    generate_incident_diagnosis,
 )
+from ai_agent.llm_limits import LLMDeadlineExceeded
+from ai_agent.patching import make_patch
+from ai_agent.diagnosis import summarize_incident
+from ai_agent.log_stats import hll_count
+from ai_agent.prompt_builder import log_window_version
+from ai_agent.verifier import grounding_index
+from ai_agent import metrics
 
 from .db import db
 from .auth_guard import get_current_user
+from .job_queue import CANCELLED, DONE, FAILED, job_params, job_view, submit_job, wait_for_job
+from .ranking_cache import get_cached_ranking, ranking_key, store_ranking
+from .resolution_feedback import get_feedback_table, record_resolution
+from .structure_sync import get_structure_version
 
 router = APIRouter()
 
@@ -36,6 +59,18 @@ def parse_object_id(value: str, name: str) -> ObjectId:
     except (InvalidId, TypeError):
         raise HTTPException(400, f"Invalid {name} format")
 
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ============================================================
 # 🔹 LIST ACTIVE INCIDENTS
 # ============================================================
@@ -60,6 +95,7 @@ def list_incidents(project_id: str, user=Depends(get_current_user)):
         "file": i.get("file"),
         "line": i.get("line"),
         "count": i.get("count", 0),
+        "distinct_messages": hll_count(i.get("message_sketch")),
         "last_seen": i.get("last_seen"),
         "status": i.get("status", "ACTIVE"),
     } for i in incidents]
@@ -68,8 +104,7 @@ def list_incidents(project_id: str, user=Depends(get_current_user)):
 # 🆕 INCIDENT DIAGNOSIS
 # ============================================================
 
-@router.post("/incidents/diagnose")
-def diagnose_incident(payload: dict = Body(...), user=Depends(get_current_user)):
+def _load_diagnosis_context(payload: dict, user) -> tuple:
     incident_id = parse_object_id(payload.get("incident_id"), "incident_id")
     project_id = parse_object_id(payload.get("project_id"), "project_id")
 
@@ -85,13 +120,172 @@ def diagnose_incident(payload: dict = Body(...), user=Depends(get_current_user))
         raise HTTPException(403, "Forbidden")
 
     logs = retrieve_incident_logs(str(project_id), incident_id)
-    diagnosis = generate_incident_diagnosis(incident, logs)
+    return incident, logs
 
-    return {
-        "incident_id": str(incident_id),
+
+def _stored_diagnosis(payload: dict, incident: dict, logs: list) -> Optional[str]:
+    """
+    The background pre-diagnosis, if it was made from the same log
+    window (see api_gateway/prediagnosis.py).
+    """
+    stored = incident.get("prediagnosis")
+    if not stored or not stored.get("text") or not logs or payload.get("bypass_cache"):
+        return None
+    if stored.get("window_version") != log_window_version(logs):
+        metrics.incr("prediagnosis.stale")
+        return None
+    metrics.incr("prediagnosis.served")
+    return stored.get("text")
+
+
+# ============================================================
+# 📬 JOB SUBMISSION (DIAGNOSE + FIX)
+# ============================================================
+#
+# /incidents/diagnose and /incidents/file/fix queue a job (see
+# job_queue.py) and wait up to JOB_INLINE_WAIT seconds for it, so
+# quick answers keep the old response. Slower ones return 202 with
+# the job to poll via /jobs/{job_id}; "wait": false returns at once.
+
+JOB_INLINE_WAIT_SECONDS = float(os.getenv("JOB_INLINE_WAIT", "20"))
+
+
+def _authorize_job(payload: dict, user) -> ObjectId:
+    parse_object_id(payload.get("incident_id"), "incident_id")
+    project_id = parse_object_id(payload.get("project_id"), "project_id")
+    if not db.projects.find_one({"_id": project_id, "user_id": user["_id"]}, {"_id": 1}):
+        raise HTTPException(403, "Forbidden")
+    return project_id
+
+
+async def submit_and_wait(kind: str, payload: dict, user):
+    project_id = await run_in_threadpool(_authorize_job, payload, user)
+    job = await run_in_threadpool(submit_job, kind, project_id, user["_id"], job_params(kind, payload))
+
+    if payload.get("wait", True):
+        job = await wait_for_job(job["_id"], user["_id"], JOB_INLINE_WAIT_SECONDS) or job
+
+    if job["status"] == DONE:
+        return job["result"]
+    if job["status"] == FAILED:
+        raise HTTPException(job["error"]["status_code"], job["error"]["detail"])
+    if job["status"] == CANCELLED:
+        raise HTTPException(409, "Job cancelled")
+    return JSONResponse(status_code=202, content=jsonable_encoder(job_view(job)))
+
+
+@router.post("/incidents/diagnose")
+async def diagnose_incident(payload: dict = Body(...), user=Depends(get_current_user)):
+    return await submit_and_wait("diagnose", payload, user)
+
+
+async def run_diagnosis(payload: dict, user) -> dict:
+    """
+    Body of a diagnose job (runs on a job worker).
+    """
+    # Mongo work runs in the threadpool; the LLM call is awaited, so
+    # a slow generation does not hold a worker thread
+    incident, logs = await run_in_threadpool(_load_diagnosis_context, payload, user)
+
+    summary = summarize_incident(incident, logs)
+    if _deterministic_tier(payload, summary):
+        return _diagnosis_result(incident, logs, summary["text"], summary, "deterministic")
+
+    stored = _stored_diagnosis(payload, incident, logs)
+    if stored is not None:
+        return _diagnosis_result(incident, logs, stored, summary, "llm", precomputed=True)
+
+    try:
+        diagnosis = await agenerate_incident_diagnosis(
+            incident,
+            logs,
+            use_cache=not payload.get("bypass_cache"),
+        )
+    except LLMDeadlineExceeded:
+        raise HTTPException(504, "Diagnosis timed out")
+
+    return _diagnosis_result(incident, logs, diagnosis, summary, "llm")
+
+
+def _deterministic_tier(payload: dict, summary: dict) -> bool:
+    """
+    The LLM is only called when the deterministic summary has no
+    confident root cause, or the user asks for it (use_llm).
+    """
+    if summary["confident"] and not payload.get("use_llm"):
+        metrics.incr("diagnosis.tier.deterministic")
+        return True
+    metrics.incr("diagnosis.tier.llm")
+    return False
+
+
+def _diagnosis_result(
+    incident: dict,
+    logs: list,
+    diagnosis: str,
+    summary: dict,
+    tier: str,
+    precomputed: bool = False,
+) -> dict:
+    """
+    `tier` says who wrote problem_statement ("deterministic" or
+    "llm"); `summary` always carries the deterministic findings
+    (root cause, frame, templates, trend). `grounding` lists the log
+    tokens the diagnosis cites and the logs they come from (see
+    ai_agent/verifier.py).
+    """
+    result = {
+        "incident_id": str(incident["_id"]),
         "problem_statement": diagnosis,
         "log_count": len(logs),
+        "tier": tier,
+        "summary": {k: v for k, v in summary.items() if k != "text"},
+        "grounding": grounding_index(logs).ground(diagnosis),
     }
+    if precomputed:
+        result["precomputed"] = True
+    return result
+
+@router.post("/incidents/diagnose/stream")
+async def diagnose_incident_stream(payload: dict = Body(...), user=Depends(get_current_user)):
+    """
+    Same as /incidents/diagnose, as Server-Sent Events:
+    `token` events while generating, then `done` (or `error`).
+    """
+    incident, logs = await run_in_threadpool(_load_diagnosis_context, payload, user)
+
+    async def events():
+        parts = []
+        summary = summarize_incident(incident, logs)
+        if _deterministic_tier(payload, summary):
+            yield sse_event("token", {"text": summary["text"]})
+            yield sse_event("done", _diagnosis_result(incident, logs, summary["text"], summary, "deterministic"))
+            return
+
+        stored = _stored_diagnosis(payload, incident, logs)
+        if stored is not None:
+            yield sse_event("token", {"text": stored})
+            yield sse_event("done", _diagnosis_result(incident, logs, stored, summary, "llm", precomputed=True))
+            return
+
+        try:
+            async for delta in astream_incident_diagnosis(
+                incident,
+                logs,
+                use_cache=not payload.get("bypass_cache"),
+            ):
+                parts.append(delta)
+                yield sse_event("token", {"text": delta})
+        except LLMDeadlineExceeded:
+            yield sse_event("error", {"detail": "Diagnosis timed out"})
+            return
+        except Exception:
+            yield sse_event("error", {"detail": "Diagnosis failed"})
+            return
+
+        yield sse_event("done", _diagnosis_result(incident, logs, "".join(parts).strip(), summary, "llm"))
+
+    return sse_response(events())
 
 # ============================================================
 # 🔹 PRIORITIZED FILES (✅ FIXED)
@@ -113,21 +307,52 @@ def get_prioritized_files(payload: dict = Body(...), user=Depends(get_current_us
     if not project:
         raise HTTPException(403, "Forbidden")
 
-    # ✅ IMPORTANT FIX (agent structure)
-    files = list_project_files(
-        max_files=300,
+    # Repeat views of an incident are served from the ranking cache
+    # until the structure or the incident's logs move. The check only
+    # reads the structure version key and the in-memory feedback table
+    # (reloaded from Mongo every FEEDBACK_TABLE_TTL seconds).
+    feedback_table = get_feedback_table(project_id)
+    cache_key = ranking_key(
+        str(project_id),
+        incident,
+        get_structure_version(str(project_id)),
+        feedback_table.version,
+    )
+    ranked = get_cached_ranking(cache_key)
+    if ranked is not None:
+        return {
+            "incident_id": str(incident_id),
+            "files": ranked,
+        }
+
+    # ✅ IMPORTANT FIX (agent structure) — rank the whole repository
+    # from features precomputed once per structure version
+    path_index = get_project_path_index(project)
+    features = get_feature_index(path_index) if path_index is not None else None
+    if path_index is not None:
+        # the structure may have moved since the check
+        cache_key = ranking_key(str(project_id), incident, path_index.version, feedback_table.version)
+    files = [] if features is not None else list_project_files(
+        max_files=None,
         project=project
     )
 
     logs = retrieve_incident_logs(str(project_id), incident_id)
 
     if logs:
+        # Frames cached at ingest; older incidents are parsed here
+        frames = incident.get("frames") or extract_log_frames(logs)
         ranked = rank_files_for_incident(
             files=files,
             logs=logs,
             incident=incident,
             max_files=5,
+            features=features,
+            frames=resolve_frames(frames, path_index),
+            symbols=get_symbol_index(path_index),
+            feedback=feedback_table.scores(incident),
         )
+        store_ranking(cache_key, ranked)
     else:
         legacy_logs = retrieve_logs(
             project_id=str(project["_id"]),
@@ -139,6 +364,7 @@ def get_prioritized_files(payload: dict = Body(...), user=Depends(get_current_us
             logs=legacy_logs,
             service=incident.get("service"),
             max_files=5,
+            features=features,
         )
 
     return {
@@ -150,8 +376,7 @@ def get_prioritized_files(payload: dict = Body(...), user=Depends(get_current_us
 # 🔹 FIX FILE FOR INCIDENT (✅ FIXED)
 # ============================================================
 
-@router.post("/incidents/file/fix")
-def fix_file_for_incident(payload: dict = Body(...), user=Depends(get_current_user)):
+def _load_fix_context(payload: dict, user) -> dict:
     incident_id = parse_object_id(payload.get("incident_id"), "incident_id")
     project_id = parse_object_id(payload.get("project_id"), "project_id")
     path = payload.get("path")
@@ -173,6 +398,11 @@ def fix_file_for_incident(payload: dict = Body(...), user=Depends(get_current_us
     if not project:
         raise HTTPException(403, "Forbidden")
 
+    # Unknown paths fail fast instead of waiting on the watcher
+    path_index = get_project_path_index(project)
+    if path_index is not None and not path_index.contains(path):
+        raise HTTPException(404, "File not in project structure")
+
     logs = retrieve_incident_logs(str(project_id), incident_id)
 
     # ✅ IMPORTANT FIX (agent file request)
@@ -183,33 +413,134 @@ def fix_file_for_incident(payload: dict = Body(...), user=Depends(get_current_us
     if content is None:
         raise HTTPException(400, "File not accessible")
 
-    if logs:
-        fixed_code, explanation = suggest_fix_for_incident_file(
-            incident=incident,
-            logs=logs,
-            path=path,
-            content=content,
-        )
-    else:
+    legacy_logs = []
+    if not logs:
         legacy_logs = retrieve_logs(
             project_id=str(project["_id"]),
             project_secret=project["project_secret"],
             service=incident.get("service"),
         )
-        fixed_code, explanation = suggest_fix_for_file(
-            service=incident.get("service"),
-            logs=legacy_logs,
-            path=path,
-            content=content,
-        )
 
     return {
-        "incident_id": str(incident_id),
+        "incident": incident,
         "path": path,
-        "original": content,
-        "fixed": fixed_code,
+        "content": content,
+        "logs": logs,
+        "legacy_logs": legacy_logs,
+    }
+
+
+@router.post("/incidents/file/fix")
+async def fix_file_for_incident(payload: dict = Body(...), user=Depends(get_current_user)):
+    return await submit_and_wait("fix", payload, user)
+
+
+async def run_fix(payload: dict, user) -> dict:
+    """
+    Body of a fix job (runs on a job worker).
+    """
+    ctx = await run_in_threadpool(_load_fix_context, payload, user)
+    incident = ctx["incident"]
+    path = ctx["path"]
+    content = ctx["content"]
+
+    try:
+        if ctx["logs"]:
+            fixed_code, explanation = await asuggest_fix_for_incident_file(
+                incident=incident,
+                logs=ctx["logs"],
+                path=path,
+                content=content,
+                use_cache=not payload.get("bypass_cache"),
+            )
+        else:
+            fixed_code, explanation = await run_in_threadpool(
+                suggest_fix_for_file,
+                service=incident.get("service"),
+                logs=ctx["legacy_logs"],
+                path=path,
+                content=content,
+                use_cache=not payload.get("bypass_cache"),
+            )
+    except LLMDeadlineExceeded:
+        raise HTTPException(504, "Fix suggestion timed out")
+
+    return _fix_result(payload, incident, path, content, fixed_code, explanation)
+
+
+def _fix_result(payload: dict, incident: dict, path: str, content: str, fixed_code: str, explanation: str) -> dict:
+    """
+    The fix as a unified diff; `full_file: true` in the payload also
+    returns the original and fixed file.
+    """
+    result = {
+        "incident_id": str(incident["_id"]),
+        "path": path,
+        "patch": make_patch(path, content, fixed_code),
         "explanation": explanation,
     }
+    if payload.get("full_file"):
+        result["original"] = content
+        result["fixed"] = fixed_code
+    return result
+
+@router.post("/incidents/file/fix/stream")
+async def fix_file_for_incident_stream(payload: dict = Body(...), user=Depends(get_current_user)):
+    """
+    Same as /incidents/file/fix, as Server-Sent Events: `explanation`
+    deltas first, then `patch` (or `updated_file`) deltas, then `done`
+    with the same body as the non-streaming call (or `error`). A
+    `retry` event means the patch did not apply: drop what was
+    received, the whole-file answer follows. The streamed
+    explanation equals `done`'s (up to surrounding whitespace);
+    for windowed files `updated_file` deltas are the edited
+    excerpts, and `done` carries the result to keep.
+    """
+    ctx = await run_in_threadpool(_load_fix_context, payload, user)
+    incident = ctx["incident"]
+    path = ctx["path"]
+    content = ctx["content"]
+    use_cache = not payload.get("bypass_cache")
+
+    async def events():
+        try:
+            if ctx["logs"]:
+                fixed_code, explanation = content, ""
+                async for section, text in astream_fix_for_incident_file(
+                    incident=incident,
+                    logs=ctx["logs"],
+                    path=path,
+                    content=content,
+                    use_cache=use_cache,
+                ):
+                    if section == "done":
+                        fixed_code, explanation = text
+                    elif section == "retry":
+                        yield sse_event("retry", {"detail": text})
+                    else:
+                        yield sse_event(section, {"text": text})
+            else:
+                # legacy service-scoped fix has no streaming variant
+                fixed_code, explanation = await run_in_threadpool(
+                    suggest_fix_for_file,
+                    service=incident.get("service"),
+                    logs=ctx["legacy_logs"],
+                    path=path,
+                    content=content,
+                    use_cache=use_cache,
+                )
+                yield sse_event("explanation", {"text": explanation})
+                yield sse_event("updated_file", {"text": fixed_code})
+        except LLMDeadlineExceeded:
+            yield sse_event("error", {"detail": "Fix suggestion timed out"})
+            return
+        except Exception:
+            yield sse_event("error", {"detail": "Fix suggestion failed"})
+            return
+
+        yield sse_event("done", _fix_result(payload, incident, path, content, fixed_code, explanation))
+
+    return sse_response(events())
 
 # ============================================================
 # 🔹 RESOLVE INCIDENT
@@ -233,6 +564,9 @@ def resolve_incident(payload: dict = Body(...), user=Depends(get_current_user)):
     if not project:
         raise HTTPException(403, "Forbidden")
 
+    # Feeds the ranking boost table (proven files up, tried files down)
+    record_resolution(project["_id"], incident, file_path, bool(resolved))
+
     if resolved:
         db.incidents.update_one(
             {"_id": incident["_id"]},
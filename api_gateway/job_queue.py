@@ -0,0 +1,282 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from ai_agent import metrics
+
+from .db import db   # ✅ SAME SHARED DB
+
+# ============================================================
+# 📬 DURABLE JOB QUEUE (MONGO)
+# ============================================================
+#
+# One document per job in `jobs`:
+#
+#     kind, project_id, user_id, params, status, result, error,
+#     created_at, started_at, finished_at, worker, lease_until,
+#     attempts, cancel_requested, active_key
+#
+# QUEUED -> RUNNING -> DONE | FAILED | CANCELLED. `active_key` (kind +
+# project + params) is set only while a job is QUEUED/RUNNING and has
+# a sparse unique index, so an identical submit returns the job
+# already in flight. Workers hold a lease they renew while running;
+# jobs whose lease lapses (worker died) are queued again.
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+DONE = "DONE"
+FAILED = "FAILED"
+CANCELLED = "CANCELLED"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "30"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL", "86400"))
+
+# Parameters each kind accepts from the request payload
+JOB_PARAMS = {
+    "diagnose": ("incident_id", "project_id", "bypass_cache", "use_llm"),
+    "fix": ("incident_id", "project_id", "path", "bypass_cache", "full_file"),
+}
+
+_indexes_ready = False
+
+
+def _ensure_indexes() -> None:
+    global _indexes_ready
+    if not _indexes_ready:
+        db.jobs.create_index("active_key", unique=True, sparse=True)
+        db.jobs.create_index([("status", 1), ("project_id", 1), ("created_at", 1)])
+        db.jobs.create_index([("project_id", 1), ("started_at", -1)])
+        db.jobs.create_index("finished_at", expireAfterSeconds=JOB_RESULT_TTL_SECONDS)
+        _indexes_ready = True
+
+
+def job_params(kind: str, payload: dict) -> dict:
+    return {k: payload[k] for k in JOB_PARAMS[kind] if payload.get(k) is not None}
+
+
+def _active_key(kind: str, project_id: ObjectId, params: dict) -> str:
+    raw = json.dumps([kind, str(project_id), params], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def job_view(job: Dict) -> Dict:
+    return {
+        "job_id": str(job["_id"]),
+        "kind": job["kind"],
+        "status": job["status"],
+        "created_at": job.get("created_at"),
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "error": job.get("error"),
+    }
+
+
+# ============================================================
+# 🔹 SUBMIT / STATUS / CANCEL
+# ============================================================
+
+_SUBMIT_ATTEMPTS = 3
+
+
+def submit_job(kind: str, project_id: ObjectId, user_id: ObjectId, params: dict) -> Dict:
+    """
+    Queue a job, or return the identical one already queued/running.
+    """
+    _ensure_indexes()
+    key = _active_key(kind, project_id, params)
+    job = {
+        "kind": kind,
+        "project_id": project_id,
+        "user_id": user_id,
+        "params": params,
+        "status": QUEUED,
+        "created_at": datetime.utcnow(),
+        "attempts": 0,
+        "cancel_requested": False,
+        "active_key": key,
+    }
+    for _ in range(_SUBMIT_ATTEMPTS):
+        try:
+            db.jobs.insert_one(job)
+            metrics.incr("jobs.submitted")
+            return job
+        except DuplicateKeyError:
+            existing = db.jobs.find_one({"active_key": key})
+            if existing is not None:
+                metrics.incr("jobs.deduplicated")
+                return existing
+            # finished between the insert and the lookup: queue again
+            job.pop("_id", None)
+    raise HTTPException(503, "Job queue is busy, try again")
+
+
+def get_job(job_id: ObjectId, user_id: ObjectId) -> Optional[Dict]:
+    return db.jobs.find_one({"_id": job_id, "user_id": user_id})
+
+
+def cancel_job(job_id: ObjectId, user_id: ObjectId) -> Optional[Dict]:
+    """
+    Queued jobs are cancelled at once; running ones are flagged and
+    stopped by their worker at the next heartbeat.
+    """
+    now = datetime.utcnow()
+    job = db.jobs.find_one_and_update(
+        {"_id": job_id, "user_id": user_id, "status": QUEUED},
+        {"$set": {"status": CANCELLED, "finished_at": now}, "$unset": {"active_key": ""}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if job is None:
+        job = db.jobs.find_one_and_update(
+            {"_id": job_id, "user_id": user_id, "status": RUNNING},
+            {"$set": {"cancel_requested": True}},
+            return_document=ReturnDocument.AFTER,
+        )
+    return job or get_job(job_id, user_id)
+
+
+async def wait_for_job(job_id: ObjectId, user_id: ObjectId, timeout: float) -> Optional[Dict]:
+    """
+    Poll until the job finishes or `timeout` passes; returns the
+    last seen state.
+    """
+    loop = asyncio.get_running_loop()
+    ends_at = loop.time() + timeout
+    delay = 0.05
+    while True:
+        job = await asyncio.to_thread(get_job, job_id, user_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        left = ends_at - loop.time()
+        if left <= 0:
+            return job
+        await asyncio.sleep(min(delay, left))
+        delay = min(delay * 2, 0.5)
+
+
+# ============================================================
+# 🔹 WORKER SIDE
+# ============================================================
+
+def _projects_by_fairness() -> List[ObjectId]:
+    """
+    Projects with queued jobs: fewest running jobs first, then least
+    recently served, then oldest waiting job, so one busy project
+    can't starve the others.
+    """
+    queued = list(db.jobs.aggregate([
+        {"$match": {"status": QUEUED}},
+        {"$group": {"_id": "$project_id", "oldest": {"$min": "$created_at"}}},
+    ]))
+    if len(queued) <= 1:
+        return [row["_id"] for row in queued]
+
+    project_ids = [row["_id"] for row in queued]
+    running: Dict[ObjectId, int] = {}
+    served: Dict[ObjectId, datetime] = {}
+    for row in db.jobs.aggregate([
+        {"$match": {
+            "project_id": {"$in": project_ids},
+            "started_at": {"$gt": datetime.utcnow() - timedelta(hours=1)},
+        }},
+        {"$group": {
+            "_id": "$project_id",
+            "running": {"$sum": {"$cond": [{"$eq": ["$status", RUNNING]}, 1, 0]}},
+            "last_started": {"$max": "$started_at"},
+        }},
+    ]):
+        running[row["_id"]] = row["running"]
+        served[row["_id"]] = row["last_started"]
+
+    queued.sort(key=lambda row: (
+        running.get(row["_id"], 0),
+        served.get(row["_id"], datetime.min),
+        row["oldest"],
+    ))
+    return [row["_id"] for row in queued]
+
+
+def claim_job(worker_id: str) -> Optional[Dict]:
+    _ensure_indexes()
+    for project_id in _projects_by_fairness():
+        now = datetime.utcnow()
+        job = db.jobs.find_one_and_update(
+            {"status": QUEUED, "project_id": project_id},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker": worker_id,
+                    "started_at": now,
+                    "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is not None:
+            return job
+    return None
+
+
+def heartbeat(job_id: ObjectId, worker_id: str) -> bool:
+    """
+    Renew the lease. False when the job was cancelled or the lease
+    was lost to another worker - the caller should stop.
+    """
+    job = db.jobs.find_one_and_update(
+        {"_id": job_id, "worker": worker_id, "status": RUNNING},
+        {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}},
+        {"cancel_requested": 1},
+    )
+    return job is not None and not job.get("cancel_requested")
+
+
+def finish_job(job_id: ObjectId, worker_id: str, status: str, result=None, error=None) -> None:
+    db.jobs.update_one(
+        {"_id": job_id, "worker": worker_id, "status": RUNNING},
+        {
+            "$set": {
+                "status": status,
+                "result": result,
+                "error": error,
+                "finished_at": datetime.utcnow(),
+            },
+            "$unset": {"active_key": "", "lease_until": ""},
+        },
+    )
+    metrics.incr(f"jobs.{status.lower()}")
+
+
+def requeue_expired() -> int:
+    """
+    Put jobs of dead workers back in the queue (or fail them after
+    JOB_MAX_ATTEMPTS).
+    """
+    now = datetime.utcnow()
+    expired = {"status": RUNNING, "lease_until": {"$lt": now}}
+    db.jobs.update_many(
+        {**expired, "attempts": {"$gte": JOB_MAX_ATTEMPTS}},
+        {
+            "$set": {
+                "status": FAILED,
+                "error": {"status_code": 500, "detail": "Job worker lost"},
+                "finished_at": now,
+            },
+            "$unset": {"active_key": "", "lease_until": ""},
+        },
+    )
+    res = db.jobs.update_many(
+        expired,
+        {"$set": {"status": QUEUED}, "$unset": {"worker": "", "lease_until": ""}},
+    )
+    return res.modified_count
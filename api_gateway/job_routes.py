@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from .auth_guard import get_current_user
+from .incidents import _authorize_job
+from .job_queue import (
+    DONE,
+    FAILED,
+    FINISHED,
+    JOB_PARAMS,
+    cancel_job,
+    get_job,
+    job_params,
+    job_view,
+    submit_job,
+)
+
+router = APIRouter()
+
+# ============================================================
+# 📬 JOBS (SUBMIT / STATUS / RESULT / CANCEL)
+# ============================================================
+
+
+def _job_id(job_id: str) -> ObjectId:
+    try:
+        return ObjectId(job_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(400, "Invalid job_id")
+
+
+@router.post("/jobs")
+def submit(payload: dict = Body(...), user=Depends(get_current_user)):
+    """
+    {"kind": "diagnose" | "fix", ...same fields as the endpoint}.
+    Returns 202 with the job; an identical job already in flight is
+    returned instead of queueing a second one.
+    """
+    kind = payload.get("kind")
+    if kind not in JOB_PARAMS:
+        raise HTTPException(400, f"kind must be one of: {', '.join(JOB_PARAMS)}")
+    if kind == "fix" and not payload.get("path"):
+        raise HTTPException(400, "path is required")
+
+    project_id = _authorize_job(payload, user)
+    job = submit_job(kind, project_id, user["_id"], job_params(kind, payload))
+    return JSONResponse(status_code=202, content=jsonable_encoder(job_view(job)))
+
+
+@router.get("/jobs/{job_id}")
+def status(job_id: str, user=Depends(get_current_user)):
+    job = get_job(_job_id(job_id), user["_id"])
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job_view(job)
+
+
+@router.get("/jobs/{job_id}/result")
+def result(job_id: str, user=Depends(get_current_user)):
+    """
+    The endpoint's usual response once the job is DONE; its error
+    status if it FAILED; 409 while it is still queued or running.
+    """
+    job = get_job(_job_id(job_id), user["_id"])
+    if not job:
+        raise HTTPException(404, "Job not found")
+    if job["status"] == DONE:
+        return job["result"]
+    if job["status"] == FAILED:
+        raise HTTPException(job["error"]["status_code"], job["error"]["detail"])
+    if job["status"] in FINISHED:
+        raise HTTPException(409, "Job cancelled")
+    raise HTTPException(409, "Job not finished")
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel(job_id: str, user=Depends(get_current_user)):
+    job = await run_in_threadpool(cancel_job, _job_id(job_id), user["_id"])
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job_view(job)
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+from fastapi import HTTPException
+
+from ai_agent import metrics
+
+from .incidents import run_diagnosis, run_fix
+from .job_queue import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    claim_job,
+    finish_job,
+    heartbeat,
+    requeue_expired,
+)
+
+# ============================================================
+# 🛠️ JOB WORKER
+# ============================================================
+#
+# Runs queued diagnose / fix jobs. Either inside the API process
+# (JOB_WORKER_IN_API=1, the default) or on its own:
+#
+#     python -m api_gateway.worker
+
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+JOB_HEARTBEAT_SECONDS = 10
+
+logger = logging.getLogger(__name__)
+
+_RUNNERS = {
+    "diagnose": run_diagnosis,
+    "fix": run_fix,
+}
+
+
+async def _run_job(job: dict, worker_id: str) -> None:
+    runner = _RUNNERS.get(job.get("kind"))
+    if runner is None:
+        await asyncio.to_thread(
+            finish_job, job["_id"], worker_id, FAILED,
+            error={"status_code": 500, "detail": f"Unknown job kind {job.get('kind')!r}"},
+        )
+        return
+
+    user = {"_id": job["user_id"]}
+    task = asyncio.create_task(runner(job["params"], user))
+
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=JOB_HEARTBEAT_SECONDS)
+        if done:
+            break
+        try:
+            alive = await asyncio.to_thread(heartbeat, job["_id"], worker_id)
+        except Exception:
+            # transient: the lease outlives a few missed beats
+            logger.warning("heartbeat failed for job %s", job["_id"], exc_info=True)
+            metrics.incr("jobs.heartbeat_failed")
+            continue
+        if not alive:
+            task.cancel()
+            # let it unwind before the slot takes the next job
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.to_thread(finish_job, job["_id"], worker_id, CANCELLED)
+            return
+
+    try:
+        result = task.result()
+    except HTTPException as exc:
+        await asyncio.to_thread(
+            finish_job, job["_id"], worker_id, FAILED,
+            error={"status_code": exc.status_code, "detail": exc.detail},
+        )
+        return
+    except Exception:
+        logger.exception("job %s (%s) failed", job["_id"], job["kind"])
+        await asyncio.to_thread(
+            finish_job, job["_id"], worker_id, FAILED,
+            error={"status_code": 500, "detail": "Job failed"},
+        )
+        return
+    await asyncio.to_thread(finish_job, job["_id"], worker_id, DONE, result=result)
+
+
+async def _slot(worker_id: str) -> None:
+    """
+    Claims and runs jobs forever: one job's failure (Mongo errors
+    included) is logged and recorded on the job, never ends the slot.
+    """
+    while True:
+        try:
+            job = await asyncio.to_thread(claim_job, worker_id)
+        except Exception:
+            logger.warning("claiming a job failed", exc_info=True)
+            metrics.incr("jobs.claim_failed")
+            job = None
+        if job is None:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+
+        try:
+            await _run_job(job, worker_id)
+        except Exception:
+            logger.exception("job %s crashed its worker slot", job.get("_id"))
+            metrics.incr("jobs.slot_errors")
+            try:
+                await asyncio.to_thread(
+                    finish_job, job["_id"], worker_id, FAILED,
+                    error={"status_code": 500, "detail": "Job failed"},
+                )
+            except Exception:
+                pass   # the lease lapses and the reaper requeues it
+
+
+async def _reaper() -> None:
+    while True:
+        try:
+            requeued = await asyncio.to_thread(requeue_expired)
+            if requeued:
+                metrics.incr("jobs.requeued", requeued)
+        except Exception:
+            logger.warning("requeueing expired jobs failed", exc_info=True)
+            metrics.incr("jobs.reaper_failed")
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+
+
+async def run_worker(concurrency: int = JOB_WORKER_CONCURRENCY) -> None:
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    await asyncio.gather(_reaper(), *(_slot(worker_id) for _ in range(concurrency)))
+
+
+def run_worker_thread() -> None:
+    # own event loop: the API's loop is busy serving requests
+    asyncio.run(run_worker())
@@ -3,8 +3,13 @@ from pydantic import BaseModel
 from datetime import datetime
 from bson import ObjectId
 from bson.errors import InvalidId
+from pymongo import ReturnDocument
 import hashlib
 import re
+from typing import Dict
+
+from ai_agent.log_stats import EXACT_MESSAGES, hll_merge, hll_sketch, new_message_hashes
+from ai_agent.traceback_parser import extract_log_frames
 
 from .db import db   # ✅ SHARED DB (IMPORTANT)
 
@@ -21,6 +26,23 @@ class LogIngestRequest(BaseModel):
     file: str | None = None
     line: int | None = None
 
+
+class LogBatchEntry(BaseModel):
+    service: str
+    level: str
+    message: str
+    file: str | None = None
+    line: int | None = None
+
+
+class LogBatchRequest(BaseModel):
+    project_id: str
+    project_secret: str
+    logs: list[LogBatchEntry]
+
+
+MAX_BATCH_SIZE = 500
+
 # -------- Helpers --------
 
 def normalize_message(msg: str) -> str:
@@ -29,74 +51,237 @@ def normalize_message(msg: str) -> str:
     msg = re.sub(r"\s+", " ", msg)
     return msg.strip()
 
-# -------- Route --------
-@router.post("/logs/ingest")
-def ingest_log(data: LogIngestRequest):
-    # 1️⃣ Validate project
+# -------- Ingest stats --------
+#
+# Running totals per service (log_stats) and per incident, each with a
+# HyperLogLog sketch of distinct messages, so grading needs no log
+# fetch. A batch is folded locally first: one update per service and
+# per incident, not per line. Counters are $inc'd; the sketch is
+# rewritten only when a register grows, guarded by its previous value
+# (a lost race after the retries drops that batch from an estimate).
+# Service stats also keep the first EXACT_MESSAGES distinct message
+# hashes exactly (log_stats.new_message_hashes), set on insert and
+# $addToSet only while the list is short.
+
+_SKETCH_RETRIES = 3
+
+
+def _update_sketch(collection, query: dict, current, additions: bytes) -> None:
+    for _ in range(_SKETCH_RETRIES):
+        sketch = hll_merge(current, additions)
+        if sketch is None:
+            return
+        res = collection.update_one(
+            {**query, "message_sketch": current},
+            {"$set": {"message_sketch": sketch}},
+        )
+        if res.modified_count:
+            return
+        doc = collection.find_one(query, {"message_sketch": 1})
+        if doc is None:
+            return
+        current = doc.get("message_sketch")
+
+
+_stats_index_ready = False
+
+
+def _record_service_stats(project_oid: ObjectId, entries: list) -> None:
+    global _stats_index_ready
+    if not _stats_index_ready:
+        db.log_stats.create_index([("project_id", 1), ("service", 1)], unique=True)
+        _stats_index_ready = True
+
+    by_service: Dict[str, list] = {}
+    for data in entries:
+        by_service.setdefault(data.service, []).append(data)
+
+    for service, group in by_service.items():
+        query = {"project_id": project_oid, "service": service}
+        messages = [data.message for data in group if data.message]
+        doc = db.log_stats.find_one_and_update(
+            query,
+            {
+                "$inc": {
+                    "total": len(group),
+                    "errors": sum(data.level.upper() == "ERROR" for data in group),
+                },
+                "$setOnInsert": {
+                    "message_sketch": None,
+                    "message_hashes": new_message_hashes(None, messages),
+                },
+            },
+            projection={"message_sketch": 1, "message_hashes": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        sketch = hll_sketch(messages)
+        if sketch:
+            _update_sketch(db.log_stats, query, doc.get("message_sketch"), sketch)
+
+        # documents from before the exact hashes never get them: a
+        # partial list would read as too few messages
+        known = doc.get("message_hashes")
+        hashes = new_message_hashes(known, messages) if known is not None else []
+        if hashes:
+            db.log_stats.update_one(
+                {**query, f"message_hashes.{EXACT_MESSAGES - 1}": {"$exists": False}},
+                {"$addToSet": {"message_hashes": {"$each": hashes}}},
+            )
+
+
+# -------- Ingest --------
+
+def _fingerprint(project_oid: ObjectId, data) -> str:
+    return hashlib.sha256(
+        f"{project_oid}:{data.service}:{normalize_message(data.message)}:{data.file}:{data.line}".encode()
+    ).hexdigest()
+
+
+def _record_incident(project_oid: ObjectId, fingerprint: str, group: list, now: datetime) -> ObjectId:
+    """
+    One lookup and one write for every ERROR line of a batch that
+    shares a fingerprint.
+    """
+    first = group[0]
+    incident = db.incidents.find_one({
+        "project_id": project_oid,
+        "fingerprint": fingerprint,
+        "status": "ACTIVE",
+    })
+
+    # Stack frames are parsed once here and cached on the incident,
+    # so file ranking does not re-scan its logs
+    frames = None
+    if not (incident and incident.get("frames")):
+        for data in group:
+            frames = extract_log_frames([{
+                "message": data.message,
+                "file": data.file,
+                "line": data.line,
+            }])
+            if frames:
+                break
+
+    sketch = hll_sketch(data.message for data in group if data.message)
+
+    if not incident:
+        res = db.incidents.insert_one({
+            "project_id": project_oid,
+            "service": first.service,
+            "fingerprint": fingerprint,
+            "message": normalize_message(first.message),
+            "file": first.file,
+            "line": first.line,
+            "frames": frames or [],
+            "message_sketch": sketch,
+            "status": "ACTIVE",
+            "count": len(group),
+            "first_seen": now,
+            "last_seen": now,
+        })
+        return res.inserted_id
+
+    incident_id = incident["_id"]
+    update = {"last_seen": now}
+    if frames:
+        update["frames"] = frames
+
+    # The sketch rides along with the counters when it has not moved
+    # since the lookup; otherwise counters first, then the sketch CAS
+    current = incident.get("message_sketch")
+    merged = hll_merge(current, sketch)
+    if merged is not None:
+        res = db.incidents.update_one(
+            {"_id": incident_id, "message_sketch": current},
+            {"$set": {**update, "message_sketch": merged}, "$inc": {"count": len(group)}},
+        )
+        if res.matched_count:
+            return incident_id
+
+    db.incidents.update_one(
+        {"_id": incident_id},
+        {"$set": update, "$inc": {"count": len(group)}},
+    )
+    if merged is not None:
+        _update_sketch(db.incidents, {"_id": incident_id}, current, sketch)
+    return incident_id
+
+
+def _ingest_entries(project_oid: ObjectId, entries: list, now: datetime) -> None:
+    # 2️⃣ INCIDENT ENGINE (ERROR only)
+    fingerprints = [
+        _fingerprint(project_oid, data) if data.level.upper() == "ERROR" else None
+        for data in entries
+    ]
+    groups: Dict[str, list] = {}
+    for data, fingerprint in zip(entries, fingerprints):
+        if fingerprint:
+            groups.setdefault(fingerprint, []).append(data)
+
+    incident_ids = {
+        fingerprint: _record_incident(project_oid, fingerprint, group, now)
+        for fingerprint, group in groups.items()
+    }
+
+    _record_service_stats(project_oid, entries)
+
+    # 3️⃣ Store raw logs (LINKED TO INCIDENT)
+    db.logs.insert_many([
+        {
+            "project_id": project_oid,
+            "incident_id": incident_ids.get(fingerprint),
+            "service": data.service,
+            "level": data.level,
+            "message": data.message,
+            "file": data.file,
+            "line": data.line,
+            "timestamp": now,
+        }
+        for data, fingerprint in zip(entries, fingerprints)
+    ])
+
+
+def _authenticate_project(project_id: str, project_secret: str) -> ObjectId:
     try:
-        project_oid = ObjectId(data.project_id)
+        project_oid = ObjectId(project_id)
     except InvalidId:
         raise HTTPException(401, "Invalid project_id format")
 
     project = db.projects.find_one({
         "_id": project_oid,
-        "project_secret": data.project_secret,
+        "project_secret": project_secret,
     })
 
     if not project:
         raise HTTPException(401, "Invalid project credentials")
 
-    now = datetime.utcnow()
-    incident_id = None
-
-    # 2️⃣ INCIDENT ENGINE (ERROR only)
-    if data.level.upper() == "ERROR":
-        normalized_message = normalize_message(data.message)
+    return project_oid
 
-        fingerprint = hashlib.sha256(
-            f"{project_oid}:{data.service}:{normalized_message}:{data.file}:{data.line}".encode()
-        ).hexdigest()
 
-        incident = db.incidents.find_one({
-            "project_id": project_oid,
-            "fingerprint": fingerprint,
-            "status": "ACTIVE",
-        })
+# -------- Route --------
+@router.post("/logs/ingest")
+def ingest_log(data: LogIngestRequest):
+    # 1️⃣ Validate project
+    project_oid = _authenticate_project(data.project_id, data.project_secret)
 
-        if incident:
-            incident_id = incident["_id"]
-            db.incidents.update_one(
-                {"_id": incident_id},
-                {
-                    "$set": {"last_seen": now},
-                    "$inc": {"count": 1},
-                },
-            )
-        else:
-            res = db.incidents.insert_one({
-                "project_id": project_oid,
-                "service": data.service,
-                "fingerprint": fingerprint,
-                "message": normalized_message,
-                "file": data.file,
-                "line": data.line,
-                "status": "ACTIVE",
-                "count": 1,
-                "first_seen": now,
-                "last_seen": now,
-            })
-            incident_id = res.inserted_id
-
-    # 3️⃣ Store raw log (LINKED TO INCIDENT)
-    db.logs.insert_one({
-        "project_id": project_oid,
-        "incident_id": incident_id,
-        "service": data.service,
-        "level": data.level,
-        "message": data.message,
-        "file": data.file,
-        "line": data.line,
-        "timestamp": now,
-    })
+    _ingest_entries(project_oid, [data], datetime.utcnow())
 
     return {"status": "success"}
+
+
+@router.post("/logs/ingest/batch")
+def ingest_log_batch(data: LogBatchRequest):
+    """
+    Many log lines, one auth round-trip (used by the local watcher);
+    stats and incidents are updated once per service / fingerprint.
+    """
+    if len(data.logs) > MAX_BATCH_SIZE:
+        raise HTTPException(413, f"At most {MAX_BATCH_SIZE} logs per batch")
+
+    project_oid = _authenticate_project(data.project_id, data.project_secret)
+
+    if data.logs:
+        _ingest_entries(project_oid, data.logs, datetime.utcnow())
+
+    return {"status": "success", "count": len(data.logs)}
@@ -1,7 +1,11 @@
 from dotenv import load_dotenv
 load_dotenv()   # ← SABSE PEHLE
 
-from fastapi import FastAPI, Depends
+import os
+
+import hmac
+
+from fastapi import FastAPI, Depends, Header, HTTPException, Request
 from threading import Thread
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -15,10 +19,19 @@ from .logs import router as logs_router
 from .incidents import router as incidents_router
 from .agent_routes import router as agent_router
 from .incident_resolver import run_resolver
+from .prediagnosis import run_prediagnosis
+from .job_routes import router as jobs_router
+from .job_worker import run_worker_thread
+from ai_agent import metrics
 
 app = FastAPI(title="RADAR-AI API Gateway")
 
 Thread(target=run_resolver, daemon=True).start()
+Thread(target=run_prediagnosis, daemon=True).start()
+
+# Diagnose / fix jobs; JOB_WORKER_IN_API=0 when `python -m api_gateway.worker` runs them
+if os.getenv("JOB_WORKER_IN_API", "1") == "1":
+    Thread(target=run_worker_thread, daemon=True).start()
 
 # PUBLIC
 app.include_router(auth_router, prefix="/auth")
@@ -28,12 +41,28 @@ app.include_router(agent_router)
 # PROTECTED
 app.include_router(project_router, dependencies=[Depends(get_current_user)])
 app.include_router(incidents_router, dependencies=[Depends(get_current_user)])
+app.include_router(jobs_router, dependencies=[Depends(get_current_user)])
 
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+
+# Set METRICS_TOKEN to scrape from other hosts (X-Metrics-Token
+# header); without it /metrics only answers loopback clients.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+@app.get("/metrics")
+def get_metrics(request: Request, x_metrics_token: str = Header("")):
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(x_metrics_token.encode(), METRICS_TOKEN.encode()):
+            raise HTTPException(401, "Invalid metrics token")
+    elif not request.client or request.client.host not in ("127.0.0.1", "::1", "localhost"):
+        raise HTTPException(403, "Metrics are only served to localhost")
+    return metrics.snapshot()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
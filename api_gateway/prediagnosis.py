@@ -0,0 +1,231 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from ai_agent import metrics
+from ai_agent.diagnosis import summarize_incident
+from ai_agent.incident_selector import prioritize_incidents
+from ai_agent.llm import _ainvoke, _incident_diagnosis_prompt
+from ai_agent.llm_limits import LLMDeadlineExceeded, TokenBucket, estimate_tokens
+from ai_agent.prompt_builder import log_window_version
+from ai_agent.retriever import retrieve_incident_logs
+
+from .db import db   # ✅ SAME SHARED DB
+
+# ============================================================
+# 🔮 BACKGROUND PRE-DIAGNOSIS
+# ============================================================
+#
+# Every PREDIAGNOSIS_INTERVAL seconds, diagnoses the top-N active
+# incidents per project (prioritize_incidents order) that are new or
+# changed, and stores the result on the incident:
+#
+#     "prediagnosis": {"text", "window_version", "count", "created_at"}
+#
+# /incidents/diagnose serves it directly while the incident's log
+# window still has the same version (see log_window_version).
+# Incidents that need no diagnosis (no logs, deterministic) only get
+# "count" and "skipped", so they are not looked at again until new
+# logs arrive; over-budget ones also get "retry_at".
+#
+# Every API worker starts the loop, but only the holder of the
+# "prediagnosis" lease in db.leases runs passes, so the budget is
+# spent (and each incident diagnosed) once per deployment. Calls go
+# through the async LLM path: global concurrency limit and deadline.
+
+PREDIAGNOSIS_ENABLED = os.getenv("PREDIAGNOSIS_ENABLED", "1") == "1"
+PREDIAGNOSIS_INTERVAL_SECONDS = int(os.getenv("PREDIAGNOSIS_INTERVAL", "60"))
+PREDIAGNOSIS_TOP_N = int(os.getenv("PREDIAGNOSIS_TOP_N", "3"))
+
+# Prompt tokens per project per hour spent on speculative diagnoses,
+# separate from the interactive budget so clicks never wait on it
+PREDIAGNOSIS_TOKENS_PER_HOUR = int(os.getenv("PREDIAGNOSIS_TOKENS_PER_HOUR", "20000"))
+
+PREDIAGNOSIS_DEADLINE_SECONDS = float(os.getenv("PREDIAGNOSIS_DEADLINE", "60"))
+
+# A runner that stops renewing (crashed, hung) is replaced after this
+PREDIAGNOSIS_LEASE_SECONDS = int(os.getenv("PREDIAGNOSIS_LEASE", str(3 * PREDIAGNOSIS_INTERVAL_SECONDS)))
+
+_LEASE_ID = "prediagnosis"
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# Only the lease holder spends; a new holder starts with full buckets
+_buckets: Dict[str, TokenBucket] = {}
+
+
+def hold_lease() -> bool:
+    """
+    Take or renew the runner lease. False while another worker holds
+    an unexpired one.
+    """
+    now = datetime.utcnow()
+    try:
+        db.leases.find_one_and_update(
+            {"_id": _LEASE_ID, "$or": [{"owner": _OWNER}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": _OWNER, "expires_at": now + timedelta(seconds=PREDIAGNOSIS_LEASE_SECONDS)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False   # held by someone else: the upsert collided
+
+
+def _take_budget(project_id: str, prompt: str) -> float:
+    """
+    Non-blocking: 0 when the prompt was charged to the project's
+    hourly pre-diagnosis budget, else seconds until it could be
+    (nothing taken).
+    """
+    bucket = _buckets.get(project_id)
+    if bucket is None:
+        bucket = _buckets[project_id] = TokenBucket(
+            PREDIAGNOSIS_TOKENS_PER_HOUR / 3600.0,
+            PREDIAGNOSIS_TOKENS_PER_HOUR,
+        )
+    cost = estimate_tokens(prompt)
+    wait = bucket.reserve(cost)
+    if wait > 0:
+        bucket.refund(cost)
+    return wait
+
+
+def _record_skip(incident: Dict, outcome: str, retry_at: Optional[datetime] = None) -> str:
+    db.incidents.update_one(
+        {"_id": incident["_id"]},
+        {"$set": {
+            "prediagnosis.count": incident.get("count", 0),
+            "prediagnosis.skipped": outcome,
+            "prediagnosis.retry_at": retry_at,
+        }},
+    )
+    return outcome
+
+
+def _priority_payload(incidents: List[Dict]) -> List[Dict]:
+    return [{
+        "id": str(i["_id"]),
+        "service": i.get("service"),
+        "message": i.get("message"),
+        "count": i.get("count", 0),
+        "last_seen": i.get("last_seen"),
+        "status": i.get("status", "ACTIVE"),
+    } for i in incidents]
+
+
+async def prediagnose_incident(incident: Dict) -> str:
+    """
+    Diagnose one incident if its stored result is missing or stale.
+    Returns what happened: "fresh", "budget", "no_logs",
+    "deterministic" (answered without the LLM anyway), "timeout" or
+    "stored".
+    """
+    project_id = str(incident["project_id"])
+    logs = await asyncio.to_thread(retrieve_incident_logs, project_id, incident["_id"])
+    if not logs:
+        return await asyncio.to_thread(_record_skip, incident, "no_logs")
+    if summarize_incident(incident, logs)["confident"]:
+        return await asyncio.to_thread(_record_skip, incident, "deterministic")
+
+    version = log_window_version(logs)
+    stored = incident.get("prediagnosis") or {}
+    if stored.get("text") and stored.get("window_version") == version:
+        # more repeats of the same messages: the diagnosis still holds
+        await asyncio.to_thread(
+            db.incidents.update_one,
+            {"_id": incident["_id"]},
+            {"$set": {"prediagnosis.count": incident.get("count", 0)}},
+        )
+        return "fresh"
+
+    prompt = _incident_diagnosis_prompt(incident, logs)
+    wait = _take_budget(project_id, prompt)
+    if wait > 0:
+        retry_at = datetime.utcnow() + timedelta(seconds=wait)
+        return await asyncio.to_thread(_record_skip, incident, "budget", retry_at)
+
+    # no project_id: the interactive per-project budget is not charged
+    try:
+        diagnosis = (await _ainvoke(prompt, deadline=PREDIAGNOSIS_DEADLINE_SECONDS)).strip()
+    except LLMDeadlineExceeded:
+        return "timeout"
+
+    await asyncio.to_thread(
+        db.incidents.update_one,
+        {"_id": incident["_id"]},
+        {"$set": {"prediagnosis": {
+            "text": diagnosis,
+            "window_version": version,
+            "count": incident.get("count", 0),
+            "created_at": datetime.utcnow(),
+        }}},
+    )
+    return "stored"
+
+
+def _due(incident: Dict, now: datetime) -> bool:
+    stored = incident.get("prediagnosis") or {}
+    if not stored or stored.get("count") != incident.get("count", 0):
+        return True
+    # unchanged since the last pass; over-budget ones retry when due
+    retry_at = stored.get("retry_at")
+    return retry_at is not None and retry_at <= now
+
+
+def _active_incidents() -> List[Dict]:
+    return list(db.incidents.find(
+        {"status": "ACTIVE"},
+        {"project_id": 1, "service": 1, "message": 1, "count": 1,
+         "last_seen": 1, "status": 1, "frames": 1, "prediagnosis": 1},
+    ))
+
+
+async def prediagnose_once() -> None:
+    incidents = await asyncio.to_thread(_active_incidents)
+    now = datetime.utcnow()
+
+    by_project: Dict[str, List[Dict]] = {}
+    for incident in incidents:
+        by_project.setdefault(str(incident.get("project_id")), []).append(incident)
+
+    for project_incidents in by_project.values():
+        by_id = {str(i["_id"]): i for i in project_incidents}
+        ranked = prioritize_incidents(_priority_payload(project_incidents))["prioritized_incidents"]
+
+        for entry in ranked[:PREDIAGNOSIS_TOP_N]:
+            incident = by_id[entry["incident_id"]]
+            if not _due(incident, now):
+                continue
+
+            # a long pass keeps the lease; stop if another worker took it
+            if not await asyncio.to_thread(hold_lease):
+                return
+
+            try:
+                outcome = await prediagnose_incident(incident)
+            except Exception:
+                outcome = "failed"
+            metrics.incr(f"prediagnosis.{outcome}")
+
+
+async def _run() -> None:
+    while True:
+        try:
+            if await asyncio.to_thread(hold_lease):
+                await prediagnose_once()
+            else:
+                metrics.incr("prediagnosis.standby")
+        except Exception:
+            metrics.incr("prediagnosis.failed")
+        await asyncio.sleep(PREDIAGNOSIS_INTERVAL_SECONDS)
+
+
+def run_prediagnosis():
+    if not PREDIAGNOSIS_ENABLED:
+        return
+    # own event loop, like the job worker thread
+    asyncio.run(_run())
@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from ai_agent import metrics
+
+RANKING_CACHE_SIZE = int(os.getenv("RANKING_CACHE_SIZE", "2048"))
+
+
+# ============================================================
+# 🗂️ FILE RANKING CACHE (PROCESS LOCAL)
+# ============================================================
+#
+# Ranked files for an incident only change when the project
+# structure or the incident's logs do, so results are memoized under
+#
+#   (project_id, fingerprint, structure version, log window version,
+#    feedback version)
+#
+# where the log window version is the incident's count/last_seen and
+# the feedback version moves with recorded resolutions.
+# Any change produces a new key; stale entries age out of the LRU.
+
+_CACHE: "OrderedDict[tuple, List[Dict]]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def ranking_key(
+    project_id: str,
+    incident: Dict,
+    structure_version: Optional[int],
+    feedback_version: int = 0,
+) -> Optional[tuple]:
+    """
+    None when the inputs are not versioned (no watcher structure),
+    in which case nothing is cached.
+    """
+    if structure_version is None or not incident.get("fingerprint"):
+        return None
+    return (
+        project_id,
+        incident["fingerprint"],
+        structure_version,
+        incident.get("count", 0),
+        str(incident.get("last_seen")),
+        feedback_version,
+        len(incident.get("attempted_files") or ()),
+    )
+
+
+def get_cached_ranking(key: Optional[tuple]) -> Optional[List[Dict]]:
+    if key is None:
+        return None
+
+    with _LOCK:
+        ranked = _CACHE.get(key)
+        if ranked is not None:
+            _CACHE.move_to_end(key)
+
+    metrics.incr("ranking_cache.hits" if ranked is not None else "ranking_cache.misses")
+    return ranked
+
+
+def store_ranking(key: Optional[tuple], ranked: List[Dict]) -> None:
+    if key is None:
+        return
+
+    with _LOCK:
+        _CACHE[key] = ranked
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > RANKING_CACHE_SIZE:
+            _CACHE.popitem(last=False)
@@ -0,0 +1,174 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from .db import db
+
+FEEDBACK_TABLE_TTL_SECONDS = int(os.getenv("FEEDBACK_TABLE_TTL", "60"))
+
+# Files that resolved similar incidents move up; files already tried
+# for this incident (and did not fix it) move far down.
+RESOLVED_BOOST_SCORE = 60
+SIMILAR_ATTEMPT_PENALTY = 20
+ATTEMPTED_PENALTY = 150
+
+MAX_FEEDBACK_KEYS = 20
+
+_TOKEN_RE = re.compile(r"[a-z_]{3,}")
+_STOP_TOKENS = {
+    "the", "and", "for", "not", "with", "from", "error", "failed",
+    "exception", "none", "null", "undefined", "line", "file",
+}
+
+
+# ============================================================
+# 🔹 FEEDBACK KEYS
+# ============================================================
+#
+# An incident is described by its service and the tokens of its
+# normalized message. Resolutions are counted per (key, file):
+#
+#   resolution_feedback: { project_id, key, file, resolved, attempted }
+
+def feedback_keys(incident: Dict) -> List[str]:
+    keys = []
+    if incident.get("service"):
+        keys.append(f"service:{incident['service'].lower()}")
+
+    message = (incident.get("message") or "").lower()
+    for token in dict.fromkeys(_TOKEN_RE.findall(message)):
+        if token not in _STOP_TOKENS:
+            keys.append(token)
+        if len(keys) >= MAX_FEEDBACK_KEYS:
+            break
+    return keys
+
+
+# ============================================================
+# 📊 PER-PROJECT TABLE (PROCESS LOCAL, MONGO BACKED)
+# ============================================================
+
+class FeedbackTable:
+    """
+    key -> file -> [resolved, attempted]. Loaded once per project and
+    patched in place as resolutions are recorded; reloaded every
+    FEEDBACK_TABLE_TTL seconds to pick up other workers' writes.
+
+    Resolutions are recorded from request threads while others
+    score, so add() and scores() both take `_lock`.
+    """
+
+    def __init__(self, rows: List[Dict] = ()):
+        self.counts: Dict[str, Dict[str, List[int]]] = {}
+        self.version = 0
+        self.loaded_at = time.monotonic()
+        self._lock = threading.RLock()
+        for row in rows:
+            self.add(row["key"], row["file"], row.get("resolved", 0), row.get("attempted", 0))
+
+    def add(self, key: str, file: str, resolved: int = 0, attempted: int = 0) -> None:
+        with self._lock:
+            counts = self.counts.setdefault(key, {}).setdefault(file, [0, 0])
+            counts[0] += resolved
+            counts[1] += attempted
+            # Counters only grow, so their total versions the table the
+            # same way in every worker
+            self.version += resolved + attempted
+
+    def scores(self, incident: Dict) -> Dict[str, int]:
+        """
+        path -> score adjustment for an incident. Cost follows the
+        incident's keys, not the table size.
+        """
+        keys = feedback_keys(incident)
+        support: Dict[str, List[float]] = {}
+
+        with self._lock:
+            for key in keys:
+                for file, (resolved, attempted) in self.counts.get(key, {}).items():
+                    s = support.setdefault(file, [0.0, 0.0])
+                    s[0] += resolved
+                    s[1] += attempted
+
+        scores: Dict[str, int] = {}
+        n = max(len(keys), 1)
+        for file, (resolved, attempted) in support.items():
+            score = round(
+                RESOLVED_BOOST_SCORE * min(resolved / n, 1.0)
+                - SIMILAR_ATTEMPT_PENALTY * min(attempted / n, 1.0)
+            )
+            if score:
+                scores[file] = score
+
+        for file in incident.get("attempted_files") or []:
+            if file:
+                scores[file] = scores.get(file, 0) - ATTEMPTED_PENALTY
+        return scores
+
+
+_TABLES: Dict[str, FeedbackTable] = {}
+_TABLES_LOCK = threading.Lock()
+_index_ready = False
+
+
+def _ensure_index() -> None:
+    global _index_ready
+    if not _index_ready:
+        db.resolution_feedback.create_index([("project_id", 1), ("key", 1), ("file", 1)], unique=True)
+        _index_ready = True
+
+
+def get_feedback_table(project_oid: ObjectId) -> FeedbackTable:
+    project_id = str(project_oid)
+    with _TABLES_LOCK:
+        table = _TABLES.get(project_id)
+    if table is not None and time.monotonic() - table.loaded_at < FEEDBACK_TABLE_TTL_SECONDS:
+        return table
+
+    _ensure_index()
+    rows = db.resolution_feedback.find(
+        {"project_id": project_oid},
+        {"_id": 0, "key": 1, "file": 1, "resolved": 1, "attempted": 1},
+    )
+    fresh = FeedbackTable(list(rows))
+
+    with _TABLES_LOCK:
+        _TABLES[project_id] = fresh
+    return fresh
+
+
+def record_resolution(project_oid: ObjectId, incident: Dict, file_path: Optional[str], resolved: bool) -> None:
+    """
+    Count a resolution (or failed attempt) against every key of the
+    incident, in Mongo and in this process's table.
+    """
+    if not file_path:
+        return
+
+    _ensure_index()
+    field = "resolved" if resolved else "attempted"
+    keys = feedback_keys(incident)
+
+    if keys:
+        db.resolution_feedback.bulk_write([
+            UpdateOne(
+                {"project_id": project_oid, "key": key, "file": file_path},
+                {"$inc": {field: 1}},
+                upsert=True,
+            )
+            for key in keys
+        ], ordered=False)
+
+    with _TABLES_LOCK:
+        table = _TABLES.get(str(project_oid))
+    if table is not None:
+        for key in keys:
+            if resolved:
+                table.add(key, file_path, resolved=1)
+            else:
+                table.add(key, file_path, attempted=1)
@@ -0,0 +1,177 @@
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+from ai_agent.path_index import build_path_index, update_path_index
+
+from .agent_state import STRUCTURE, STRUCTURE_VERSION, get_state_store
+
+
+# ============================================================
+# 🔹 STRUCTURE SYNC (FULL + DELTA)
+# ============================================================
+#
+# Each project keeps a versioned file index:
+#   project_id -> { files: {path: entry}, version, updated_at }
+#
+# A full push replaces the index and bumps the version.
+# A delta push ({added, modified, removed}) is only applied when
+# its base_version matches the current version; otherwise the
+# watcher is asked to resync with a full push.
+#
+# Versions never repeat, even after the entry expires or is evicted:
+# other workers' path indexes and ranking cache keys are keyed by
+# them, so a reused number would serve a stale structure.
+#
+# The version is also kept under STRUCTURE_VERSION, written after the
+# structure itself, for readers that only need to know if it moved.
+
+
+def _index_files(files: List[Dict]) -> Dict[str, Dict]:
+    index = {}
+    for f in files:
+        path = f.get("path") if isinstance(f, dict) else None
+        if path:
+            index[path] = f
+    return index
+
+
+_last_version = 0
+_version_lock = threading.Lock()
+
+
+def _next_version(previous: Optional[int]) -> int:
+    """
+    Microsecond clock, or previous + 1 when that is further ahead,
+    and never a number this process already handed out. (Stays
+    below 2^53, so JSON clients read it exactly.)
+    """
+    global _last_version
+    with _version_lock:
+        _last_version = max((previous or 0) + 1, time.time_ns() // 1000, _last_version + 1)
+        return _last_version
+
+
+def get_structure_version(project_id: str) -> Optional[int]:
+    store = get_state_store()
+    current = store.get(STRUCTURE_VERSION, project_id)
+    if current:
+        return current.get("version")
+
+    # version key evicted (or written by an older gateway)
+    entry = store.get(STRUCTURE, project_id)
+    if not entry:
+        return None
+    return entry.get("version")
+
+
+def _publish_version(project_id: str, version: int) -> None:
+    get_state_store().set(STRUCTURE_VERSION, project_id, {"version": version})
+
+
+def apply_full_structure(project_id: str, files: List[Dict]) -> Dict:
+    """
+    Replace the whole file index for a project.
+    """
+    entry = {
+        "files": _index_files(files),
+        "version": _next_version(get_structure_version(project_id)),
+        "updated_at": datetime.utcnow(),
+    }
+    get_state_store().set(STRUCTURE, project_id, entry)
+    _publish_version(project_id, entry["version"])
+    build_path_index(project_id, entry)
+    return entry
+
+
+def apply_structure_delta(
+    project_id: str,
+    base_version: Optional[int],
+    added: List[Dict],
+    modified: List[Dict],
+    removed: List[str],
+) -> Optional[Dict]:
+    """
+    Apply a delta against base_version.
+
+    Returns the updated entry, or None when the versions diverged
+    (including a concurrent delta against the same base) and the
+    watcher must send a full structure instead.
+    """
+    store = get_state_store()
+    entry = store.get(STRUCTURE, project_id)
+    if not entry or base_version is None or entry.get("version") != base_version:
+        return None
+
+    files = entry["files"]
+
+    for path in removed:
+        files.pop(path, None)
+
+    for f in added:
+        path = f.get("path") if isinstance(f, dict) else None
+        if path:
+            files[path] = f
+
+    for f in modified:
+        path = f.get("path") if isinstance(f, dict) else None
+        if path:
+            files[path] = {**files.get(path, {}), **f}
+
+    entry["version"] = _next_version(base_version)
+    entry["updated_at"] = datetime.utcnow()
+    if not store.set_if_version(STRUCTURE, project_id, base_version, entry):
+        return None   # another delta at the same base won: resync
+    _publish_version(project_id, entry["version"])
+    update_path_index(project_id, base_version, entry, added, modified, removed)
+    return entry
+
+
+def _list_of(payload: Dict, field: str, kind: type) -> List:
+    """
+    payload[field] as a list of `kind`; 400 for anything else (the
+    body is watcher input).
+    """
+    value = payload.get(field, [])
+    if not isinstance(value, list) or not all(isinstance(v, kind) for v in value):
+        raise HTTPException(400, f"{field} must be a list of {'objects' if kind is dict else 'strings'}")
+    return value
+
+
+def handle_structure_payload(project_id: str, payload: Dict) -> Dict:
+    """
+    Full push:  { files: [...] }
+    Delta push: { mode: "delta", base_version, added, modified, removed }
+
+    Shared by the HTTP endpoint and the watcher WebSocket.
+    """
+    if payload.get("mode") == "delta":
+        entry = apply_structure_delta(
+            project_id,
+            base_version=payload.get("base_version"),
+            added=_list_of(payload, "added", dict),
+            modified=_list_of(payload, "modified", dict),
+            removed=_list_of(payload, "removed", str),
+        )
+        if entry is None:
+            return {
+                "status": "resync_required",
+                "version": get_structure_version(project_id),
+            }
+
+        return {
+            "status": "structure_updated",
+            "version": entry["version"],
+            "count": len(entry["files"]),
+        }
+
+    entry = apply_full_structure(project_id, _list_of(payload, "files", dict))
+
+    return {
+        "status": "structure_received",
+        "version": entry["version"],
+        "count": len(entry["files"]),
+    }
@@ -0,0 +1,227 @@
+import base64
+import hashlib
+import io
+import os
+import secrets
+import zlib
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+
+from .agent_state import FILE_UPLOAD, get_state_store
+
+try:
+    import zstandard
+except ImportError:  # optional: gzip still works without it
+    zstandard = None
+
+
+# ============================================================
+# 🔹 LIMITS
+# ============================================================
+
+# Files above this are useless as LLM context anyway
+MAX_FILE_CONTENT_BYTES = int(os.getenv("MAX_FILE_CONTENT_BYTES", str(512 * 1024)))
+
+# Watchers switch to chunked uploads above this size
+CHUNKED_UPLOAD_THRESHOLD = int(os.getenv("CHUNKED_UPLOAD_THRESHOLD", str(128 * 1024)))
+CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+
+# JSON escaping inflates source code a little
+_JSON_OVERHEAD = 4096
+
+
+def max_file_bytes(project: Dict) -> int:
+    """
+    Per-project cap (projects.max_file_bytes), never above the global cap.
+    """
+    cap = project.get("max_file_bytes") or MAX_FILE_CONTENT_BYTES
+    return min(int(cap), MAX_FILE_CONTENT_BYTES)
+
+
+def json_body_limit(cap: int) -> int:
+    return cap * 2 + _JSON_OVERHEAD
+
+
+# ============================================================
+# 🔹 BODY DECODING (gzip / zstd / identity)
+# ============================================================
+
+class _Decoder:
+    """
+    Decompressor that stops as soon as the decoded size passes
+    `limit`, so compression bombs never expand in full.
+
+    gzip/deflate decode as chunks arrive (max_length bounds each
+    step). zstd's decompressobj has no output bound, so its input is
+    buffered (capped just above `limit`: real source code compresses,
+    it never grows much) and decoded in finish() through a
+    stream_reader read of at most limit + 1 bytes.
+    """
+
+    def __init__(self, encoding: str, limit: int):
+        self.limit = limit
+        self.size = 0
+        self._zstd: Optional[list] = None
+        encoding = (encoding or "identity").lower().strip()
+
+        if encoding in ("", "identity"):
+            self._obj = None
+        elif encoding in ("gzip", "x-gzip"):
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            self._obj = zlib.decompressobj()
+        elif encoding == "zstd":
+            if zstandard is None:
+                raise HTTPException(415, "zstd encoding not supported by this server")
+            self._obj = None
+            self._zstd = []
+        else:
+            raise HTTPException(415, f"Unsupported Content-Encoding: {encoding}")
+
+    def feed(self, data: bytes) -> bytes:
+        if self._zstd is not None:
+            self.size += len(data)
+            if self.size > self.limit + self.limit // 64 + 1024:
+                self._too_large()
+            self._zstd.append(data)
+            return b""
+
+        if self._obj is None:
+            out = data
+        else:
+            out = self._obj.decompress(data, self.limit - self.size + 1)
+            if self._obj.unconsumed_tail:
+                self._too_large()
+
+        self.size += len(out)
+        if self.size > self.limit:
+            self._too_large()
+        return out
+
+    def finish(self) -> bytes:
+        if self._zstd is None:
+            return b""
+
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            io.BytesIO(b"".join(self._zstd)), read_across_frames=True
+        )
+        parts, size = [], 0
+        try:
+            while size <= self.limit:
+                part = reader.read(self.limit - size + 1)
+                if not part:
+                    break
+                parts.append(part)
+                size += len(part)
+        except zstandard.ZstdError:
+            raise HTTPException(400, "Invalid zstd body")
+        if size > self.limit:
+            self._too_large()
+        self.size = size
+        return b"".join(parts)
+
+    def _too_large(self):
+        raise HTTPException(413, "File content exceeds the project size limit")
+
+
+async def read_body(request: Request, limit: int) -> bytes:
+    """
+    Read a request body, decoding Content-Encoding on the fly and
+    rejecting it before it is fully read once `limit` is passed.
+    """
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise HTTPException(413, "File content exceeds the project size limit")
+
+    decoder = _Decoder(request.headers.get("content-encoding", ""), limit)
+    parts = []
+    async for chunk in request.stream():
+        if chunk:
+            parts.append(decoder.feed(chunk))
+    parts.append(decoder.finish())
+    return b"".join(parts)
+
+
+# ============================================================
+# 📦 CHUNKED UPLOADS (RESUMABLE)
+# ============================================================
+#
+# upload_id       -> { project_id, path, size, sha256, received, chunks, version }
+# upload_id:<n>   -> { data } (base64, one entry per chunk)
+#
+# Chunks live in the agent state store, so any worker can accept
+# the next chunk and a watcher can resume after a dropped connection.
+# A chunk first advances the upload record by compare-and-set on its
+# version, and only the winner writes chunk <n>: a retry racing the
+# original (on any worker) gets 409 instead of a second copy.
+
+def start_upload(project_id: str, path: str, size: int, sha256: Optional[str], cap: int) -> Dict:
+    if size > cap:
+        raise HTTPException(413, "File content exceeds the project size limit")
+
+    upload = {
+        "upload_id": secrets.token_hex(12),
+        "project_id": project_id,
+        "path": path,
+        "size": size,
+        "sha256": sha256,
+        "received": 0,
+        "chunks": 0,
+        "version": 0,
+    }
+    get_state_store().set(FILE_UPLOAD, upload["upload_id"], upload)
+    return upload
+
+
+def get_upload(upload_id: str, project_id: str) -> Dict:
+    upload = get_state_store().get(FILE_UPLOAD, upload_id)
+    if not upload or upload["project_id"] != project_id:
+        raise HTTPException(404, "Upload not found")
+    return upload
+
+
+def append_chunk(upload: Dict, offset: int, data: bytes) -> Dict:
+    if offset != upload["received"]:
+        raise HTTPException(409, f"Expected offset {upload['received']}")
+
+    if upload["received"] + len(data) > upload["size"]:
+        raise HTTPException(413, "Chunk exceeds declared file size")
+
+    store = get_state_store()
+    advanced = {
+        **upload,
+        "received": upload["received"] + len(data),
+        "chunks": upload["chunks"] + 1,
+        "version": (upload.get("version") or 0) + 1,
+    }
+    if not store.set_if_version(FILE_UPLOAD, upload["upload_id"], upload.get("version"), advanced):
+        raise HTTPException(409, "Chunk already received, fetch the upload status")
+
+    store.set(FILE_UPLOAD, f"{upload['upload_id']}:{upload['chunks']}", {
+        "data": base64.b64encode(data).decode("ascii"),
+    })
+    return advanced
+
+
+def finish_upload(upload: Dict) -> str:
+    """
+    Assemble a complete upload into text and drop its chunks.
+    """
+    store = get_state_store()
+    parts = []
+    for n in range(upload["chunks"]):
+        chunk = store.get(FILE_UPLOAD, f"{upload['upload_id']}:{n}")
+        if chunk is None:
+            raise HTTPException(410, "Upload expired, restart it")
+        parts.append(base64.b64decode(chunk["data"]))
+
+    data = b"".join(parts)
+    if upload.get("sha256") and hashlib.sha256(data).hexdigest() != upload["sha256"]:
+        raise HTTPException(422, "Checksum mismatch")
+
+    for n in range(upload["chunks"]):
+        store.delete(FILE_UPLOAD, f"{upload['upload_id']}:{n}")
+    store.delete(FILE_UPLOAD, upload["upload_id"])
+
+    return data.decode("utf-8", errors="replace")
@@ -0,0 +1,21 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+import asyncio
+
+from .db import init_db
+init_db()       # before any module binds `db`
+
+from .job_worker import run_worker
+
+# ============================================================
+# 🛠️ STANDALONE JOB WORKER
+# ============================================================
+#
+#     python -m api_gateway.worker
+#
+# Run with JOB_WORKER_IN_API=0 on the API to keep LLM work out of
+# the HTTP processes.
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from ai_agent import agent, llm
+from ai_agent.llm_stub import StubChatModel, StubMessage
+
+LOGS = [
+    {"_id": f"l{n}", "level": "ERROR", "message": "database connection refused on orders-db"}
+    for n in range(5)
+]
+GROUNDED = "The orders-db database refused the connection."
+UNGROUNDED = "Something went wrong somewhere."
+
+
+class CandidateModel(StubChatModel):
+    """
+    StubChatModel with a (latency, answer) per candidate seed
+    (candidate 0 is the greedy call, without a seed).
+    """
+
+    def __init__(self, plan):
+        super().__init__(latency=0)
+        self.plan = plan
+        self.finished = []
+        self.cancelled = []
+
+    async def ainvoke(self, prompt, **params):
+        seed = params.get("seed", 0)
+        latency, answer = self.plan[seed]
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            self.cancelled.append(seed)
+            raise
+        self.finished.append(seed)
+        return StubMessage(answer)
+
+
+@pytest.fixture
+def run(monkeypatch):
+    def use(plan):
+        model = CandidateModel(plan)
+        monkeypatch.setattr(llm, "get_llm", lambda: model)
+        monkeypatch.setattr(llm, "get_llm_cache", lambda: None)
+        monkeypatch.setattr(agent, "AGENT_PARALLEL_CANDIDATES", len(plan))
+        monkeypatch.setattr(agent, "retrieve_log_stats", lambda p, s: {})
+        monkeypatch.setattr(agent, "grade_log_stats", lambda stats: True)
+        monkeypatch.setattr(agent, "retrieve_logs", lambda p, secret, s: LOGS)
+        monkeypatch.setattr(agent, "grade_logs", lambda logs: True)
+        return model, agent.run_agent("p1", "secret", "orders")
+    return use
+
+
+def test_first_grounded_candidate_wins(run):
+    model, result = run({
+        0: (0.5, GROUNDED),     # greedy call, slow
+        1: (0.01, UNGROUNDED),  # first back, rejected
+        2: (0.05, GROUNDED),    # first grounded
+    })
+
+    assert result["status"] == "success"
+    assert result["diagnosis"] == GROUNDED
+    assert result["attempt"] == 3
+    assert result["candidates"] == 3
+    assert result["grounding"]["grounded"]
+    assert model.finished == [1, 2]
+
+
+def test_remaining_candidates_are_cancelled(run):
+    model, result = run({
+        0: (0.01, GROUNDED),
+        1: (5, GROUNDED),
+        2: (5, UNGROUNDED),
+    })
+
+    assert result["attempt"] == 1
+    assert sorted(model.cancelled) == [1, 2]
+
+
+def test_all_ungrounded_candidates_fail_safely(run):
+    model, result = run({i: (0.01 * i, UNGROUNDED) for i in range(3)})
+
+    assert result["status"] == "failed"
+    assert result["reason"] == "Could not verify any diagnosis against logs"
+    assert result["confidence"] == 0.2
+    assert sorted(model.finished) == [0, 1, 2]
@@ -0,0 +1,286 @@
+import os
+import socket
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from api_gateway import agent_state
+from api_gateway.agent_state import MemoryStateStore, RedisStateStore, StateTooLarge
+from api_gateway import structure_sync
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ============================================================
+# 🧠 MEMORY STORE
+# ============================================================
+
+def test_memory_entries_expire_after_namespace_ttl():
+    store = MemoryStateStore(ttls={"short": 0.05, "long": 60})
+    store.set("short", "k", {"v": 1})
+    store.set("long", "k", {"v": 2})
+
+    time.sleep(0.1)
+
+    assert store.get("short", "k") is None
+    assert store.get("long", "k") == {"v": 2}
+
+
+def test_memory_byte_cap_evicts_least_recently_used():
+    value = {"v": "x" * 100}   # ~165 bytes estimated
+    store = MemoryStateStore(max_bytes=400, ttls={})
+    store.set("ns", "a", value)
+    store.set("ns", "b", value)
+    store.get("ns", "a")   # a is now the most recent
+
+    store.set("ns", "c", value)
+
+    assert store.get("ns", "b") is None
+    assert store.get("ns", "a") == value
+    assert store.get("ns", "c") == value
+    assert store._bytes <= store.max_bytes
+
+
+def test_memory_value_larger_than_cap_raises():
+    store = MemoryStateStore(max_bytes=100, ttls={})
+    store.set("ns", "k", {"v": 1})
+
+    with pytest.raises(StateTooLarge):
+        store.set("ns", "k", {"v": "x" * 1000})
+    assert store.get("ns", "k") == {"v": 1}
+
+
+def test_memory_get_returns_a_copy():
+    store = MemoryStateStore(ttls={})
+    original = {"files": {"a.py": {}}}
+    store.set("ns", "k", original)
+    original["files"]["b.py"] = {}
+
+    got = store.get("ns", "k")
+    got["files"]["c.py"] = {}
+
+    assert store.get("ns", "k") == {"files": {"a.py": {}}}
+
+
+def test_memory_expired_entries_are_swept_without_a_read():
+    store = MemoryStateStore(ttls={"short": 0.05, "long": 60})
+    for n in range(100):
+        store.set("long", str(n), {"v": n})
+    store.set("short", "k", {"v": 1})
+
+    time.sleep(0.1)
+    store.set("long", "0", {"v": 0})
+
+    assert ("short", "k") not in store._data
+    assert len(store._data) == 100
+
+
+def test_memory_expiry_heap_stays_bounded_under_rewrites():
+    store = MemoryStateStore(ttls={"ns": 60})
+    for n in range(5000):
+        store.set("ns", str(n % 10), {"v": n})
+
+    assert len(store._expiries) < 100   # not one per write
+    assert store.get("ns", "9") == {"v": 4999}
+
+
+def test_memory_structure_copies_the_file_map_not_the_entries():
+    store = MemoryStateStore(ttls={})
+    store.set(agent_state.STRUCTURE, "p1", {"files": {"a.py": {"path": "a.py"}}, "version": 1})
+
+    got = store.get(agent_state.STRUCTURE, "p1")
+    got["files"]["b.py"] = {"path": "b.py"}
+    got["version"] = 2
+
+    stored = store._data[(agent_state.STRUCTURE, "p1")][0]
+    assert stored == {"files": {"a.py": {"path": "a.py"}}, "version": 1}
+    assert got["files"]["a.py"] is stored["files"]["a.py"]
+
+
+# ============================================================
+# 🔁 STRUCTURE DELTAS (COMPARE-AND-SET)
+# ============================================================
+
+@pytest.fixture
+def memory_store(monkeypatch):
+    store = MemoryStateStore(ttls={})
+    monkeypatch.setattr(agent_state, "_store", store)
+    return store
+
+
+def test_concurrent_deltas_on_same_base_apply_once(memory_store):
+    base = structure_sync.apply_full_structure("p1", [{"path": "a.py"}])["version"]
+
+    results = []
+    barrier = threading.Barrier(8)
+
+    def push(n):
+        barrier.wait()
+        results.append(structure_sync.apply_structure_delta("p1", base, [{"path": f"new_{n}.py"}], [], []))
+
+    threads = [threading.Thread(target=push, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    applied = [r for r in results if r is not None]
+    assert len(applied) == 1
+    entry = memory_store.get(agent_state.STRUCTURE, "p1")
+    assert len(entry["files"]) == 2
+    assert entry["version"] == applied[0]["version"] > base
+
+
+def test_structure_version_never_repeats_after_expiry(memory_store):
+    first = structure_sync.apply_full_structure("p1", [{"path": "a.py"}])["version"]
+    memory_store.delete(agent_state.STRUCTURE, "p1")   # expired / evicted
+
+    second = structure_sync.apply_full_structure("p1", [{"path": "b.py"}])["version"]
+
+    assert second > first
+
+
+def test_version_key_follows_pushes_and_skips_structure_reads(memory_store, monkeypatch):
+    from ai_agent import filesystem
+
+    full = structure_sync.apply_full_structure("p1", [{"path": "a.py"}])["version"]
+    assert memory_store.get(agent_state.STRUCTURE_VERSION, "p1") == {"version": full}
+
+    delta = structure_sync.apply_structure_delta("p1", full, [{"path": "b.py"}], [], [])["version"]
+    assert structure_sync.get_structure_version("p1") == delta
+
+    reads = []
+    get = memory_store.get
+    monkeypatch.setattr(memory_store, "get", lambda ns, key: reads.append(ns) or get(ns, key))
+
+    index = filesystem.get_project_path_index({"_id": "p1"})
+
+    assert index.version == delta and index.contains("b.py")
+    assert agent_state.STRUCTURE not in reads
+
+
+# ============================================================
+# 🌐 REDIS STORE (TWO PROCESSES)
+# ============================================================
+
+def test_redis_set_if_version_rejects_stale_writer():
+    fakeredis = pytest.importorskip("fakeredis")
+    store = RedisStateStore()
+    store._redis = fakeredis.FakeRedis()
+
+    store.set("structure", "p1", {"version": 1})
+
+    assert store.set_if_version("structure", "p1", 1, {"version": 2})
+    assert not store.set_if_version("structure", "p1", 1, {"version": 3})
+    assert store.get("structure", "p1") == {"version": 2}
+
+
+def test_claim_is_exclusive_until_released_or_expired():
+    fakeredis = pytest.importorskip("fakeredis")
+    redis_store = RedisStateStore()
+    redis_store._redis = fakeredis.FakeRedis()
+
+    for store in (MemoryStateStore(ttls={}), redis_store):
+        assert store.claim("llm_claim", "k", "w1", 0.1)
+        assert not store.claim("llm_claim", "k", "w2", 5)
+
+        store.release("llm_claim", "k", "w2")   # not the holder: no-op
+        assert not store.claim("llm_claim", "k", "w2", 5)
+
+        store.release("llm_claim", "k", "w1")
+        assert store.claim("llm_claim", "k", "w2", 0.1)
+
+        time.sleep(0.15)
+        assert store.claim("llm_claim", "k", "w3", 5)
+
+
+@pytest.fixture
+def redis_url():
+    fakeredis = pytest.importorskip("fakeredis")
+    TcpFakeServer = getattr(fakeredis, "TcpFakeServer", None)
+    if TcpFakeServer is None:
+        pytest.skip("fakeredis without TcpFakeServer")
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"redis://127.0.0.1:{port}/0"
+    server.shutdown()
+    server.server_close()
+
+
+# Worker 1 handles the UI: asks for a file, then polls for its content.
+_UI_WORKER = """
+    import time
+    from api_gateway.agent_state import FILE_CONTENT, FILE_REQUEST, get_state_store, record_file_request
+
+    record_file_request("p1", "src/app.py")
+    for _ in range(200):
+        content = get_state_store().get(FILE_CONTENT, "p1")
+        status = get_state_store().get(FILE_REQUEST, "p1")["status"]
+        if content and status == "RECEIVED":
+            print(content["path"], content["content"])
+            break
+        time.sleep(0.05)
+"""
+
+# Worker 2 serves the watcher: /agent/poll, then the upload.
+_WATCHER_WORKER = """
+    import time
+    from api_gateway.agent_state import FILE_REQUEST, get_state_store, record_file_content
+
+    for _ in range(200):
+        req = get_state_store().get(FILE_REQUEST, "p1")
+        if req and req["status"] == "WAITING":
+            record_file_content("p1", req["path"], "print('hi')", req["request_id"])
+            print("uploaded", req["path"])
+            break
+        time.sleep(0.05)
+"""
+
+
+def _worker(script: str, url: str) -> subprocess.Popen:
+    env = {**os.environ, "AGENT_STATE_BACKEND": "redis", "AGENT_STATE_REDIS_URL": url}
+    return subprocess.Popen(
+        [sys.executable, "-c", textwrap.dedent(script)],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+
+
+def test_upload_in_one_process_is_seen_by_poll_in_another(redis_url):
+    ui = _worker(_UI_WORKER, redis_url)
+    watcher = _worker(_WATCHER_WORKER, redis_url)
+
+    ui_out, ui_err = ui.communicate(timeout=30)
+    watcher_out, watcher_err = watcher.communicate(timeout=30)
+
+    assert watcher_out.strip() == "uploaded src/app.py", watcher_err
+    assert ui_out.strip() == "src/app.py print('hi')", ui_err
+
+
+def test_redis_notify_reaches_subscribers_in_other_stores(redis_url):
+    publisher, subscriber = RedisStateStore(redis_url), RedisStateStore(redis_url)
+    seen = threading.Event()
+    subscriber.subscribe(lambda namespace, key: seen.set() if (namespace, key) == ("file_request", "p1") else None)
+    time.sleep(0.2)   # listener connects
+
+    publisher.notify("file_request", "p1")
+
+    assert seen.wait(5)
+
+
+def test_memory_notify_calls_local_subscribers():
+    store = MemoryStateStore(ttls={})
+    seen = []
+    store.subscribe(lambda namespace, key: seen.append((namespace, key)))
+
+    store.notify("file_request", "p1")
+
+    assert seen == [("file_request", "p1")]
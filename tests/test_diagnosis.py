@@ -0,0 +1,56 @@
+from ai_agent import diagnosis_eval
+from ai_agent.diagnosis import summarize_incident
+
+TRACE = (
+    "Traceback (most recent call last):\n"
+    '  File "/app/services/orders.py", line 42, in charge_order\n'
+    "    total = order['amount'] * rate\n"
+    "KeyError: 'amount'"
+)
+INGEST_FRAMES = [{"path": "services/orders.py", "line": 42, "function": None, "lang": None}]
+
+
+def _logs(messages):
+    return [{"level": "ERROR", "timestamp": f"2024-05-01T10:00:{n:02d}", "message": m} for n, m in enumerate(messages)]
+
+
+def test_exception_with_ingest_frame_is_not_confident():
+    # every incident gets frames at ingest; they are not a raise site
+    summary = summarize_incident({"frames": INGEST_FRAMES}, _logs(["KeyError: 'amount'"] * 10))
+
+    assert summary["frame"]["path"] == "services/orders.py"
+    assert "traceback" not in summary["evidence"]
+    assert not summary["confident"]
+    assert summary["root_cause"] is None
+
+
+def test_rare_traceback_in_unrelated_noise_is_not_confident():
+    noise = ["cache miss storm", "connection reset by peer", "queue lag on orders", "user session expired"]
+    logs = _logs([TRACE] + noise * 5)
+
+    summary = summarize_incident({"frames": INGEST_FRAMES}, logs)
+
+    assert summary["evidence"] == ["exception", "traceback"]
+    assert not summary["confident"]
+
+
+def test_dominant_exception_with_traceback_names_the_raise_site():
+    summary = summarize_incident({}, _logs([TRACE] * 8 + ["retrying order"] * 2))
+
+    assert summary["confident"]
+    assert summary["confidence"] == 1.0
+    assert summary["root_cause"] == "KeyError: 'amount' in charge_order (/app/services/orders.py:42)"
+
+
+def test_sweep_labels_answers_by_the_confirmed_fix_file():
+    right = {"incident": {"resolved_by": "services/orders.py"}, "logs": _logs([TRACE] * 8)}
+    wrong = {"incident": {"resolved_by": "services/billing.py"}, "logs": _logs([TRACE] * 8)}
+    unlabelled = {"incident": {}, "logs": _logs([TRACE] * 8)}
+    corpus = [right, wrong, unlabelled]
+    summaries = [summarize_incident(r["incident"], r["logs"]) for r in corpus]
+
+    rows = diagnosis_eval.sweep(corpus, summaries)
+
+    assert rows == [{"threshold": 1.0, "answered": 3, "labelled": 2, "precision": 0.5}]
+    assert diagnosis_eval.recommend(rows, 0.5, 2) == 1.0
+    assert diagnosis_eval.recommend(rows, 0.5, 3) is None
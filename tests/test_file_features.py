@@ -0,0 +1,43 @@
+import threading
+
+from ai_agent.file_features import FileFeatureIndex
+from ai_agent.ranking_bench import synthetic_logs, synthetic_structure
+
+
+def test_extra_boost_is_keyed_by_path():
+    features = FileFeatureIndex([
+        {"path": "services/orders/api.py", "size": 100},
+        {"path": "README.md", "size": 100},
+    ])
+    ranked = features.rank([], None, 1, extra={"README.md": 500, "missing.py": 900})
+    assert ranked[0]["path"] == "README.md"
+
+
+def test_ranking_while_deltas_apply():
+    files = synthetic_structure(5000)
+    logs = synthetic_logs(files)
+    features = FileFeatureIndex(files)
+    errors = []
+    stop = threading.Event()
+
+    def apply_deltas():
+        n = 0
+        while not stop.is_set():
+            added = [{"path": f"services/new_{n}_{k}.py", "size": 10} for k in range(50)]
+            removed = [f["path"] for f in files[n * 10:(n + 1) * 10]]
+            features.apply_delta(added, [], removed)
+            n += 1
+
+    writer = threading.Thread(target=apply_deltas)
+    writer.start()
+    try:
+        for _ in range(200):
+            try:
+                features.rank(logs, "orders", 5)
+            except Exception as e:
+                errors.append(e)
+    finally:
+        stop.set()
+        writer.join()
+
+    assert errors == []
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from ai_agent import llm
+from ai_agent.llm_stub import StubMessage
+
+CONTENT = "def charge(order):\n    total = order['amount']\n    return total\n"
+
+BAD = (
+    "EXPLANATION: use get\nPATCH:\n<<<<<<< SEARCH\n    total = order['amt']\n"
+    "=======\n    total = order.get('amount', 0)\n>>>>>>> REPLACE\n"
+)
+GOOD = (
+    "EXPLANATION: use get\nPATCH:\n<<<<<<< SEARCH\n    total = order['amount']\n"
+    "=======\n    total = order.get('amount', 0)\n>>>>>>> REPLACE\n"
+)
+
+
+class ScriptedModel:
+    """Answers from a list, in order; records the prompts."""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.prompts = []
+
+    def _next(self, prompt):
+        self.prompts.append(prompt)
+        return StubMessage(self.answers.pop(0))
+
+    def invoke(self, prompt, **params):
+        return self._next(prompt)
+
+    async def ainvoke(self, prompt, **params):
+        return self._next(prompt)
+
+    async def astream(self, prompt, **params):
+        text = self._next(prompt).content
+        for i in range(0, len(text), 7):
+            yield StubMessage(text[i:i + 7])
+
+
+@pytest.fixture
+def model(monkeypatch):
+    def use(answers):
+        scripted = ScriptedModel(answers)
+        monkeypatch.setattr(llm, "get_llm", lambda: scripted)
+        monkeypatch.setattr(llm, "get_llm_cache", lambda: None)
+        monkeypatch.setattr(llm, "LLM_FIX_MODE", "patch")
+        return scripted
+    return use
+
+
+INCIDENT = {"_id": "i1", "message": "KeyError: 'amount'"}
+LOGS = [{"level": "ERROR", "message": "KeyError: 'amount'"}]
+
+
+def test_failed_hunk_is_sent_back_instead_of_regenerating_the_file(model):
+    scripted = model([BAD, GOOD])
+
+    fixed, explanation = llm.suggest_fix_for_incident_file(INCIDENT, LOGS, "a.py", CONTENT)
+
+    assert "order.get('amount', 0)" in fixed
+    assert explanation == "use get"
+    assert len(scripted.prompts) == 2
+    assert "hunk 1 of 1" in scripted.prompts[1] and "UPDATED_FILE" not in scripted.prompts[1]
+
+
+def test_stream_retries_with_corrected_hunks(model):
+    scripted = model([BAD, GOOD])
+
+    async def collect():
+        return [piece async for piece in llm.astream_fix_for_incident_file(INCIDENT, LOGS, "a.py", CONTENT)]
+
+    pieces = asyncio.run(collect())
+
+    assert [name for name, _ in pieces].count("retry") == 1
+    assert "corrected hunks" in next(text for name, text in pieces if name == "retry")
+    assert "order.get('amount', 0)" in pieces[-1][1][0]
+    assert len(scripted.prompts) == 2
+
+
+def test_whole_file_answer_after_repairs_fail(model):
+    scripted = model([BAD, BAD, "EXPLANATION: x\nUPDATED_FILE:\nfixed = True\n"])
+
+    fixed, _ = llm.suggest_fix_for_incident_file(INCIDENT, LOGS, "a.py", CONTENT)
+
+    assert fixed == "fixed = True"
+    assert len(scripted.prompts) == 3
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from ai_agent.llm import FixResponseStream, _parse_fix_response, _parse_patch_response
+
+CONTENT = "def f():\n    return 1\n"
+
+ANSWERS = [
+    "EXPLANATION:\nThe key is missing.\n\nUPDATED_FILE:\ndef f():\n    return 2\n",
+    "Sure, here you go.\nEXPLANATION: guard the key\nUPDATED_FILE:\ndef f(): pass\n",
+    "I cannot fix this from the logs alone; the file looks correct.",
+    "x" * 300 + "\nEXPLANATION: late marker\nUPDATED_FILE:\ncode\n",
+    "UPDATED_FILE:\ncode only\n",
+    "EXPLANATION:\n" + "long reasoning " * 40 + "\nUPDATED_FILE:\ncode\n",
+]
+
+
+def _stream(answer: str, chunks: int, seed: int, marker="UPDATED_FILE:", section="updated_file"):
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(answer)), min(chunks, len(answer) - 1)))
+    parser = FixResponseStream(marker, section)
+    pieces = []
+    for a, b in zip([0] + cuts, cuts + [len(answer)]):
+        pieces += parser.feed(answer[a:b])
+    pieces += parser.close()
+    explanation = "".join(t for name, t in pieces if name == "explanation")
+    body = "".join(t for name, t in pieces if name == section)
+    return explanation.strip(), body
+
+
+@pytest.mark.parametrize("answer", ANSWERS)
+def test_streamed_explanation_matches_final_result(answer):
+    fixed, explanation = _parse_fix_response(answer, CONTENT)
+    for seed in range(20):
+        streamed, body = _stream(answer, chunks=1 + seed * 3, seed=seed)
+        assert streamed == explanation
+        if "UPDATED_FILE:" in answer:
+            assert body.strip() == fixed
+
+
+def test_answer_without_markers_is_the_explanation():
+    answer = ANSWERS[2]
+    assert _parse_fix_response(answer, CONTENT) == (CONTENT, answer)
+
+
+def test_long_preamble_is_kept():
+    fixed, explanation = _parse_fix_response(ANSWERS[3], CONTENT)
+    assert explanation.startswith("x" * 300) and "late marker" in explanation
+    assert fixed == "code"
+
+
+def test_patch_streams_match_too():
+    answer = "EXPLANATION: swap it\nPATCH:\n<<<<<<< SEARCH\na\n=======\nb\n>>>>>>> REPLACE\n"
+    patch, explanation = _parse_patch_response(answer)
+    streamed, body = _stream(answer, chunks=9, seed=3, marker="PATCH:", section="patch")
+    assert streamed == explanation == "swap it"
+    assert body.strip() == patch.strip()
@@ -0,0 +1,40 @@
+from itertools import count
+
+from ai_agent.grader import grade_log_stats
+from ai_agent.log_stats import hll_count, hll_position, hll_sketch, new_message_hashes, stats_summary
+
+
+def _colliding_messages():
+    """Two different messages the sketch counts as one."""
+    first = "timeout after 0ms"
+    for n in count(1):
+        other = f"timeout after {n}ms"
+        if hll_position(other)[0] == hll_position(first)[0]:
+            return first, other
+
+
+def _stats(messages, exact=True):
+    doc = {"total": 40, "errors": 40, "message_sketch": hll_sketch(messages)}
+    if exact:
+        doc["message_hashes"] = new_message_hashes(None, messages)
+    return stats_summary(doc)
+
+
+def test_messages_sharing_a_register_are_not_read_as_identical():
+    messages = list(_colliding_messages()) * 20
+    assert hll_count(hll_sketch(messages)) == 1
+
+    assert _stats(messages)["distinct_messages"] == 2
+    assert grade_log_stats(_stats(messages))
+
+
+def test_identical_messages_are_rejected():
+    assert _stats(["timeout"] * 40)["distinct_messages"] == 1
+    assert not grade_log_stats(_stats(["timeout"] * 40))
+
+
+def test_small_estimate_without_exact_hashes_is_left_to_grade_logs():
+    stats = _stats(["timeout"] * 40, exact=False)
+
+    assert stats["distinct_messages"] is None
+    assert grade_log_stats(stats)
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from api_gateway import job_queue, job_worker
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    """
+    Jobs from a list; finish_job calls recorded (`finish_errors`:
+    job id -> how many finish_job calls fail like a Mongo outage).
+    """
+    state = {"jobs": [], "finished": [], "finish_errors": {}, "beats": []}
+
+    def claim_job(worker_id):
+        return state["jobs"].pop(0) if state["jobs"] else None
+
+    def finish_job(job_id, worker_id, status, result=None, error=None):
+        if state["finish_errors"].get(job_id):
+            state["finish_errors"][job_id] -= 1
+            raise RuntimeError("mongo unavailable")
+        state["finished"].append((job_id, status, error))
+
+    def heartbeat(job_id, worker_id):
+        return state["beats"].pop(0) if state["beats"] else True
+
+    monkeypatch.setattr(job_worker, "claim_job", claim_job)
+    monkeypatch.setattr(job_worker, "finish_job", finish_job)
+    monkeypatch.setattr(job_worker, "heartbeat", heartbeat)
+    monkeypatch.setattr(job_worker, "JOB_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(job_worker, "JOB_HEARTBEAT_SECONDS", 0.02)
+    return state
+
+
+def _run_slot(seconds):
+    async def main():
+        slot = asyncio.create_task(job_worker._slot("w1"))
+        await asyncio.sleep(seconds)
+        assert not slot.done()   # still serving
+        slot.cancel()
+
+    asyncio.run(main())
+
+
+def _job(n, kind="diagnose"):
+    return {"_id": n, "kind": kind, "user_id": "u1", "params": {}}
+
+
+def test_slot_survives_unknown_kinds_and_mongo_errors(worker, monkeypatch):
+    async def ok(params, user):
+        return {"ok": True}
+
+    monkeypatch.setitem(job_worker._RUNNERS, "diagnose", ok)
+    worker["jobs"] = [_job(1, kind="retired"), _job(2), _job(3)]
+    worker["finish_errors"] = {2: 2}   # job 2: DONE and the FAILED fallback both fail
+
+    _run_slot(0.2)
+
+    assert worker["finished"][0][:2] == (1, job_worker.FAILED)
+    assert "retired" in worker["finished"][0][2]["detail"]
+    assert worker["finished"][1][:2] == (3, job_worker.DONE)
+
+
+def test_lost_heartbeat_waits_for_the_cancelled_job(worker, monkeypatch):
+    unwound = []
+
+    async def slow(params, user):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            await asyncio.sleep(0.01)   # cleanup
+            unwound.append(True)
+            raise
+
+    monkeypatch.setitem(job_worker._RUNNERS, "diagnose", slow)
+    worker["jobs"] = [_job(1)]
+    worker["beats"] = [False]
+
+    _run_slot(0.2)
+
+    assert unwound == [True]
+    assert worker["finished"] == [(1, job_worker.CANCELLED, None)]
+
+
+class _AlwaysBusyJobs:
+    """An identical job that always finishes between insert and lookup."""
+
+    def __init__(self):
+        self.inserts = 0
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def insert_one(self, job):
+        self.inserts += 1
+        raise DuplicateKeyError("active_key")
+
+    def find_one(self, query):
+        return None
+
+
+def test_submit_gives_up_after_bounded_retries(monkeypatch):
+    class DB:
+        jobs = _AlwaysBusyJobs()
+
+    monkeypatch.setattr(job_queue, "db", DB)
+    monkeypatch.setattr(job_queue, "_indexes_ready", False)
+
+    with pytest.raises(HTTPException) as exc:
+        job_queue.submit_job("diagnose", "p1", "u1", {"incident_id": "i1"})
+
+    assert exc.value.status_code == 503
+    assert DB.jobs.inserts == job_queue._SUBMIT_ATTEMPTS
@@ -0,0 +1,46 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+from ai_agent.llm_cache import LLMCache
+
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    LLMCache(path=path).set("k", "answer")
+
+    assert asyncio.run(LLMCache(path=path).aget("k")) == "answer"
+
+
+def test_async_writes_do_not_block_the_loop_on_a_locked_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = LLMCache(path=path)
+    cache.get("warm-up")   # creates the tables
+
+    # another worker holds the write lock for a while
+    other = sqlite3.connect(path, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.5, other.rollback).start()
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        start = time.monotonic()
+        await cache.aset("k", "answer")
+        elapsed = time.monotonic() - start
+        task.cancel()
+        return ticks, elapsed, await cache.aget("k")
+
+    ticks, elapsed, text = asyncio.run(main())
+
+    assert elapsed >= 0.4          # the write did wait for the lock...
+    assert ticks >= 20             # ...without stalling the loop
+    assert text == "answer"
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+
+from ai_agent.llm_limits import ConcurrencyLimiter
+
+
+def test_limit_holds_across_event_loops():
+    limiter = ConcurrencyLimiter(3)
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    async def call():
+        nonlocal active, peak
+        await limiter.acquire()
+        try:
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            with lock:
+                active -= 1
+        finally:
+            limiter.release()
+
+    async def loop_body():
+        await asyncio.gather(*(call() for _ in range(20)))
+
+    # e.g. the API loop, the job worker and pre-diagnosis threads
+    threads = [threading.Thread(target=asyncio.run, args=(loop_body(),)) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert peak == 3
+    assert limiter.in_use == 0
+
+
+def test_cancelled_and_timed_out_waiters_do_not_leak_slots():
+    limiter = ConcurrencyLimiter(1)
+
+    async def main():
+        await limiter.acquire()
+
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+
+        timed_out = False
+        try:
+            await asyncio.wait_for(limiter.acquire(), timeout=0.01)
+        except asyncio.TimeoutError:
+            timed_out = True
+
+        limiter.release()
+        await asyncio.wait_for(limiter.acquire(), timeout=1)   # slot is free again
+        limiter.release()
+        return timed_out
+
+    assert asyncio.run(main())
+    assert limiter.in_use == 0
+
+
+def test_release_from_another_thread_wakes_the_waiter():
+    limiter = ConcurrencyLimiter(1)
+    holder_ready = threading.Event()
+
+    def holder():
+        asyncio.run(limiter.acquire())
+        holder_ready.set()
+        time.sleep(0.05)
+        limiter.release()
+
+    threading.Thread(target=holder).start()
+    holder_ready.wait()
+
+    async def main():
+        start = time.monotonic()
+        await asyncio.wait_for(limiter.acquire(), timeout=1)
+        limiter.release()
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) >= 0.03
@@ -0,0 +1,107 @@
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from ai_agent.log_stats import hll_sketch, stats_summary
+from api_gateway import logs
+
+
+class CountingDB:
+    """mongomock database that counts collection calls (round-trips)."""
+
+    def __init__(self, db):
+        self._db = db
+        self.calls = []
+
+    def __getattr__(self, name):
+        return CountingCollection(self, getattr(self._db, name))
+
+
+class CountingCollection:
+    def __init__(self, owner, collection):
+        self._owner = owner
+        self._collection = collection
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        def call(*args, **kwargs):
+            self._owner.calls.append((self._collection.name, name))
+            return method(*args, **kwargs)
+        return call
+
+
+@pytest.fixture
+def db(monkeypatch):
+    raw = mongomock.MongoClient().radar
+    project_id = raw.projects.insert_one({"project_secret": "s"}).inserted_id
+    counting = CountingDB(raw)
+    monkeypatch.setattr(logs, "db", counting)
+    monkeypatch.setattr(logs, "_stats_index_ready", False)
+    return raw, counting, str(project_id)
+
+
+def _batch(project_id, entries):
+    return logs.LogBatchRequest(
+        project_id=project_id,
+        project_secret="s",
+        logs=[logs.LogBatchEntry(**entry) for entry in entries],
+    )
+
+
+def test_batch_writes_once_per_service_and_fingerprint(db):
+    raw, counting, project_id = db
+    entries = (
+        [{"service": "api", "level": "ERROR", "message": f"timeout after {n}ms"} for n in range(50)]
+        + [{"service": "api", "level": "INFO", "message": f"request {n} ok"} for n in range(40)]
+        + [{"service": "worker", "level": "INFO", "message": "tick"} for _ in range(10)]
+    )
+
+    logs.ingest_log_batch(_batch(project_id, entries))
+
+    writes = [call for call in counting.calls if call[0] != "projects"]
+    assert len(writes) <= 8   # was 3-5 per line
+    assert raw.logs.count_documents({}) == 100
+
+    incident = raw.incidents.find_one()
+    assert raw.incidents.count_documents({}) == 1
+    assert incident["count"] == 50
+    assert incident["message_sketch"] == hll_sketch(e["message"] for e in entries[:50])
+    assert raw.logs.count_documents({"incident_id": incident["_id"]}) == 50
+
+    api = raw.log_stats.find_one({"service": "api"})
+    assert (api["total"], api["errors"]) == (90, 50)
+    assert api["message_sketch"] == hll_sketch(e["message"] for e in entries[:90])
+
+
+def test_later_batches_merge_into_existing_totals(db):
+    raw, _, project_id = db
+    first = [{"service": "api", "level": "ERROR", "message": f"timeout after {n}ms"} for n in range(5)]
+    second = [{"service": "api", "level": "ERROR", "message": f"timeout after {n}ms"} for n in range(3, 10)]
+
+    logs.ingest_log_batch(_batch(project_id, first))
+    logs.ingest_log_batch(_batch(project_id, second))
+
+    incident = raw.incidents.find_one()
+    assert incident["count"] == 12
+    assert incident["message_sketch"] == hll_sketch(e["message"] for e in first + second)
+
+    api = raw.log_stats.find_one({"service": "api"})
+    assert (api["total"], api["errors"]) == (12, 12)
+    assert api["message_sketch"] == incident["message_sketch"]
+
+
+def test_exact_message_hashes_stop_growing_once_two_are_known(db):
+    raw, counting, project_id = db
+    same = [{"service": "api", "level": "ERROR", "message": "timeout"} for _ in range(5)]
+
+    logs.ingest_log_batch(_batch(project_id, same))
+    logs.ingest_log_batch(_batch(project_id, same))
+    assert stats_summary(raw.log_stats.find_one())["distinct_messages"] == 1
+
+    logs.ingest_log_batch(_batch(project_id, [{**e, "message": f"timeout {n}"} for n, e in enumerate(same)]))
+    counting.calls.clear()
+    logs.ingest_log_batch(_batch(project_id, [{**e, "message": "refused"} for e in same]))
+
+    assert len(raw.log_stats.find_one()["message_hashes"]) == 2
+    assert counting.calls.count(("log_stats", "update_one")) == 1   # the sketch only
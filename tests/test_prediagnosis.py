@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from api_gateway import prediagnosis
+
+LOGS = [{"level": "ERROR", "timestamp": "t", "message": f"upstream timed out after {n}ms"} for n in range(20)]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient().radar
+    monkeypatch.setattr(prediagnosis, "db", db)
+    return db
+
+
+def _incident(db, count=3):
+    doc = {"project_id": "p1", "status": "ACTIVE", "count": count, "message": "timed out", "service": "api"}
+    doc["_id"] = db.incidents.insert_one(doc).inserted_id
+    return doc
+
+
+def test_only_one_worker_holds_the_lease(db, monkeypatch):
+    assert prediagnosis.hold_lease()
+    monkeypatch.setattr(prediagnosis, "_OWNER", "another-worker")
+    assert not prediagnosis.hold_lease()
+
+    db.leases.update_one({"_id": "prediagnosis"}, {"$set": {"expires_at": datetime(2000, 1, 1)}})
+    assert prediagnosis.hold_lease()
+
+
+def test_skipped_incidents_are_not_refetched_until_they_change(db, monkeypatch):
+    fetches = []
+    monkeypatch.setattr(prediagnosis, "retrieve_incident_logs", lambda p, i: fetches.append(i) or [])
+    incident = _incident(db)
+
+    asyncio.run(prediagnosis.prediagnose_once())
+    asyncio.run(prediagnosis.prediagnose_once())
+    assert len(fetches) == 1
+    assert db.incidents.find_one({"_id": incident["_id"]})["prediagnosis"]["skipped"] == "no_logs"
+
+    db.incidents.update_one({"_id": incident["_id"]}, {"$inc": {"count": 1}})
+    asyncio.run(prediagnosis.prediagnose_once())
+    assert len(fetches) == 2
+
+
+def test_diagnosis_goes_through_the_async_llm_path(db, monkeypatch):
+    calls = []
+
+    async def fake_ainvoke(prompt, project_id=None, deadline=None, **kw):
+        calls.append((project_id, deadline))
+        return " diagnosis "
+
+    monkeypatch.setattr(prediagnosis, "retrieve_incident_logs", lambda p, i: LOGS)
+    monkeypatch.setattr(prediagnosis, "_ainvoke", fake_ainvoke)
+    incident = _incident(db)
+
+    asyncio.run(prediagnosis.prediagnose_once())
+
+    stored = db.incidents.find_one({"_id": incident["_id"]})["prediagnosis"]
+    assert stored["text"] == "diagnosis"
+    assert calls == [(None, prediagnosis.PREDIAGNOSIS_DEADLINE_SECONDS)]
@@ -0,0 +1,23 @@
+from ai_agent.prompt_builder import apply_window_edits
+
+CRLF_FILE = "a\r\nb\r\nc\r\nd\r\ne"
+
+
+def test_window_edits_keep_crlf_and_missing_final_newline():
+    updated = "@@ lines 2-3 @@\nB\nC2\nextra\n@@ lines 5-5 @@\nE\n"
+
+    result = apply_window_edits(CRLF_FILE, updated, [(2, 3), (5, 5)])
+
+    assert result == "a\r\nB\r\nC2\r\nextra\r\nd\r\nE"
+
+
+def test_empty_window_body_leaves_the_window_unchanged():
+    updated = "@@ lines 1-2 @@\n\n@@ lines 4-5 @@\nD\nE\n"
+
+    result = apply_window_edits(CRLF_FILE, updated, [(1, 2), (4, 5)])
+
+    assert result == "a\r\nb\r\nc\r\nD\r\nE"
+
+
+def test_unknown_window_is_rejected():
+    assert apply_window_edits("a\nb\n", "@@ lines 1-9 @@\nx\n", [(1, 2)]) is None
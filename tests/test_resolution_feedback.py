@@ -0,0 +1,40 @@
+import threading
+
+from api_gateway.resolution_feedback import FeedbackTable
+
+INCIDENT = {"service": "orders", "message": "payment gateway timeout charging order"}
+
+
+def test_scores_while_resolutions_are_recorded():
+    table = FeedbackTable()
+    errors = []
+
+    def record():
+        # new files for the incident's keys grow the dicts scores() walks
+        for n in range(5000):
+            table.add("payment", f"services/file_{n}.py", resolved=1)
+            table.add("service:orders", f"services/file_{n}.py", attempted=1)
+
+    writer = threading.Thread(target=record)
+    writer.start()
+    while writer.is_alive():
+        try:
+            table.scores(INCIDENT)
+        except Exception as e:
+            errors.append(e)
+    writer.join()
+
+    assert errors == []
+
+
+def test_resolved_files_move_up_and_attempted_ones_down():
+    table = FeedbackTable([
+        {"key": "payment", "file": "pay.py", "resolved": 3},
+        {"key": "gateway", "file": "pay.py", "resolved": 3},
+    ])
+
+    scores = table.scores({**INCIDENT, "attempted_files": ["old.py"]})
+
+    assert scores["pay.py"] > 0
+    assert scores["old.py"] < 0
+    assert table.version == 6
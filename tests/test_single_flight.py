@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ai_agent import llm, single_flight
+from ai_agent.llm_limits import LLMDeadlineExceeded
+from api_gateway import agent_state
+from api_gateway.agent_state import LLM_CLAIM, LLM_RESULT, MemoryStateStore
+
+KEY = "k" * 64
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemoryStateStore(ttls={})
+    monkeypatch.setattr(agent_state, "_store", store)
+    # waiters must be woken by the notification, not the safety poll
+    monkeypatch.setattr(single_flight, "SHARED_POLL_SECONDS", 10)
+    return store
+
+
+def _other_worker_finishes(store, text, delay=0.05):
+    def finish():
+        time.sleep(delay)
+        if text is not None:
+            store.set(LLM_RESULT, KEY, {"text": text})
+        store.release(LLM_CLAIM, KEY, "other-worker")
+        store.notify(LLM_CLAIM, KEY)
+    threading.Thread(target=finish).start()
+
+
+def _wait_with_ticker():
+    """
+    (aclaim_or_wait result, seconds, ticks of a task sharing the loop).
+    """
+    async def main():
+        ticks = 0
+        done = False
+
+        async def ticker():
+            nonlocal ticks
+            while not done:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        task = asyncio.create_task(ticker())
+        start = time.monotonic()
+        text = await single_flight.aclaim_or_wait(KEY, 5, time.monotonic() + 5)
+        elapsed = time.monotonic() - start
+        done = True
+        await task
+        return text, elapsed, ticks
+
+    return asyncio.run(main())
+
+
+def test_waiter_takes_the_answer_published_by_the_claim_holder(store):
+    assert store.claim(LLM_CLAIM, KEY, "other-worker", 5)
+    _other_worker_finishes(store, "the answer")
+
+    text, elapsed, ticks = _wait_with_ticker()
+
+    assert text == "the answer"
+    assert elapsed < 1
+    assert ticks >= 5   # the loop kept running while it waited
+
+
+def test_failed_holder_hands_the_claim_to_a_waiter(store):
+    assert store.claim(LLM_CLAIM, KEY, "other-worker", 5)
+    _other_worker_finishes(store, None)
+
+    assert single_flight.claim_or_wait(KEY, 5, time.monotonic() + 5) is None
+    assert not store.claim(LLM_CLAIM, KEY, "third-worker", 5)
+
+    single_flight.release(KEY, "mine")
+    assert store.get(LLM_RESULT, KEY) == {"text": "mine"}
+    assert store.claim(LLM_CLAIM, KEY, "third-worker", 5)
+
+
+def test_shared_wait_stops_at_the_deadline(store):
+    assert store.claim(LLM_CLAIM, KEY, "other-worker", 5)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(single_flight.aclaim_or_wait(KEY, 5, time.monotonic() + 0.05))
+    assert single_flight._WAITERS == {}
+
+
+def test_local_follower_stops_at_the_call_deadline(monkeypatch):
+    monkeypatch.setattr(llm, "get_llm_cache", lambda: None)
+    monkeypatch.setattr(llm, "LLM_CALL_DEADLINE_SECONDS", 0.05)
+    prompt = "same prompt"
+    key = llm._cache_target(prompt, True, None)[1]
+    flight, leader = single_flight.join(key)   # a leader that never lands
+    assert leader
+
+    try:
+        start = time.monotonic()
+        with pytest.raises(LLMDeadlineExceeded):
+            llm._invoke(prompt)
+        assert time.monotonic() - start < 1
+    finally:
+        single_flight.land(key, flight, "late")
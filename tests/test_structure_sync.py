@@ -0,0 +1,34 @@
+import pytest
+from fastapi import HTTPException
+
+from api_gateway import structure_sync
+
+
+@pytest.mark.parametrize("body", [
+    {"removed": [["a.py"]]},
+    {"removed": [{"path": "a.py"}]},
+    {"removed": "a.py"},
+    {"added": ["b.py"]},
+    {"modified": {"path": "a.py"}},
+])
+def test_malformed_delta_is_rejected_before_touching_the_structure(body):
+    base = structure_sync.apply_full_structure("p1", [{"path": "a.py"}])["version"]
+
+    with pytest.raises(HTTPException) as exc:
+        structure_sync.handle_structure_payload("p1", {"mode": "delta", "base_version": base, **body})
+
+    assert exc.value.status_code == 400
+    assert structure_sync.get_structure_version("p1") == base
+
+
+def test_delta_against_the_current_version_applies():
+    base = structure_sync.apply_full_structure("p2", [{"path": "a.py"}])["version"]
+
+    applied = structure_sync.handle_structure_payload(
+        "p2", {"mode": "delta", "base_version": base, "added": [{"path": "b.py"}], "removed": ["a.py"]},
+    )
+    stale = structure_sync.handle_structure_payload("p2", {"mode": "delta", "base_version": base})
+
+    assert applied["status"] == "structure_updated" and applied["count"] == 1
+    assert applied["version"] > base
+    assert stale == {"status": "resync_required", "version": applied["version"]}
@@ -0,0 +1,40 @@
+import threading
+
+from ai_agent.symbols import SymbolIndex
+
+
+def _file(n):
+    # each symbol is defined in up to 4 files, so match() walks the sets
+    return {"path": f"services/mod_{n}.py", "symbols": [f"handler_{n // 4}", f"helper_{n // 4}"]}
+
+
+def test_match_while_deltas_apply():
+    index = SymbolIndex(_file(n) for n in range(4000))
+    names = [f"handler_{k}" for k in range(1000)] + [f"helper_{k}" for k in range(1000)]
+    errors = []
+    stop = threading.Event()
+
+    def apply_deltas():
+        n = 0
+        while not stop.is_set():
+            removed = [f"services/mod_{(n * 8 + k) % 4000}.py" for k in range(8)]
+            added = [_file((n * 8 + k) % 4000) for k in range(8)]
+            index.apply_delta([], [], removed)
+            index.apply_delta(added, [], [])
+            n += 1
+
+    writer = threading.Thread(target=apply_deltas)
+    writer.start()
+    try:
+        for _ in range(200):
+            try:
+                index.match(names)
+                index.lookup("handler_1")
+            except Exception as e:
+                errors.append(e)
+    finally:
+        stop.set()
+        writer.join()
+
+    assert errors == []
+    assert index.lookup("handler_0") == [f"services/mod_{n}.py" for n in range(4)]
@@ -0,0 +1,70 @@
+import gzip
+
+import pytest
+from fastapi import HTTPException
+
+from api_gateway import agent_state
+from api_gateway.uploads import _Decoder, append_chunk, finish_upload, get_upload, start_upload
+
+SOURCE = b"def handler(event):\n    return event['id']\n" * 2000
+
+
+def _decode(encoding: str, body: bytes, limit: int, chunk: int = 1024) -> bytes:
+    decoder = _Decoder(encoding, limit)
+    parts = [decoder.feed(body[i:i + chunk]) for i in range(0, len(body), chunk)]
+    parts.append(decoder.finish())
+    return b"".join(parts)
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_round_trip_within_limit(encoding):
+    if encoding == "zstd":
+        zstandard = pytest.importorskip("zstandard")
+        body = zstandard.ZstdCompressor().compress(SOURCE)
+    else:
+        body = gzip.compress(SOURCE)
+
+    assert _decode(encoding, body, len(SOURCE)) == SOURCE
+
+    with pytest.raises(HTTPException) as exc:
+        _decode(encoding, body, len(SOURCE) - 1)
+    assert exc.value.status_code == 413
+
+
+def test_zstd_bomb_is_rejected_without_expanding():
+    zstandard = pytest.importorskip("zstandard")
+    bomb = zstandard.ZstdCompressor().compress(b"\0" * (64 * 1024 * 1024))
+
+    decoder = _Decoder("zstd", 512 * 1024)
+    with pytest.raises(HTTPException) as exc:
+        for i in range(0, len(bomb), 4096):
+            decoder.feed(bomb[i:i + 4096])
+        decoder.finish()
+    assert exc.value.status_code == 413
+
+
+# ============================================================
+# 📦 CHUNKED UPLOADS
+# ============================================================
+
+@pytest.fixture
+def store(monkeypatch):
+    store = agent_state.MemoryStateStore(ttls={})
+    monkeypatch.setattr(agent_state, "_store", store)
+    return store
+
+
+def test_racing_chunks_at_the_same_offset_are_written_once(store):
+    data = b"print('hi')\n" * 10
+    upload = start_upload("p1", "app.py", len(data) * 2, None, 1 << 20)
+    # the original PUT and its retry both read the upload at offset 0
+    snapshot = get_upload(upload["upload_id"], "p1")
+
+    append_chunk(snapshot, 0, data)
+    with pytest.raises(HTTPException) as exc:
+        append_chunk(snapshot, 0, data)
+    assert exc.value.status_code == 409
+
+    upload = append_chunk(get_upload(upload["upload_id"], "p1"), len(data), data)
+    assert upload["received"] == upload["size"] and upload["chunks"] == 2
+    assert finish_upload(upload) == (data * 2).decode()
@@ -0,0 +1,32 @@
+import threading
+
+from ai_agent import verifier
+from ai_agent.verifier import grounding_index, verify_answer
+
+
+def test_index_cache_is_safe_across_threads():
+    windows = [[{"_id": f"{w}", "level": "ERROR", "message": f"timeout talking to shard{w}"}] for w in range(200)]
+    errors = []
+
+    def worker(offset):
+        try:
+            for n in range(400):
+                logs = windows[(n + offset) % len(windows)]
+                assert logs[0]["message"].split()[-1] in grounding_index(logs).tokens
+        except Exception as e:   # e.g. "OrderedDict mutated during iteration"
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(k * 37,)) for k in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(verifier._INDEX_CACHE) <= verifier._INDEX_CACHE_SIZE
+
+
+def test_answer_must_cite_an_error_log_token():
+    logs = [{"level": "ERROR", "message": "connection refused by orders-db"}]
+    assert verify_answer("orders-db refused the connection", logs)
+    assert not verify_answer("something broke", logs)